@@ -0,0 +1,138 @@
+# admission.py
+"""Admission control and load shedding for the query pipeline.
+
+Each stage (whole request, embedding, vector query, LLM) has a concurrency
+limit and a bounded wait queue. When a queue is full the caller is rejected
+immediately with 429, and when a queued caller waits longer than the stage
+allows it is rejected with 503. Both carry a Retry-After estimate, so overload
+degrades predictably instead of piling up until upstream timeouts fire.
+"""
+import asyncio
+import json
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Iterable
+
+
+class OverloadedError(Exception):
+    """Raised when a stage cannot admit more work."""
+
+    def __init__(self, stage: str, status_code: int, retry_after: int):
+        super().__init__(f"Stage '{stage}' overloaded")
+        self.stage = stage
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionStage:
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self._service_time = 0.5  # EWMA of seconds spent holding a slot
+        self._sem = asyncio.Semaphore(limit)
+
+    def retry_after(self) -> int:
+        backlog = self.waiting + 1
+        return max(1, math.ceil(self._service_time * backlog / max(1, self.limit)))
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.active >= self.limit and self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise OverloadedError(self.name, 429, self.retry_after())
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise OverloadedError(self.name, 503, self.retry_after()) from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._sem.release()
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_service_seconds": round(self._service_time, 4),
+        }
+
+
+class AdmissionController:
+    def __init__(self):
+        self.stages: Dict[str, AdmissionStage] = {}
+
+    def add_stage(self, name: str, limit: int, max_queue: int, max_wait: float) -> AdmissionStage:
+        stage = AdmissionStage(name, limit, max_queue, max_wait)
+        self.stages[name] = stage
+        return stage
+
+    def slot(self, name: str):
+        return self.stages[name].slot()
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+
+def overloaded_response_parts(error: OverloadedError):
+    body = {"detail": f"Server busy ({error.stage}); retry later", "stage": error.stage}
+    headers = {"Retry-After": str(error.retry_after)}
+    return error.status_code, body, headers
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that holds a request-stage slot for the whole response,
+    including streamed bodies, for paths under the given prefixes."""
+
+    def __init__(self, app, controller: AdmissionController, stage: str = "request", prefixes: Iterable[str] = ("/run",)):
+        self.app = app
+        self.controller = controller
+        self.stage = stage
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        try:
+            slot = self.controller.slot(self.stage)
+            await slot.__aenter__()
+        except OverloadedError as e:
+            status, body, headers = overloaded_response_parts(e)
+            payload = json.dumps(body).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode()),
+                    (b"retry-after", headers["Retry-After"].encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": payload})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await slot.__aexit__(None, None, None)
@@ -0,0 +1,185 @@
+# answer_cache.py
+"""Semantic answer cache for the /run pipeline.
+
+Answers are keyed on the (normalized) query embedding. A lookup returns the
+stored answer of the most similar cached query when its cosine similarity is
+above the configured threshold, so near-duplicate questions skip the vector
+query and the LLM call entirely. Entries carry the retrieval scope they were
+answered in, and a lookup only matches entries of its own scope.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """LRU + TTL answer cache with a cosine-similarity lookup.
+
+    Vectors live in a preallocated float32 matrix so a lookup is a single
+    matrix-vector product over the occupied slots. The matrix counts against
+    max_bytes: it gets at most half of the budget (fewer slots than max_entries
+    when the vectors are wide), and cached answers share the rest.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.97,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 5000,
+        max_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._occupied: Optional[np.ndarray] = None
+        # key -> slot, ordered from least to most recently used
+        self._lru: "OrderedDict[int, int]" = OrderedDict()
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._slot_keys: Dict[int, int] = {}
+        self._slot_scopes: Optional[np.ndarray] = None
+        self._scope_ids: Dict[str, int] = {"": 0}
+        self._free_slots: List[int] = []
+        self._next_key = 0
+        self._payload_bytes = 0
+
+    # --- internal helpers (callers hold the lock) ---
+    def _allocate(self, dim: int) -> None:
+        slots = max(1, min(self.max_entries, self.max_bytes // 2 // (dim * 4)))
+        self._dim = dim
+        self._matrix = np.zeros((slots, dim), dtype=np.float32)
+        self._occupied = np.zeros(slots, dtype=bool)
+        self._slot_scopes = np.zeros(slots, dtype=np.int32)
+        self._free_slots = list(range(slots - 1, -1, -1))
+
+    def _memory_bytes(self) -> int:
+        matrix_bytes = self._matrix.nbytes if self._matrix is not None else 0
+        return matrix_bytes + self._payload_bytes
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        slot = self._lru.pop(key)
+        del self._slot_keys[slot]
+        self._occupied[slot] = False
+        self._free_slots.append(slot)
+        self._payload_bytes -= entry["size"]
+
+    def _evict_lru(self) -> None:
+        key = next(iter(self._lru))
+        self._remove(key)
+        self.evictions += 1
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        if norm == 0.0:
+            return None
+        return vec / norm
+
+    # --- public API ---
+    def lookup(self, vector, scope: str = "") -> Optional[Dict[str, Any]]:
+        """Return the cached answer for the closest query above threshold within the same scope."""
+        query = self._normalize(vector)
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            if (query is None or scope_id is None or self._matrix is None or not self._entries
+                    or query.shape[0] != self._dim):
+                self.misses += 1
+                return None
+
+            scores = self._matrix @ query
+            scores[~self._occupied | (self._slot_scopes != scope_id)] = -1.0
+            slot = int(np.argmax(scores))
+            score = float(scores[slot])
+            if score < self.threshold:
+                self.misses += 1
+                return None
+
+            key = self._slot_keys[slot]
+            entry = self._entries[key]
+            if time.monotonic() - entry["stored_at"] > self.ttl_seconds:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return {**entry["answer"], "similarity": score}
+
+    def store(self, vector, answer: Dict[str, Any], scope: str = "") -> None:
+        """Cache an answer (decision/amount/justification) under a query vector and scope."""
+        query = self._normalize(vector)
+        if query is None:
+            return
+        size = len(json.dumps(answer, default=str))
+        with self._lock:
+            if self._dim is not None and query.shape[0] != self._dim:
+                print(f"⚠️ Answer cache dimension changed ({self._dim} -> {query.shape[0]}); clearing cache")
+                self._clear()
+            if self._matrix is None:
+                self._allocate(query.shape[0])
+
+            while self._entries and (
+                not self._free_slots
+                or self._memory_bytes() + size > self.max_bytes
+            ):
+                self._evict_lru()
+
+            slot = self._free_slots.pop()
+            self._matrix[slot] = query
+            self._occupied[slot] = True
+            self._slot_scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            key = self._next_key
+            self._next_key += 1
+            self._lru[key] = slot
+            self._slot_keys[slot] = key
+            self._entries[key] = {"answer": dict(answer), "stored_at": time.monotonic(), "size": size}
+            self._payload_bytes += size
+
+    def _clear(self) -> None:
+        self._dim = None
+        self._matrix = None
+        self._occupied = None
+        self._slot_scopes = None
+        self._scope_ids = {"": 0}
+        self._lru.clear()
+        self._entries.clear()
+        self._slot_keys.clear()
+        self._free_slots = []
+        self._payload_bytes = 0
+
+    def invalidate(self) -> int:
+        """Drop every cached answer, e.g. after the index content changed."""
+        with self._lock:
+            dropped = len(self._entries)
+            self._clear()
+            self.invalidations += 1
+            return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "memory_bytes": self._memory_bytes(),
+                "capacity": len(self._occupied) if self._occupied is not None else None,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+            }
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# benchmarks/cache_backend_benchmark.py
+"""Hit rate and latency of the cache backends (cache_backends.py) across worker counts.
+
+Simulates a multi-worker deployment: a Zipf-distributed key stream (a few hot
+queries, a long tail) is dealt round-robin to N worker processes, like a load
+balancer would. Each worker does get() and, on a miss, set() of an
+embedding-sized value. A per-process memory backend has to warm every worker
+separately; the shm and sqlite backends are shared, so the hit rate should
+not depend on the worker count:
+
+  python benchmarks/cache_backend_benchmark.py --workers 1 2 4 8 --requests 40000
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from cache_backends import BACKENDS, make_backend  # noqa: E402
+from metrics import percentiles  # noqa: E402
+
+
+def make_keys(requests: int, universe: int, zipf: float, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, universe + 1, dtype=np.float64)
+    weights = ranks ** -zipf
+    picks = rng.choice(universe, size=requests, p=weights / weights.sum())
+    return [f"query-{k}" for k in picks]
+
+
+def worker(kind: str, options: Dict[str, Any], keys: List[str], value_bytes: int, start, results) -> None:
+    backend = make_backend(kind, "bench", **options)
+    value = os.urandom(value_bytes)
+    gets: List[float] = []
+    sets: List[float] = []
+    start.wait()  # barrier: every worker has opened its backend
+    began = time.perf_counter()
+    for key in keys:
+        t = time.perf_counter()
+        hit = backend.get(key)
+        gets.append((time.perf_counter() - t) * 1e6)
+        if hit is None:
+            t = time.perf_counter()
+            backend.set(key, value)
+            sets.append((time.perf_counter() - t) * 1e6)
+    results.put({"gets": gets, "sets": sets, "hits": backend.hits, "seconds": time.perf_counter() - began})
+    backend.close()
+
+
+def run(kind: str, workers: int, keys: List[str], args, scratch: str) -> Dict[str, Any]:
+    run_dir = tempfile.mkdtemp(dir=scratch if kind == "shm" else None)  # every run starts cold; sqlite on disk
+    options = {
+        "max_items": args.max_items,
+        "value_bytes": args.value_bytes,
+        "shm_dir": run_dir if kind == "shm" else None,
+        "sqlite_dir": run_dir,
+    }
+    ctx = mp.get_context("spawn")
+    start = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=worker, args=(kind, options, keys[i::workers], args.value_bytes, start, results))
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    outputs = [results.get() for _ in procs]
+    elapsed = max(o["seconds"] for o in outputs)
+    for p in procs:
+        p.join()
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    gets = [v for o in outputs for v in o["gets"]]
+    sets = [v for o in outputs for v in o["sets"]]
+    hits = sum(o["hits"] for o in outputs)
+    return {
+        "backend": kind,
+        "workers": workers,
+        "hit_ratio": round(hits / len(keys), 4),
+        "throughput_ops": round(len(keys) / elapsed, 1),
+        "get_us": percentiles(gets),
+        "set_us": percentiles(sets),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cache backends across worker counts")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=40000)
+    parser.add_argument("--universe", type=int, default=20000, help="Distinct keys")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Key popularity skew")
+    parser.add_argument("--max-items", type=int, default=10000, help="Capacity per cache (per worker for memory)")
+    parser.add_argument("--value-bytes", type=int, default=1536 * 4, help="Value size (default: one float32 embedding)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this path")
+    args = parser.parse_args()
+
+    keys = make_keys(args.requests, args.universe, args.zipf, args.seed)
+    scratch = tempfile.mkdtemp(prefix="cache-bench-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    rows = []
+    try:
+        for kind in args.backends:
+            for workers in args.workers:
+                row = run(kind, workers, keys, args, scratch)
+                rows.append(row)
+                print(f"{kind:>6} x{workers}: hit {row['hit_ratio']:.3f}  get p50 {row['get_us']['p50']}us "
+                      f"p99 {row['get_us']['p99']}us  set p50 {row['set_us']['p50']}us  {row['throughput_ops']} ops/s")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {
+        "requests": args.requests,
+        "universe": args.universe,
+        "zipf": args.zipf,
+        "max_items": args.max_items,
+        "value_bytes": args.value_bytes,
+        "runs": rows,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
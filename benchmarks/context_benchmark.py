@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# benchmarks/context_benchmark.py
+"""Latency and token savings of the context budgeter (context_budget.py).
+
+Builds a synthetic policy document, chunks it exactly like ingestion does
+(overlapping character windows), "retrieves" the top_k chunks per query by
+term overlap and runs ContextBudgeter.assemble() on them. Reports the stage
+latency and the prompt tokens before and after budgeting, next to the old
+behaviour (raw top-3 joined):
+
+  python benchmarks/context_benchmark.py --top-k 6 --budget 600 --output context.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, Any, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from context_budget import ContextBudgeter, count_tokens, get_encoding, _terms  # noqa: E402
+from ingest import chunk_page, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP  # noqa: E402
+from metrics import percentiles  # noqa: E402
+from run_benchmark import make_queries  # noqa: E402
+
+TREATMENTS = ["knee surgery", "hip replacement", "cataract surgery", "dengue", "day care procedures",
+              "maternity", "dental treatment", "physiotherapy", "cancer treatment", "kidney dialysis"]
+SENTENCES = [
+    "{t} is covered up to INR {amount} per policy year after a waiting period of {months} months.",
+    "Claims for {t} require pre-authorisation from the insurer at least {days} days before admission.",
+    "A co-payment of {pct}% applies to {t} for insured persons above {age} years of age.",
+    "{t} performed in a network hospital in {city} is settled on a cashless basis.",
+    "Expenses for {t} arising from a pre-existing disease are excluded for the first {months} months.",
+    "Room rent during hospitalisation for {t} is capped at {pct}% of the sum insured per day.",
+    "The insured must submit discharge summaries and bills for {t} within {days} days of discharge.",
+]
+CITIES = ["Pune", "Mumbai", "Delhi", "Bengaluru", "Chennai", "Jaipur", "Kolkata", "Hyderabad"]
+
+
+def build_chunks(pages: int, seed: int, chunk_size: int, overlap: int) -> List[str]:
+    rng = random.Random(seed)
+    chunks: List[str] = []
+    carry = ""
+    for page in range(pages):
+        lines = []
+        for section in range(6):
+            treatment = rng.choice(TREATMENTS)
+            lines.append(f"Section {page + 1}.{section + 1} {treatment.title()}.")
+            for template in rng.sample(SENTENCES, 4):
+                lines.append(template.format(
+                    t=treatment.capitalize(), amount=rng.choice([25000, 50000, 100000, 200000]),
+                    months=rng.choice([12, 24, 36, 48]), days=rng.choice([3, 7, 15, 30]),
+                    pct=rng.choice([1, 2, 10, 20]), age=rng.choice([60, 65, 70]), city=rng.choice(CITIES),
+                ))
+        page_chunks, carry = chunk_page(" ".join(lines), carry, chunk_size, overlap)
+        chunks.extend(page_chunks)
+    return chunks
+
+
+def retrieve(query: str, chunks: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """Term-overlap stand-in for the vector query: top_k chunks with a similarity-like score."""
+    terms = _terms(query)
+    scored = [
+        {"text": c["text"], "score": len(terms & c["terms"]) / (len(terms) or 1)}
+        for c in chunks
+    ]
+    scored.sort(key=lambda m: m["score"], reverse=True)
+    return scored[:top_k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the context budgeter")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--top-k", type=int, default=6)
+    parser.add_argument("--budget", type=int, default=600, help="Context token budget")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this path")
+    args = parser.parse_args()
+
+    chunks = [{"text": t, "terms": _terms(t)} for t in build_chunks(args.pages, args.seed, args.chunk_size, args.overlap)]
+    queries = make_queries(args.queries, 1.0, args.seed)
+    budgeter = ContextBudgeter(max_tokens=args.budget)
+
+    latencies_ms: List[float] = []
+    baseline_tokens: List[float] = []
+    raw_tokens: List[float] = []
+    sent_tokens: List[float] = []
+    for query in queries:
+        matches = retrieve(query, chunks, args.top_k)
+        baseline_tokens.append(sum(count_tokens(m["text"]) for m in matches[:3]))
+        started = time.perf_counter()
+        context = budgeter.assemble(query, matches)
+        latencies_ms.append((time.perf_counter() - started) * 1000)
+        raw_tokens.append(context["input_tokens"])
+        sent_tokens.append(context["tokens"])
+
+    mean = lambda values: round(sum(values) / len(values), 1)  # noqa: E731
+    results = {
+        "tokenizer": "tiktoken o200k_base" if get_encoding() is not None else "regex approximation",
+        "chunks_indexed": len(chunks),
+        "queries": len(queries),
+        "top_k": args.top_k,
+        "budget": args.budget,
+        "assemble_ms": percentiles(latencies_ms),
+        "tokens": {
+            "baseline_top3_mean": mean(baseline_tokens),
+            f"retrieved_top{args.top_k}_mean": mean(raw_tokens),
+            "sent_mean": mean(sent_tokens),
+            "sent_max": max(sent_tokens),
+            "saved_vs_retrieved": round(1 - sum(sent_tokens) / sum(raw_tokens), 4),
+            "saved_vs_baseline_top3": round(1 - sum(sent_tokens) / sum(baseline_tokens), 4),
+        },
+        "budgeter": budgeter.stats(),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# benchmarks/fake_upstreams.py
+"""Local stand-ins for the OpenAI and Pinecone HTTP APIs used by query_api.
+
+One FastAPI app serves:
+  POST /v1/embeddings         (OpenAI embeddings)
+  POST /v1/chat/completions   (OpenAI chat, including stream=true)
+  POST /query                 (Pinecone data-plane query)
+
+Each endpoint has a configurable log-normal latency (median + spread) and
+error rate, so benchmarks can reproduce slow or flaky upstreams without
+spending API credits. `FakeCollection` is the Mongo stand-in, used in-process
+by serve_app.py for history writes, /history paging and cache warm-up.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import operator
+import random
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = {
+    "decision": "covered",
+    "amount": 50000,
+    "justification": "Clause 4.2 covers knee replacement surgery after the 24 month waiting period, subject to a 10% co-pay.",
+}
+CLAUSES = [
+    "4.2 Joint replacement surgery (knee, hip) is covered up to INR 50,000 after a waiting period of 24 months.",
+    "4.3 A co-payment of 10% applies to all claims for insured persons above 60 years of age.",
+    "5.1 Pre-existing diseases are covered after 36 months of continuous coverage.",
+    "6.4 Cosmetic or aesthetic treatments are excluded unless required due to an accident.",
+    "7.2 Day care procedures listed in Annexure II are covered without minimum hospitalization.",
+]
+
+
+class LatencyModel:
+    """Log-normal latency with an independent failure probability."""
+
+    def __init__(self, median_ms: float, spread: float = 0.3, error_rate: float = 0.0, error_status: int = 500):
+        self.median_ms = median_ms
+        self.spread = spread
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def sample_seconds(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return random.lognormvariate(np.log(self.median_ms / 1000.0), self.spread)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def fake_vector(text: str, dim: int) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vec / np.linalg.norm(vec)).round(6).tolist()
+
+
+def create_app(embed: LatencyModel, chat: LatencyModel, query: LatencyModel, dim: int = 1536, stream_chunk: int = 8) -> FastAPI:
+    app = FastAPI()
+    stats: Dict[str, int] = {"embeddings": 0, "chat": 0, "query": 0, "errors": 0}
+
+    async def _delay_or_fail(model: LatencyModel):
+        await asyncio.sleep(model.sample_seconds())
+        if model.should_fail():
+            stats["errors"] += 1
+            return JSONResponse(status_code=model.error_status, content={"error": {"message": "injected failure"}})
+        return None
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        failure = await _delay_or_fail(embed)
+        if failure is not None:
+            return failure
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_vector(t, dim)} for i, t in enumerate(inputs)],
+            "usage": {"prompt_tokens": sum(len(t.split()) for t in inputs), "total_tokens": sum(len(t.split()) for t in inputs)},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["chat"] += 1
+        failure = await _delay_or_fail(chat)
+        if failure is not None:
+            return failure
+        content = json.dumps(ANSWER)
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model")}
+        if not body.get("stream"):
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+
+        async def events():
+            for i in range(0, len(content), stream_chunk):
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + stream_chunk]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0.005)
+            done = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/query")
+    async def pinecone_query(request: Request):
+        body = await request.json()
+        stats["query"] += 1
+        failure = await _delay_or_fail(query)
+        if failure is not None:
+            return failure
+        top_k = body.get("topK", 3)
+        offset = int(abs(sum(body.get("vector", [0.0])[:8])) * 1000) % len(CLAUSES)
+        matches = []
+        for rank in range(min(top_k, len(CLAUSES))):
+            idx = (offset + rank) % len(CLAUSES)
+            match: Dict[str, Any] = {"id": f"clause-{idx}", "score": round(0.9 - rank * 0.05, 4)}
+            if body.get("includeMetadata"):
+                match["metadata"] = {"text": CLAUSES[idx], "source": "fake-policy.pdf"}
+            matches.append(match)
+        return {"matches": matches, "namespace": body.get("namespace", "")}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def _field(doc: Dict[str, Any], path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+_ORDERING = {"$lt": operator.lt, "$lte": operator.le, "$gt": operator.gt, "$gte": operator.ge}
+
+
+def _compare(value, op: str, operand) -> bool:
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if op == "$exists":
+        return (value is not None) == bool(operand)
+    if op == "$type":
+        return isinstance(value, {"string": str, "date": datetime, "objectId": ObjectId}[operand])
+    if op not in _ORDERING:
+        raise NotImplementedError(f"FakeCollection does not support {op}")
+    return value is not None and operand is not None and _ORDERING[op](value, operand)
+
+
+def matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """Mongo filter semantics for the subset query_api and history_replay use:
+    equality, $or/$and and the comparison operators."""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            value = _field(doc, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif _field(doc, key) != condition:
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return dict(doc)
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        out = {k: doc[k] for k in included if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+def _sort_key(value):
+    # Mongo orders missing/null before everything else
+    return (value is not None, value)
+
+
+class FakeCursor:
+    """Motor-style cursor over a FakeCollection snapshot: sort/skip/limit/batch_size
+    chain, then `to_list()` or `async for`. One latency sample per batch."""
+
+    def __init__(self, collection: "FakeCollection", docs: List[Dict[str, Any]]):
+        self.collection = collection
+        self.docs = docs
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._batch = 101
+
+    def sort(self, key, direction: int = 1) -> "FakeCursor":
+        self._sort = list(key) if isinstance(key, (list, tuple)) else [(key, direction)]
+        return self
+
+    def skip(self, n: int) -> "FakeCursor":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "FakeCursor":
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int) -> "FakeCursor":
+        self._batch = max(1, n)
+        return self
+
+    def _results(self) -> List[Dict[str, Any]]:
+        docs = self.docs
+        for key, direction in reversed(self._sort):  # stable sorts, least significant key first
+            docs = sorted(docs, key=lambda d: _sort_key(_field(d, key)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        return docs[: self._limit] if self._limit else docs
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        await self.collection._delay()
+        docs = self._results()
+        return docs[:length] if length else docs
+
+    async def __aiter__(self):
+        docs = self._results()
+        for start in range(0, len(docs), self._batch):
+            await self.collection._delay()
+            for doc in docs[start : start + self._batch]:
+                yield doc
+
+
+class FakeCollection:
+    """In-process stand-in for the Motor collections query_api touches.
+
+    Writes assign an ObjectId like pymongo does. Reads cover what /history and
+    history_replay issue: `find` with equality, $or and comparison filters,
+    projection, sort, skip and limit, and `aggregate` with $match, $group
+    ($sum/$first/$max/$min), $sort and $limit. Anything else raises
+    NotImplementedError rather than returning a wrong answer."""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.docs: List[Dict[str, Any]] = []
+        self.writes = 0
+
+    async def _delay(self):
+        await asyncio.sleep(self.latency.sample_seconds())
+        if self.latency.should_fail():
+            raise RuntimeError("injected Mongo failure")
+
+    async def insert_one(self, doc):
+        await self._delay()
+        self.writes += 1
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(doc)
+
+    async def insert_many(self, docs, ordered: bool = True):
+        await self._delay()
+        self.writes += 1
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+        self.docs.extend(docs)
+
+    async def create_index(self, *args, **kwargs):
+        return "fake_index"
+
+    async def estimated_document_count(self) -> int:
+        await self._delay()
+        return len(self.docs)
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs) -> FakeCursor:
+        query = query or {}
+        return FakeCursor(self, [_project(d, projection) for d in self.docs if matches(d, query)])
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> FakeCursor:
+        docs = [dict(d) for d in self.docs]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [d for d in docs if matches(d, spec)]
+            elif name == "$group":
+                docs = _group(docs, spec)
+            elif name == "$sort":
+                for key, direction in reversed(list(spec.items())):
+                    docs = sorted(docs, key=lambda d: _sort_key(_field(d, key)), reverse=direction < 0)
+            elif name == "$limit":
+                docs = docs[:spec]
+            else:
+                raise NotImplementedError(f"FakeCollection does not support {name}")
+        return FakeCursor(self, docs).batch_size(kwargs.get("batchSize", 101))
+
+
+def _evaluate(expr, doc: Dict[str, Any]):
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _field(doc, expr[1:])
+    if isinstance(expr, dict):
+        (op, arg), = expr.items()
+        if op == "$toLower":
+            value = _evaluate(arg, doc)
+            return value.lower() if isinstance(value, str) else ""
+        if op == "$trim":
+            value = _evaluate(arg["input"], doc)
+            return value.strip() if isinstance(value, str) else None
+        raise NotImplementedError(f"FakeCollection does not support {op}")
+    return expr
+
+
+def _group(docs: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for doc in docs:
+        key = _evaluate(spec["_id"], doc)
+        row = groups.setdefault(key, {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, arg), = accumulator.items()
+            value = _evaluate(arg, doc)
+            if op == "$sum":
+                row[field] = row.get(field, 0) + (value or 0)
+            elif op == "$first":
+                row.setdefault(field, value)
+            elif op in ("$max", "$min"):
+                current = row.get(field)
+                if current is None or (value is not None and (value > current if op == "$max" else value < current)):
+                    row[field] = value
+            else:
+                raise NotImplementedError(f"FakeCollection does not support {op}")
+    return list(groups.values())
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI + Pinecone upstreams for benchmarking")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--dim", type=int, default=1536)
+    for name, median in (("embed", 80.0), ("chat", 900.0), ("query", 60.0)):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=median)
+        parser.add_argument(f"--{name}-spread", type=float, default=0.3)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(
+        embed=LatencyModel(args.embed_latency_ms, args.embed_spread, args.embed_error_rate),
+        chat=LatencyModel(args.chat_latency_ms, args.chat_spread, args.chat_error_rate),
+        query=LatencyModel(args.query_latency_ms, args.query_spread, args.query_error_rate),
+        dim=args.dim,
+    )
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# benchmarks/run_benchmark.py
+"""Offline load test for query_api.
+
+Starts the fake OpenAI/Pinecone upstreams and the API (with an in-process fake
+Mongo) as subprocesses on localhost, drives a concurrent /run workload and
+reports throughput, client latency, per-stage latency percentiles (from the
+Server-Timing header) and API memory. Results are written as JSON so two runs
+can be compared:
+
+  python benchmarks/run_benchmark.py --concurrency 32 --requests 500 --output results.json
+  python benchmarks/run_benchmark.py --compare baseline.json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+from metrics import percentiles  # noqa: E402
+
+QUERY_TEMPLATES = [
+    "{age} year old {sex}, knee surgery in {city}, {months}-month-old policy",
+    "Is hip replacement covered for a {age} year old {sex} in {city} with a {months} month policy?",
+    "{age}{sex_short}, cataract surgery, {city}, policy active {months} months",
+    "Claim for day care procedure in {city}, {age} years, policy {months} months old",
+    "{age} year old {sex} hospitalised for dengue in {city}, {months} month policy",
+]
+CITIES = ["Pune", "Mumbai", "Delhi", "Bengaluru", "Chennai", "Jaipur", "Kolkata", "Hyderabad"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_queries(total: int, unique_ratio: float, seed: int) -> List[str]:
+    """Build the workload; unique_ratio < 1 repeats earlier queries to exercise the caches."""
+    rng = random.Random(seed)
+    pool: List[str] = []
+    queries: List[str] = []
+    for _ in range(total):
+        if pool and rng.random() > unique_ratio:
+            queries.append(rng.choice(pool))
+            continue
+        sex = rng.choice(["male", "female"])
+        query = rng.choice(QUERY_TEMPLATES).format(
+            age=rng.randint(18, 80), sex=sex, sex_short=sex[0].upper(),
+            city=rng.choice(CITIES), months=rng.randint(1, 60),
+        )
+        pool.append(query)
+        queries.append(query)
+    return queries
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    timings: Dict[str, float] = {}
+    if not header:
+        return timings
+    for part in header.split(","):
+        name, _, rest = part.strip().partition(";dur=")
+        try:
+            timings[name] = timings.get(name, 0.0) + float(rest)
+        except ValueError:
+            continue
+    return timings
+
+
+def process_memory_kb(pid: int) -> Dict[str, Optional[int]]:
+    """Current and peak RSS of a process, from /proc (Linux only)."""
+    memory: Dict[str, Optional[int]] = {"rss_kb": None, "peak_rss_kb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    memory["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return memory
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+async def wait_until_up(url: str, timeout: float, proc: subprocess.Popen) -> None:
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.time() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"Process exited early while waiting for {url}")
+            try:
+                resp = await http.get(url)
+                if resp.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+async def drive_load(base_url: str, queries: List[str], concurrency: int, endpoint: str, timeout: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    stage_samples: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+    cached = 0
+    next_index = 0
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as http:
+
+        async def worker(worker_id: int):
+            nonlocal next_index, cached
+            while next_index < len(queries):
+                query = queries[next_index]
+                next_index += 1
+                payload = {"query": query, "user_id": f"bench-{worker_id}"}
+                started = time.perf_counter()
+                try:
+                    resp = await http.post(endpoint, json=payload)
+                    status = str(resp.status_code)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+                for name, ms in parse_server_timing(resp.headers.get("server-timing")).items():
+                    stage_samples.setdefault(name, []).append(ms)
+                if resp.status_code == 200 and resp.json().get("cached"):
+                    cached += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = statuses.get("200", 0)
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": len(queries),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "statuses": statuses,
+        "error_rate": round(1 - ok / len(queries), 4) if queries else 0.0,
+        "cached_responses": cached,
+        "latency_ms": percentiles(latencies),
+        "stages_ms": {name: percentiles(values) for name, values in sorted(stage_samples.items())},
+    }
+
+
+def start_process(args: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def run(args) -> Dict[str, Any]:
+    upstream_port = args.upstream_port or free_port()
+    api_port = args.api_port or free_port()
+    os.makedirs(args.log_dir, exist_ok=True)
+
+    upstream_args = [os.path.join(HERE, "fake_upstreams.py"), "--port", str(upstream_port)]
+    for name in ("embed", "chat", "query"):
+        upstream_args += [
+            f"--{name}-latency-ms", str(getattr(args, f"{name}_latency_ms")),
+            f"--{name}-spread", str(args.spread),
+            f"--{name}-error-rate", str(getattr(args, f"{name}_error_rate")),
+        ]
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    api_env = {
+        **os.environ,
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{upstream_url}/v1",
+        "PINECONE_API_KEY": "benchmark",
+        "PINECONE_INDEX_HOST": upstream_url,
+        "VECTOR_BACKEND": "pinecone",
+        "LLM_PROVIDER": "openai",
+        "USE_LOCAL_EMBEDDINGS": "false",
+        "MONGO_URI": "",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "EMBED_CACHE_ENABLED": "true" if args.embed_cache else "false",
+        "EMBED_CACHE_PATH": "",
+        "TRACE_HEADERS_ENABLED": "true",
+        "PYTHONUNBUFFERED": "1",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        api_env[key] = value
+
+    procs: List[subprocess.Popen] = []
+    try:
+        upstream = start_process(upstream_args, os.environ.copy(), os.path.join(args.log_dir, "upstreams.log"))
+        procs.append(upstream)
+        await wait_until_up(f"{upstream_url}/stats", 30, upstream)
+
+        api = start_process(
+            [os.path.join(HERE, "serve_app.py"), "--port", str(api_port),
+             "--mongo-latency-ms", str(args.mongo_latency_ms), "--mongo-error-rate", str(args.mongo_error_rate)],
+            api_env, os.path.join(args.log_dir, "api.log"),
+        )
+        procs.append(api)
+        api_url = f"http://127.0.0.1:{api_port}"
+        await wait_until_up(f"{api_url}/ready", 60, api)
+        memory_idle = process_memory_kb(api.pid)
+
+        if args.warmup:
+            print(f"🔥 Warm-up: {args.warmup} requests")
+            await drive_load(api_url, make_queries(args.warmup, 1.0, args.seed + 1), min(args.concurrency, args.warmup), args.endpoint, args.timeout)
+
+        queries = make_queries(args.requests, args.unique_ratio, args.seed)
+        print(f"🚀 {len(queries)} requests, concurrency {args.concurrency}, endpoint {args.endpoint}")
+        results = await drive_load(api_url, queries, args.concurrency, args.endpoint, args.timeout)
+
+        async with httpx.AsyncClient(base_url=api_url) as http:
+            admission = (await http.get("/admission")).json()
+            cache_stats = (await http.get("/cache/stats")).json()
+        async with httpx.AsyncClient(base_url=upstream_url) as http:
+            upstream_calls = (await http.get("/stats")).json()
+        memory = process_memory_kb(api.pid)
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "config": {
+            "endpoint": args.endpoint,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "unique_ratio": args.unique_ratio,
+            "warmup": args.warmup,
+            "answer_cache": args.answer_cache,
+            "embed_cache": args.embed_cache,
+            "upstream_latency_ms": {
+                "embed": args.embed_latency_ms, "chat": args.chat_latency_ms,
+                "query": args.query_latency_ms, "mongo": args.mongo_latency_ms,
+            },
+            "upstream_error_rate": {
+                "embed": args.embed_error_rate, "chat": args.chat_error_rate,
+                "query": args.query_error_rate, "mongo": args.mongo_error_rate,
+            },
+            "latency_spread": args.spread,
+            "env": args.env,
+        },
+        **results,
+        "memory_kb": {"idle_rss": memory_idle["rss_kb"], "final_rss": memory["rss_kb"], "peak_rss": memory["peak_rss_kb"]},
+        "upstream_calls": upstream_calls,
+        "admission": admission,
+        "cache": cache_stats,
+    }
+
+
+def compare(baseline_path: str, current_path: str) -> None:
+    """Print the change in throughput, latency and memory between two result files."""
+    with open(baseline_path) as f:
+        base = json.load(f)
+    with open(current_path) as f:
+        cur = json.load(f)
+
+    def row(label: str, old, new, lower_is_better: bool = True):
+        if old is None or new is None:
+            print(f"  {label:<32} {str(old):>10} {str(new):>10}")
+            return
+        delta = (new - old) / old * 100 if old else 0.0
+        worse = delta > 0 if lower_is_better else delta < 0
+        marker = "⚠️" if worse and abs(delta) > 10 else "  "
+        print(f"  {label:<32} {old:>10} {new:>10} {delta:>+8.1f}% {marker}")
+
+    print(f"📊 {base.get('commit')} -> {cur.get('commit')}")
+    row("throughput_rps", base["throughput_rps"], cur["throughput_rps"], lower_is_better=False)
+    row("error_rate", base["error_rate"], cur["error_rate"])
+    for q in ("p50", "p95", "p99"):
+        row(f"latency {q} (ms)", base["latency_ms"][q], cur["latency_ms"][q])
+    for name in sorted(set(base["stages_ms"]) | set(cur["stages_ms"])):
+        row(f"{name} p95 (ms)", base["stages_ms"].get(name, {}).get("p95"), cur["stages_ms"].get(name, {}).get("p95"))
+    row("peak_rss (kB)", base["memory_kb"]["peak_rss"], cur["memory_kb"]["peak_rss"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test for query_api against fake upstreams")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--endpoint", default="/run")
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="Share of distinct queries (rest are repeats)")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--answer-cache", action="store_true", help="Enable the semantic answer cache")
+    parser.add_argument("--embed-cache", action="store_true", help="Enable the embedding cache (memory only)")
+    parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=900.0)
+    parser.add_argument("--query-latency-ms", type=float, default=60.0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=15.0)
+    parser.add_argument("--spread", type=float, default=0.3, help="Log-normal sigma for all fake latencies")
+    parser.add_argument("--embed-error-rate", type=float, default=0.0)
+    parser.add_argument("--chat-error-rate", type=float, default=0.0)
+    parser.add_argument("--query-error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-error-rate", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra env for the API process")
+    parser.add_argument("--upstream-port", type=int, default=0)
+    parser.add_argument("--api-port", type=int, default=0)
+    parser.add_argument("--log-dir", default=os.path.join(ROOT, ".cache", "benchmark"))
+    parser.add_argument("--output", help="Write JSON results to this path")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = asyncio.run(run(args))
+    summary = {k: results[k] for k in ("throughput_rps", "error_rate", "latency_ms", "memory_kb")}
+    print(json.dumps(summary, indent=2))
+    for name, stats in results["stages_ms"].items():
+        print(f"  {name:<16} p50={stats['p50']}ms p95={stats['p95']}ms p99={stats['p99']}ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
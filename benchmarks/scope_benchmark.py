@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# benchmarks/scope_benchmark.py
+"""Scoped vs whole-corpus retrieval on the local vector index across corpus sizes.
+
+Builds synthetic corpora of N policies: every policy covers the same topics
+(knee surgery, maternity, ...) in its own wording, so a chunk is
+topic + policy style + noise. Queries come from one policy's user and are run
+unscoped, with a `policy_id` metadata filter, and against a per-policy
+namespace. Reports query latency and how many of the top-3 clauses came from
+other policies (pollution):
+
+  python benchmarks/scope_benchmark.py --policies 10 50 200 --chunks 300
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+from local_vector_store import LocalVectorIndex  # noqa: E402
+from metrics import percentiles  # noqa: E402
+
+
+def build(scratch: str, policies: int, args, topics: np.ndarray, rng):
+    """The same corpus twice: one flat index with policy_id metadata, one namespace per policy."""
+    flat = LocalVectorIndex(os.path.join(scratch, f"flat-{policies}"), dim=args.dim)
+    spaced = LocalVectorIndex(os.path.join(scratch, f"ns-{policies}"), dim=args.dim)
+    styles = rng.normal(size=(policies, args.dim)).astype(np.float32)
+    for p in range(policies):
+        topic_ids = rng.integers(0, len(topics), size=args.chunks)
+        vectors = topics[topic_ids] + args.style * styles[p] + 0.8 * rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+        records = [
+            {"id": f"p{p}-{i}", "values": vectors[i], "metadata": {"text": f"clause {i}", "policy_id": f"p{p}"}}
+            for i in range(args.chunks)
+        ]
+        flat.upsert(records)
+        spaced.upsert(records, namespace=f"p{p}")
+    return flat, spaced, styles
+
+
+def run(policies: int, args, scratch: str) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    topics = rng.normal(size=(args.topics, args.dim)).astype(np.float32) * 1.5
+    flat, spaced, styles = build(scratch, policies, args, topics, rng)
+
+    modes = {
+        "unscoped": lambda q, p: flat.query(q, top_k=3),
+        "filter": lambda q, p: flat.query(q, top_k=3, filter={"policy_id": f"p{p}"}),
+        "namespace": lambda q, p: spaced.query(q, top_k=3, namespace=f"p{p}"),
+    }
+    latencies: Dict[str, List[float]] = {mode: [] for mode in modes}
+    foreign: Dict[str, int] = {mode: 0 for mode in modes}
+    for _ in range(args.queries):
+        p = int(rng.integers(0, policies))
+        q = topics[rng.integers(0, len(topics))] + args.style * styles[p] + 0.8 * rng.normal(size=args.dim).astype(np.float32)
+        for mode, search in modes.items():
+            started = time.perf_counter()
+            matches = search(q, p)["matches"]
+            latencies[mode].append((time.perf_counter() - started) * 1000)
+            foreign[mode] += sum(1 for m in matches if m["metadata"]["policy_id"] != f"p{p}")
+    return {
+        "policies": policies,
+        "corpus_chunks": policies * args.chunks,
+        "query_ms": {mode: percentiles(values) for mode, values in latencies.items()},
+        "top3_foreign_share": {mode: round(n / (3 * args.queries), 4) for mode, n in foreign.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark scoped retrieval across corpus sizes")
+    parser.add_argument("--policies", nargs="+", type=int, default=[10, 50, 200])
+    parser.add_argument("--chunks", type=int, default=300, help="Chunks per policy")
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--style", type=float, default=0.15, help="Weight of the per-policy wording vs the shared topic")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this path")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="scope-bench-")
+    rows = []
+    try:
+        for policies in args.policies:
+            row = run(policies, args, scratch)
+            rows.append(row)
+            print(f"{policies:>4} policies ({row['corpus_chunks']} chunks): " + "  ".join(
+                f"{mode} p50 {row['query_ms'][mode]['p50']}ms foreign {row['top3_foreign_share'][mode]:.0%}"
+                for mode in row["query_ms"]
+            ))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {"chunks_per_policy": args.chunks, "dim": args.dim, "queries": args.queries, "runs": rows}
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
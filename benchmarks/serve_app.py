@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# benchmarks/serve_app.py
+"""Run query_api.app for a benchmark, with MongoDB swapped for FakeCollection.
+
+OpenAI and Pinecone are redirected through the environment (OPENAI_BASE_URL,
+PINECONE_INDEX_HOST) by run_benchmark.py; Mongo has no such switch, so the
+history collection is replaced in-process here.
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import FakeCollection, LatencyModel  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--mongo-latency-ms", type=float, default=15.0)
+    parser.add_argument("--mongo-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+    import query_api
+
+    history = FakeCollection(LatencyModel(args.mongo_latency_ms, 0.3, args.mongo_error_rate))
+
+    def init_fake_mongo() -> None:
+        query_api.history_collection = history
+        query_api.readiness["mongo"] = "ready"
+        print("✅ Using FakeCollection for search_history")
+
+    query_api.init_mongo = init_fake_mongo
+    uvicorn.run(query_api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
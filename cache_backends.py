@@ -0,0 +1,407 @@
+# cache_backends.py
+"""Key/value cache backends shared by the service's caches.
+
+Every backend stores bytes under string keys behind the same API:
+`get(key)`, `set(key, value, ttl=None)`, `delete(key)`, `clear()`, `stats()`.
+
+- `MemoryBackend`: an LRU dict inside one process (the old behaviour; with
+  several uvicorn/gunicorn workers each one warms its own copy).
+- `SharedMemoryBackend`: a fixed-size hash table in a memory-mapped file
+  (under /dev/shm by default) that every worker on the host maps. Reads are
+  lock-free (a per-slot sequence counter detects torn reads) and copy the value
+  straight out of the mapping, with no pickling; writes take a file lock.
+  `clear()` bumps a generation number, so it is O(1) and seen by all workers.
+- `SQLiteBackend`: a WAL-mode SQLite table, shared by workers and restarts.
+
+Hit/miss counters in `stats()` are per process; entry counts are global for
+the shared backends. `shm` needs fcntl file locks; where they do not exist
+(Windows) `make_backend` falls back to the memory backend.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+BACKENDS = ("memory", "shm", "sqlite")
+
+
+class CacheBackend:
+    kind = "base"
+
+    def __init__(self, name: str, default_ttl: Optional[float] = None):
+        self.name = name
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+
+    def _expires_at(self, ttl: Optional[float]) -> float:
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else 0.0  # 0 = never
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def entries(self) -> int:
+        raise NotImplementedError
+
+    def stats(self, count_entries: bool = True) -> Dict[str, Any]:
+        """count_entries=False skips the entry count (a table scan for sqlite)."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.kind,
+            "entries": self.entries() if count_entries else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "sets": self.sets,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    kind = "memory"
+
+    def __init__(self, name: str, max_items: int = 10000, default_ttl: Optional[float] = None):
+        super().__init__(name, default_ttl)
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] and item[1] <= time.time():
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            self._items[key] = (bytes(value), self._expires_at(ttl))
+            self._items.move_to_end(key)
+            self.sets += 1
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def entries(self) -> int:
+        return len(self._items)
+
+
+_MAGIC = b"PCSHM001"
+_FILE_HEADER = struct.Struct("<8sIIQ")  # magic, slots, slot_bytes, generation
+_FILE_HEADER_BYTES = 64
+_GENERATION_OFFSET = 16
+_SLOT_HEADER = struct.Struct("<IIQ16sdd")  # seq, length, generation, key digest, expires_at, stored_at
+_SEQ = struct.Struct("<I")
+_PROBE = 8  # slots examined per key (open addressing, linear probing)
+
+
+class SharedMemoryBackend(CacheBackend):
+    """Open-addressing hash table in a memory-mapped file shared by all workers on a host.
+
+    Each slot holds one value of at most `slot_bytes - 48` bytes. A key may live
+    in any of the _PROBE slots after its hash bucket; when all of them are
+    taken, the oldest entry among them is evicted."""
+
+    kind = "shm"
+
+    def __init__(self, name: str, path: str, slots: int = 16384, slot_bytes: int = 4096, default_ttl: Optional[float] = None):
+        super().__init__(name, default_ttl)
+        if slot_bytes <= _SLOT_HEADER.size:
+            raise ValueError(f"slot_bytes must exceed the {_SLOT_HEADER.size}-byte slot header")
+        self.path = path
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.capacity = slot_bytes - _SLOT_HEADER.size
+        self.oversize = 0
+        self._lock = threading.Lock()  # flock is per open file, so threads of one process also need this
+        size = _FILE_HEADER_BYTES + slots * slot_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, size)  # sparse: pages are only allocated when written
+                os.pwrite(self._fd, _FILE_HEADER.pack(_MAGIC, slots, slot_bytes, 1), 0)
+            magic, file_slots, file_slot_bytes, _ = _FILE_HEADER.unpack(os.pread(self._fd, _FILE_HEADER.size, 0))
+            if magic != _MAGIC or (file_slots, file_slot_bytes) != (slots, slot_bytes):
+                raise ValueError(
+                    f"{path} holds a different cache layout ({file_slots}x{file_slot_bytes}); remove it or change the path"
+                )
+        except Exception:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            raise
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, size)
+
+    @staticmethod
+    def _digest(key: str) -> bytes:
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _generation(self) -> int:
+        return struct.unpack_from("<Q", self._mm, _GENERATION_OFFSET)[0]
+
+    def _offsets(self, digest: bytes):
+        bucket = int.from_bytes(digest[:8], "little") % self.slots
+        for i in range(min(_PROBE, self.slots)):
+            yield _FILE_HEADER_BYTES + ((bucket + i) % self.slots) * self.slot_bytes
+
+    def _read(self, offset: int, digest: bytes, generation: int, now: float) -> Optional[bytes]:
+        for _ in range(4):  # retry a read that raced a writer
+            seq, length, slot_generation, slot_digest, expires_at, _ = _SLOT_HEADER.unpack_from(self._mm, offset)
+            if seq & 1:
+                continue
+            if slot_digest != digest or slot_generation != generation or (expires_at and expires_at <= now):
+                return None
+            start = offset + _SLOT_HEADER.size
+            value = self._mm[start:start + length]
+            if _SEQ.unpack_from(self._mm, offset)[0] == seq:
+                return value
+        return None
+
+    def get(self, key: str) -> Optional[bytes]:
+        digest = self._digest(key)
+        generation = self._generation()
+        now = time.time()
+        for offset in self._offsets(digest):
+            value = self._read(offset, digest, generation, now)
+            if value is not None:
+                self.hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def _write(self, offset: int, header: Optional[tuple], value: bytes = b"") -> None:
+        seq = _SEQ.unpack_from(self._mm, offset)[0]
+        _SEQ.pack_into(self._mm, offset, seq + 1)  # odd: readers retry
+        if header is not None:
+            start = offset + _SLOT_HEADER.size
+            self._mm[start:start + len(value)] = value
+            _SLOT_HEADER.pack_into(self._mm, offset, seq + 1, *header)
+        else:
+            struct.pack_into("<Q", self._mm, offset + 8, 0)  # generation 0 never matches
+        _SEQ.pack_into(self._mm, offset, seq + 2)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if len(value) > self.capacity:
+            self.oversize += 1
+            return False
+        digest = self._digest(key)
+        expires_at = self._expires_at(ttl)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                generation = self._generation()
+                now = time.time()
+                target = None
+                free = None
+                oldest = None
+                for offset in self._offsets(digest):
+                    _, _, slot_generation, slot_digest, slot_expires, stored_at = _SLOT_HEADER.unpack_from(self._mm, offset)
+                    live = slot_generation == generation and not (slot_expires and slot_expires <= now)
+                    if live and slot_digest == digest:
+                        target = offset
+                        break
+                    if not live:
+                        free = free if free is not None else offset
+                    elif oldest is None or stored_at < oldest[1]:
+                        oldest = (offset, stored_at)
+                if target is None:
+                    target = free
+                if target is None:
+                    target = oldest[0]
+                    self.evictions += 1
+                self._write(target, (len(value), generation, digest, expires_at, now), value)
+                self.sets += 1
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return True
+
+    def delete(self, key: str) -> None:
+        digest = self._digest(key)
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                generation = self._generation()
+                for offset in self._offsets(digest):
+                    _, _, slot_generation, slot_digest, _, _ = _SLOT_HEADER.unpack_from(self._mm, offset)
+                    if slot_digest == digest and slot_generation == generation:
+                        self._write(offset, None)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def clear(self) -> None:
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                struct.pack_into("<Q", self._mm, _GENERATION_OFFSET, self._generation() + 1)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def entries(self) -> int:
+        layout = np.dtype({
+            "names": ["generation", "expires_at"],
+            "formats": ["<u8", "<f8"],
+            "offsets": [8, 32],
+            "itemsize": self.slot_bytes,
+        })
+        table = np.frombuffer(self._mm, dtype=layout, count=self.slots, offset=_FILE_HEADER_BYTES)
+        live = (table["generation"] == self._generation()) & (
+            (table["expires_at"] == 0) | (table["expires_at"] > time.time())
+        )
+        return int(live.sum())
+
+    def stats(self, count_entries: bool = True) -> Dict[str, Any]:
+        return {**super().stats(count_entries), "slots": self.slots, "slot_bytes": self.slot_bytes, "oversize": self.oversize, "path": self.path}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                os.close(self._fd)
+                self._mm = None
+
+
+class SQLiteBackend(CacheBackend):
+    kind = "sqlite"
+
+    def __init__(self, name: str, path: str, max_items: int = 100000, default_ttl: Optional[float] = None):
+        super().__init__(name, default_ttl)
+        self.path = path
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL, stored_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at);"
+        )
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] and row[1] <= time.time()):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, bytes(value), self._expires_at(ttl), now)
+            )
+            self.sets += 1
+            if self.sets % 256 == 0:
+                self._trim(now)
+        return True
+
+    def _trim(self, now: float) -> None:
+        """Drop expired rows, then the oldest ones beyond max_items (caller holds the lock)."""
+        self._db.execute("DELETE FROM cache WHERE expires_at > 0 AND expires_at <= ?", (now,))
+        excess = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_items
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored_at LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+
+    def entries(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self, count_entries: bool = True) -> Dict[str, Any]:
+        return {**super().stats(count_entries), "path": self.path}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def default_shm_dir() -> str:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def make_backend(
+    kind: str,
+    name: str,
+    max_items: int,
+    value_bytes: int = 4096,
+    default_ttl: Optional[float] = None,
+    shm_dir: Optional[str] = None,
+    sqlite_dir: str = ".cache",
+) -> CacheBackend:
+    """Build the `kind` backend for the cache `name`, sized for max_items values of up to value_bytes."""
+    if kind == "shm" and fcntl is None:
+        print(f"⚠️ '{name}' cache: shm needs fcntl, which this platform lacks; using a per-process memory cache")
+        kind = "memory"
+    if kind == "memory":
+        return MemoryBackend(name, max_items, default_ttl)
+    if kind == "shm":
+        slots = max(_PROBE, max_items * 5 // 4)  # headroom keeps probe chains short
+        slot_bytes = -(-(value_bytes + _SLOT_HEADER.size) // 64) * 64
+        # The layout is part of the file name, so resizing never maps an incompatible table.
+        path = os.path.join(shm_dir or default_shm_dir(), f"policy-cache-{name}-{slots}x{slot_bytes}")
+        return SharedMemoryBackend(name, path, slots, slot_bytes, default_ttl)
+    if kind == "sqlite":
+        return SQLiteBackend(name, os.path.join(sqlite_dir, f"{name}-cache.sqlite3"), max_items, default_ttl)
+    raise ValueError(f"Unknown cache backend '{kind}' (expected one of {', '.join(BACKENDS)})")
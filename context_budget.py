@@ -0,0 +1,168 @@
+# context_budget.py
+"""Context assembly between retrieval and the LLM call.
+
+`ContextBudgeter.assemble()` takes the scored matches from the vector index and
+returns the clause texts to put in the prompt:
+
+1. drop sentences that mostly repeat a higher-scored chunk (word-shingle
+   overlap, which catches the overlap ingestion adds between neighbouring
+   chunks), and chunks with nothing new left;
+2. order the rest by retrieval score;
+3. keep whole chunks while they fit the token budget, and for the chunk that
+   does not fit, keep its sentences that share the most terms with the query.
+
+Tokens are counted with tiktoken when it is installed and with a regex
+approximation of a BPE tokenizer otherwise.
+"""
+import functools
+import re
+import time
+from typing import Any, Dict, List, Optional, Set
+
+_APPROX_TOKEN = re.compile(r"\w{1,6}|[^\w\s]")
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its my of on or that the this to was what when "
+    "which who will with does do can if under my me our".split()
+)
+
+
+@functools.lru_cache(maxsize=1)
+def get_encoding():
+    """tiktoken's o200k_base, loaded on first use: fetching the BPE file may hit the network,
+    which must not happen at import time. None when tiktoken or the file is unavailable."""
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:  # optional dependency; also covers a missing encoding file offline
+        print("⚠️ tiktoken unavailable; approximating token counts:", e)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def _terms(text: str) -> Set[str]:
+    return {w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def _shingles(text: str, size: int = 3) -> Set[tuple]:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s and s.strip()]
+
+
+class ContextBudgeter:
+    def __init__(self, max_tokens: int = 600, dedupe_threshold: float = 0.6, min_sentence_tokens: int = 4):
+        self.max_tokens = max_tokens
+        self.dedupe_threshold = dedupe_threshold  # share of a sentence's shingles already seen
+        self.min_sentence_tokens = min_sentence_tokens
+        self.calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.duplicates = 0
+        self.trimmed = 0
+
+    def assemble(self, query: str, matches: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Select clause texts from [{"text", "score"}] matches within the token budget.
+
+        Returns {"chunks", "tokens", "input_tokens", "duplicates", "trimmed", "seconds"}."""
+        started = time.perf_counter()
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        ranked = sorted(
+            (m for m in matches if m.get("text")), key=lambda m: m.get("score") or 0.0, reverse=True
+        )
+        input_tokens = sum(count_tokens(m["text"]) for m in ranked)
+
+        kept: List[str] = []
+        seen: Set[tuple] = set()
+        duplicates = 0
+        for match in ranked:
+            novel = []
+            for sentence in split_sentences(match["text"]):
+                shingles = _shingles(sentence)
+                if shingles and len(shingles & seen) / len(shingles) >= self.dedupe_threshold:
+                    continue
+                seen |= shingles
+                novel.append(sentence)
+            if not novel:
+                duplicates += 1
+                continue
+            kept.append(" ".join(novel))
+
+        query_terms = _terms(query)
+        chunks: List[str] = []
+        used = 0
+        trimmed = 0
+        for position, text in enumerate(kept):
+            if budget - used < self.min_sentence_tokens:
+                trimmed += len(kept) - position  # no room left for the rest
+                break
+            tokens = count_tokens(text)
+            if used + tokens <= budget:
+                chunks.append(text)
+                used += tokens
+                continue
+            extract, extract_tokens = self._extract(text, query_terms, budget - used)
+            trimmed += 1
+            if extract:
+                chunks.append(extract)
+                used += extract_tokens
+
+        self.calls += 1
+        self.tokens_in += input_tokens
+        self.tokens_out += used
+        self.duplicates += duplicates
+        self.trimmed += trimmed
+        return {
+            "chunks": chunks,
+            "tokens": used,
+            "input_tokens": input_tokens,
+            "duplicates": duplicates,
+            "trimmed": trimmed,
+            "seconds": time.perf_counter() - started,
+        }
+
+    def _extract(self, text: str, query_terms: Set[str], budget: int):
+        """The chunk's most query-relevant sentences that fit the budget, in their original order."""
+        sentences = split_sentences(text)
+        scored = []
+        for position, sentence in enumerate(sentences):
+            tokens = count_tokens(sentence)
+            if tokens < self.min_sentence_tokens:
+                continue
+            overlap = len(_terms(sentence) & query_terms)
+            scored.append((overlap, -position, position, sentence, tokens))
+        scored.sort(reverse=True)
+        picked = []
+        used = 0
+        for overlap, _, position, sentence, tokens in scored:
+            if overlap == 0 and picked:
+                break
+            if used + tokens <= budget:
+                picked.append((position, sentence))
+                used += tokens
+        picked.sort()
+        return " ".join(sentence for _, sentence in picked), used
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "saved_ratio": round(1 - self.tokens_out / self.tokens_in, 4) if self.tokens_in else 0.0,
+            "duplicates": self.duplicates,
+            "trimmed": self.trimmed,
+            "max_tokens": self.max_tokens,
+        }
@@ -0,0 +1,129 @@
+# embed_batcher.py
+"""Dynamic micro-batching for local embedding models.
+
+Concurrent callers submit texts to `MicroBatcher.embed()`. A single consumer
+task collects queued texts until `max_batch` items are waiting or `max_wait_ms`
+has passed since the first one arrived, runs one batched `encode` call in a
+worker thread and resolves each caller's future with its own vectors. While a
+batch is encoding, new texts keep queueing, so batches grow with load. With
+`concurrency` > 1 (a worker pool behind `encode`), that many batches run at once.
+"""
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        encode: Callable[[List[str]], List[list]],
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        on_batch: Optional[Callable[[int, List[float], float], None]] = None,
+        concurrency: int = 1,
+    ):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.on_batch = on_batch  # (batch size, queue waits in seconds, encode seconds)
+        self.concurrency = max(1, concurrency)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+
+    def _ensure_running(self) -> asyncio.Queue:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.create_task(self._run())
+        return self._queue
+
+    async def embed(self, texts: List[str]) -> List[list]:
+        """Embed texts as part of whatever batch is being formed."""
+        queue = self._ensure_running()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            queue.put_nowait((text, future, time.perf_counter()))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future, float]]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Take everything already queued before waiting out the window.
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.perf_counter()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Hold a free encode slot before forming the batch, so texts keep accumulating while all are busy.
+            await self._slots.acquire()
+            batch = await self._collect()
+            batch = [item for item in batch if not item[1].done()]  # skip cancelled callers
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._encode_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        try:
+            started = time.perf_counter()
+            waits = [started - queued_at for _, _, queued_at in batch]
+            try:
+                vectors = await asyncio.to_thread(self.encode, [text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future, _), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen_batch = max(self.max_seen_batch, len(batch))
+            if self.on_batch is not None:
+                self.on_batch(len(batch), waits, time.perf_counter() - started)
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher closed"))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_seen_batch,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "concurrency": self.concurrency,
+        }
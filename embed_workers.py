@@ -0,0 +1,290 @@
+# embed_workers.py
+"""Process pool for local SentenceTransformer embeddings.
+
+Each worker process loads the model once and owns two shared-memory buffers:
+texts go in as UTF-8 bytes with an int32 offset table, and vectors come back
+as a float32 matrix. Only small control tuples cross the pipe. A batch goes to
+the worker with the fewest outstanding jobs. A worker that dies or stops
+responding is replaced and the batch is retried once.
+"""
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+MAX_OUTPUT_DIM = 4096  # the output buffer holds max_batch x MAX_OUTPUT_DIM float32s
+
+
+def _worker_main(model_source: str, conn, in_name: str, out_name: str, threads: int) -> None:
+    """Worker entry point: load the model, then serve encode jobs until the pipe closes."""
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    def load_model():
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_source)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        return model
+
+    _serve(load_model, conn, in_name, out_name)
+
+
+def _serve(load_model: Callable[[], Any], conn, in_name: str, out_name: str) -> None:
+    """Load a model (anything with encode(texts, batch_size=...)), report its dim, then answer jobs."""
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    try:
+        model = load_model()
+        dim = int(model.get_sentence_embedding_dimension() or len(model.encode(["dim"])[0]))
+        conn.send(("ready", dim))
+    except Exception as e:
+        conn.send(("error", f"model load failed: {e}"))
+        return
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        job_id, count = job
+        try:
+            offsets = np.ndarray((count + 1,), dtype=np.int32, buffer=in_shm.buf, offset=0)
+            data_start = (count + 1) * 4
+            raw = bytes(in_shm.buf[data_start:data_start + int(offsets[-1])])
+            texts = [raw[offsets[i]:offsets[i + 1]].decode("utf-8", "ignore") for i in range(count)]
+            vectors = np.asarray(model.encode(texts, batch_size=min(count, 64)), dtype=np.float32)
+            out = np.ndarray(vectors.shape, dtype=np.float32, buffer=out_shm.buf)
+            out[:] = vectors
+            conn.send((job_id, "ok"))
+        except Exception as e:
+            conn.send((job_id, f"encode failed: {e}"))
+    in_shm.close()
+    out_shm.close()
+
+
+class _WorkerLost(Exception):
+    pass
+
+
+class _Worker:
+    """One worker process plus its shared buffers; restarts reuse the same slot object."""
+
+    def __init__(self, ctx, slot: int, model_source: str, max_batch: int, in_bytes: int, threads: int):
+        self.ctx = ctx
+        self.slot = slot
+        self.model_source = model_source
+        self.max_batch = max_batch
+        self.in_bytes = in_bytes
+        self.threads = threads
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.jobs = 0
+        self.dim: Optional[int] = None
+        self.launch()
+
+    def launch(self) -> None:
+        self.in_shm = shared_memory.SharedMemory(create=True, size=self.in_bytes)
+        self.out_shm = shared_memory.SharedMemory(create=True, size=self.max_batch * MAX_OUTPUT_DIM * 4)
+        self.conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(
+            target=_worker_main,
+            args=(self.model_source, child_conn, self.in_shm.name, self.out_shm.name, self.threads),
+            name=f"embed-worker-{self.slot}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout: float) -> int:
+        if not self.conn.poll(timeout):
+            raise RuntimeError(f"embed worker {self.slot} did not load its model within {timeout}s")
+        status, value = self.conn.recv()
+        if status != "ready":
+            raise RuntimeError(f"embed worker {self.slot}: {value}")
+        if not 0 < value <= MAX_OUTPUT_DIM:
+            # wider vectors would be written past the end of out_shm
+            raise RuntimeError(f"embed worker {self.slot}: model dim {value} exceeds MAX_OUTPUT_DIM ({MAX_OUTPUT_DIM})")
+        self.dim = value
+        return value
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def run(self, job_id: int, chunk: List[bytes], timeout: float) -> List[list]:
+        """Send one chunk through the shared buffers; caller holds self.lock."""
+        count = len(chunk)
+        offsets = np.zeros(count + 1, dtype=np.int32)
+        np.cumsum([len(d) for d in chunk], out=offsets[1:])
+        np.ndarray((count + 1,), dtype=np.int32, buffer=self.in_shm.buf)[:] = offsets
+        data_start = (count + 1) * 4
+        self.in_shm.buf[data_start:data_start + int(offsets[-1])] = b"".join(chunk)
+        try:
+            self.conn.send((job_id, count))
+            if not self.conn.poll(timeout):
+                self.process.kill()
+                raise _WorkerLost(f"embed worker {self.slot} timed out after {timeout}s")
+            _, status = self.conn.recv()
+        except (EOFError, OSError) as e:
+            raise _WorkerLost(f"embed worker {self.slot} died: {e}") from e
+        if status != "ok":
+            raise RuntimeError(status)
+        self.jobs += 1
+        return np.ndarray((count, self.dim), dtype=np.float32, buffer=self.out_shm.buf).tolist()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=2)
+        self.conn.close()
+        for shm in (self.in_shm, self.out_shm):
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class EmbeddingWorkerPool:
+    def __init__(
+        self,
+        model_source: str,
+        num_workers: int,
+        max_batch: int = 64,
+        max_text_bytes: int = 16384,
+        job_timeout: float = 60.0,
+        start_timeout: float = 300.0,
+    ):
+        self.model_source = model_source
+        self.num_workers = max(1, num_workers)
+        self.max_batch = max_batch
+        self.max_text_bytes = max_text_bytes
+        self.in_bytes = (max_batch + 1) * 4 + max_batch * max_text_bytes
+        self.job_timeout = job_timeout
+        self.start_timeout = start_timeout
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self._ctx = mp.get_context("spawn")  # never fork a process that runs an event loop and threads
+        self._workers: List[_Worker] = []
+        self._dispatch_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="embed-dispatch")
+        self._job_ids = 0
+        self.restarts = 0
+        self.dim: Optional[int] = None
+
+    def start(self) -> int:
+        """Spawn the workers and wait until each has loaded the model; returns the embedding dim."""
+        with self._start_lock:
+            if self._workers:
+                return self.dim
+            started = time.time()
+            workers = [
+                _Worker(self._ctx, slot, self.model_source, self.max_batch, self.in_bytes, self.threads_per_worker)
+                for slot in range(self.num_workers)
+            ]
+            try:
+                for worker in workers:
+                    self.dim = worker.wait_ready(self.start_timeout)
+            except Exception:
+                for worker in workers:
+                    worker.stop()
+                raise
+            self._workers = workers
+        print(f"✅ {self.num_workers} embedding workers ready ({self.threads_per_worker} threads each) in {time.time() - started:.1f}s")
+        return self.dim
+
+    def _restart(self, worker: _Worker) -> None:
+        """Replace a dead worker's process; caller holds worker.lock."""
+        print(f"⚠️ Restarting embedding worker {worker.slot} (exit code {worker.process.exitcode})")
+        worker.stop()
+        worker.launch()
+        worker.wait_ready(self.start_timeout)
+        self.restarts += 1
+
+    def _acquire_least_loaded(self):
+        with self._dispatch_lock:
+            worker = min(self._workers, key=lambda w: w.pending)
+            worker.pending += 1
+            self._job_ids += 1
+            return worker, self._job_ids
+
+    def _chunks(self, encoded: List[bytes]) -> List[List[bytes]]:
+        """Split texts so each chunk fits both the batch size and the input buffer."""
+        capacity = self.in_bytes - (self.max_batch + 1) * 4
+        chunks: List[List[bytes]] = []
+        current: List[bytes] = []
+        size = 0
+        for data in encoded:
+            if current and (len(current) >= self.max_batch or size + len(data) > capacity):
+                chunks.append(current)
+                current, size = [], 0
+            current.append(data)
+            size += len(data)
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _run_chunk(self, chunk: List[bytes]) -> List[list]:
+        """Run a chunk on the least-loaded worker; if that worker is lost, retry once on a fresh pick."""
+        retried = False
+        while True:
+            worker, job_id = self._acquire_least_loaded()
+            try:
+                with worker.lock:
+                    if not worker.alive():
+                        self._restart(worker)
+                    try:
+                        return worker.run(job_id, chunk, self.job_timeout)
+                    except _WorkerLost as e:
+                        print(f"⚠️ {e}")
+                        self._restart(worker)
+                        if retried:
+                            raise RuntimeError(str(e)) from e
+            finally:
+                with self._dispatch_lock:
+                    worker.pending -= 1
+            retried = True
+
+    def encode(self, texts: List[str]) -> List[list]:
+        """Embed texts on the pool; large inputs are split across workers in parallel."""
+        if not self._workers:
+            self.start()
+        encoded = [t.encode("utf-8")[: self.max_text_bytes] for t in texts]
+        chunks = self._chunks(encoded)
+        if len(chunks) == 1:
+            return self._run_chunk(chunks[0])
+        vectors: List[list] = []
+        for result in self._executor.map(self._run_chunk, chunks):
+            vectors.extend(result)
+        return vectors
+
+    def close(self) -> None:
+        with self._dispatch_lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "alive": sum(1 for w in self._workers if w.alive()),
+            "restarts": self.restarts,
+            "pending": [w.pending for w in self._workers],
+            "jobs": [w.jobs for w in self._workers],
+            "dim": self.dim,
+        }
@@ -0,0 +1,165 @@
+# embedding_cache.py
+"""Persistent, content-addressed cache for text embeddings.
+
+Entries are keyed by (model name, hash of the normalized text). Lookups hit an
+hot tier first and then an on-disk SQLite tier that survives restarts, so
+repeated text never pays for a second embedding call. The hot tier is any
+cache_backends backend: a per-process LRU by default, or shared memory so all
+workers on a host share one copy. With dtype="float16" the disk tier stores
+half-size blobs; rows of either width are read back.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+
+from cache_backends import CacheBackend, MemoryBackend
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different inputs share one entry."""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _decode_blob(dim: int, blob: bytes) -> np.ndarray:
+    """Blob width tells float16 rows from float32 ones."""
+    dtype = np.float16 if len(blob) == dim * 2 else np.float32
+    return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: a hot key/value backend in front of SQLite."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_items: int = 10000,
+        dtype: str = "float32",
+        backend: Optional[CacheBackend] = None,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError("EmbeddingCache dtype must be float32 or float16")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.memory_items = memory_items
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # counters only; never held across I/O
+        self._db_lock = threading.Lock()  # the SQLite connection
+        self._memory = backend or MemoryBackend("embeddings", memory_items)  # float32 bytes per key
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " dim INTEGER NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory.set(key, vector.astype(np.float32, copy=False).tobytes())
+
+    @property
+    def hot_tier_in_memory(self) -> bool:
+        """True when hot-tier lookups are memory reads (memory/shm) that are safe on an event loop."""
+        return self._memory.kind != "sqlite"
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        vectors = self.get_hot_many(model, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            for i, vector in zip(missing, self.get_disk_many(model, [texts[i] for i in missing])):
+                vectors[i] = vector
+        return vectors
+
+    def get_hot_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Hot tier only; misses come back as None and are not counted (see get_disk_many)."""
+        vectors: List[Optional[List[float]]] = []
+        for text in texts:
+            blob = self._memory.get(cache_key(model, text))
+            vectors.append(None if blob is None else np.frombuffer(blob, dtype=np.float32).tolist())
+        hits = sum(1 for v in vectors if v is not None)
+        if hits:
+            with self._lock:
+                self.memory_hits += hits
+        return vectors
+
+    def get_disk_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """SQLite tier for hot-tier misses (blocking I/O: call it from a worker thread on the request path)."""
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        if self._db is not None:
+            with self._db_lock:
+                for i, text in enumerate(texts):
+                    key = cache_key(model, text)
+                    row = self._db.execute("SELECT dim, vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        vector = _decode_blob(row[0], row[1])
+                        self._remember(key, vector)
+                        vectors[i] = vector.tolist()
+        hits = sum(1 for v in vectors if v is not None)
+        with self._lock:
+            self.disk_hits += hits
+            self.misses += len(texts) - hits
+        return vectors
+
+    def put(self, model: str, text: str, vector) -> None:
+        self.put_many(model, [text], [vector])
+
+    def put_many(self, model: str, texts: List[str], vectors) -> None:
+        rows = []
+        for text, vector in zip(texts, vectors):
+            key = cache_key(model, text)
+            arr = np.asarray(vector, dtype=np.float32)
+            self._remember(key, arr)
+            rows.append((key, int(arr.shape[0]), arr.astype(self.dtype).tobytes(), time.time()))
+        if self._db is not None and rows:
+            with self._db_lock:
+                self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+
+    def stats(self, count_disk: bool = True) -> Dict[str, Any]:
+        """Counters and entry counts; count_disk=False skips the SQLite COUNT(*) (e.g. on a metrics scrape)."""
+        disk_entries = None
+        if self._db is not None and count_disk:
+            with self._db_lock:
+                disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_entries": self._memory.entries(),
+                "memory_backend": self._memory.kind,
+                "disk_entries": disk_entries,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._memory.close()
+            if self._db is not None:
+                self._db.close()
+                self._db = None
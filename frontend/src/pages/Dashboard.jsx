@@ -12,6 +12,22 @@ const DOC_OPTIONS = [
   { value: "d5.pdf", label: "Reliance General Policy" },
 ];
 
+const HISTORY_PAGE_SIZE = 20;
+
+// /history pages come newest-first; `next_cursor` fetches the page of older items.
+function historyToMessages(items) {
+  const historyMessages = [];
+  [...items].reverse().forEach((it) => {
+    historyMessages.push({ role: "user", content: it.query || "" });
+    const parts = [];
+    if (it.decision) parts.push(`Decision: ${it.decision}`);
+    if (it.amount) parts.push(`Amount: ${it.amount}`);
+    if (it.justification) parts.push(`Justification: ${it.justification}`);
+    historyMessages.push({ role: "assistant", content: parts.join("\n\n") || "No answer available." });
+  });
+  return historyMessages;
+}
+
 export default function Dashboard({ withBackground = true, compact = false }) {
   const user = getCurrentUser();
   const [query, setQuery] = useState("");
@@ -20,8 +36,7 @@ export default function Dashboard({ withBackground = true, compact = false }) {
   const [messages, setMessages] = useState([]); // {role:'user'|'assistant', content:string}
   const [loading, setLoading] = useState(false);
   const [loadingHistory, setLoadingHistory] = useState(false);
-  const [historyLimit, setHistoryLimit] = useState(20);
-  const [lastHistoryCount, setLastHistoryCount] = useState(0);
+  const [historyCursor, setHistoryCursor] = useState(null);
   const barRef = useRef(null);
   const chatRef = useRef(null);
 
@@ -95,21 +110,10 @@ export default function Dashboard({ withBackground = true, compact = false }) {
     try {
       setLoadingHistory(true);
       const res = await api.get(`/history/${encodeURIComponent(user.id)}`, {
-        params: { limit: historyLimit },
+        params: { limit: HISTORY_PAGE_SIZE },
       });
-      const items = res.data?.items || [];
-      const chronological = [...items].reverse();
-      const historyMessages = [];
-      chronological.forEach((it) => {
-        historyMessages.push({ role: "user", content: it.query || "" });
-        const parts = [];
-        if (it.decision) parts.push(`Decision: ${it.decision}`);
-        if (it.amount) parts.push(`Amount: ${it.amount}`);
-        if (it.justification) parts.push(`Justification: ${it.justification}`);
-        historyMessages.push({ role: "assistant", content: parts.join("\n\n") || "No answer available." });
-      });
-      setMessages(historyMessages);
-      setLastHistoryCount(items.length);
+      setMessages(historyToMessages(res.data?.items || []));
+      setHistoryCursor(res.data?.next_cursor || null);
       // After setting, scroll to bottom to see latest
       requestAnimationFrame(() => {
         if (chatRef.current) chatRef.current.scrollTop = chatRef.current.scrollHeight;
@@ -119,49 +123,37 @@ export default function Dashboard({ withBackground = true, compact = false }) {
     } finally {
       setLoadingHistory(false);
     }
-  }, [user?.id, historyLimit]);
+  }, [user?.id]);
 
   useEffect(() => {
     loadInitialHistory();
   }, [loadInitialHistory]);
 
-  // Infinite-like loading when scrolled to top: increase limit and refetch
+  // Infinite-like loading when scrolled to top: fetch the next older page and prepend it
   const onScrollTop = useCallback(async () => {
-    if (loading || loadingHistory) return;
+    if (loading || loadingHistory || !historyCursor) return;
     if (chatRef.current?.scrollTop <= 10 && user?.id) {
       try {
         setLoadingHistory(true);
-        const nextLimit = historyLimit + 20;
         const res = await api.get(`/history/${encodeURIComponent(user.id)}`, {
-          params: { limit: nextLimit },
+          params: { limit: HISTORY_PAGE_SIZE, before: historyCursor },
         });
         const items = res.data?.items || [];
-        if (items.length > lastHistoryCount) {
-          const chronological = [...items].reverse();
-          const historyMessages = [];
-          chronological.forEach((it) => {
-            historyMessages.push({ role: "user", content: it.query || "" });
-            const parts = [];
-            if (it.decision) parts.push(`Decision: ${it.decision}`);
-            if (it.amount) parts.push(`Amount: ${it.amount}`);
-            if (it.justification) parts.push(`Justification: ${it.justification}`);
-            historyMessages.push({ role: "assistant", content: parts.join("\n\n") || "No answer available." });
-          });
-          setMessages(historyMessages);
-          setHistoryLimit(nextLimit);
-          setLastHistoryCount(items.length);
+        if (items.length) {
+          setMessages((m) => [...historyToMessages(items), ...m]);
           // Keep near top after loading more
           requestAnimationFrame(() => {
             if (chatRef.current) chatRef.current.scrollTop = 20;
           });
         }
+        setHistoryCursor(res.data?.next_cursor || null);
       } catch (err) {
         // ignore
       } finally {
         setLoadingHistory(false);
       }
     }
-  }, [loading, loadingHistory, user?.id, historyLimit, lastHistoryCount]);
+  }, [loading, loadingHistory, user?.id, historyCursor]);
 
   useEffect(() => {
     const el = chatRef.current;
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# history_replay.py
+"""Cache warm-up and workload replay from `search_history`.
+
+Two uses of the queries real users already asked:
+
+- warm: an aggregation pipeline streams the most frequent (then most recent)
+  distinct queries of the last N days, and each one is run through the answer
+  pipeline at a fixed rate so the embedding and answer caches start warm. The
+  API does this at startup when CACHE_WARMUP_ON_START is set, and on demand
+  via POST /cache/warm (which this CLI calls):
+
+    python history_replay.py warm --url http://localhost:8000 --limit 200 --rate 2
+
+- replay: a captured time window is re-sent to a running instance as /run
+  requests, keeping the original inter-arrival times divided by --speed, for
+  capacity tests with a realistic query mix:
+
+    python history_replay.py replay --url http://localhost:8000 \\
+        --start 2025-01-10T09:00 --end 2025-01-10T10:00 --speed 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+REPLAY_USER_ID = "replay"  # replayed queries are recorded under this user and never replayed or warmed again
+
+
+def top_queries_pipeline(since: datetime, limit: int) -> List[Dict[str, Any]]:
+    """Distinct queries since `since`, most frequent first, then most recently asked."""
+    return [
+        {"$match": {
+            "created_at": {"$gte": since},
+            "query": {"$type": "string", "$ne": ""},
+            "user_id": {"$ne": REPLAY_USER_ID},
+        }},
+        {"$group": {
+            "_id": {"$toLower": {"$trim": {"input": "$query"}}},
+            "query": {"$first": "$query"},
+            "count": {"$sum": 1},
+            "last_seen": {"$max": "$created_at"},
+        }},
+        {"$sort": {"count": -1, "last_seen": -1}},
+        {"$limit": limit},
+    ]
+
+
+async def stream_top_queries(collection, days: float, limit: int) -> AsyncIterator[Dict[str, Any]]:
+    since = datetime.utcnow() - timedelta(days=days)
+    cursor = collection.aggregate(top_queries_pipeline(since, limit), allowDiskUse=True, batchSize=100)
+    async for row in cursor:
+        yield {"query": row["query"], "count": row["count"], "last_seen": row["last_seen"]}
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second (rate <= 0 means unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+async def warm_from_history(
+    collection,
+    precompute: Callable[[str], Awaitable[Any]],
+    limit: int = 200,
+    days: float = 7.0,
+    rate: float = 2.0,
+    status: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Run precompute(query) for the top historical queries at `rate` per second.
+
+    `status` (if given) is updated in place so callers can report progress."""
+    status = status if status is not None else {}
+    status.update(state="running", warmed=0, failed=0, limit=limit, started_at=datetime.utcnow().isoformat())
+    started = time.time()
+    limiter = RateLimiter(rate)
+    try:
+        async for row in stream_top_queries(collection, days, limit):
+            await limiter.wait()
+            try:
+                await precompute(row["query"])
+                status["warmed"] += 1
+            except Exception as e:
+                status["failed"] += 1
+                status["last_error"] = str(e)[:200]
+    except Exception as e:
+        status.update(state="failed", error=str(e)[:200], seconds=round(time.time() - started, 1))
+        print("⚠️ Cache warm-up aborted:", e)
+        return status
+    status.update(state="done", seconds=round(time.time() - started, 1))
+    print(f"🔥 Cache warm-up done: {status['warmed']} queries in {status['seconds']}s ({status['failed']} failed)")
+    return status
+
+
+async def stream_window(collection, start: datetime, end: datetime) -> AsyncIterator[Dict[str, Any]]:
+    cursor = collection.find(
+        {"created_at": {"$gte": start, "$lt": end}, "user_id": {"$ne": REPLAY_USER_ID}}, {"_id": 0, "query": 1, "created_at": 1}
+    ).sort("created_at", 1).batch_size(500)
+    async for doc in cursor:
+        if doc.get("query"):
+            yield doc
+
+
+async def replay_window(
+    collection,
+    url: str,
+    start: datetime,
+    end: datetime,
+    speed: float = 1.0,
+    max_inflight: int = 256,
+    user_id: str = REPLAY_USER_ID,
+    timeout: float = 60.0,
+) -> Dict[str, Any]:
+    """Re-send every query in [start, end) to url/run at speed x the original pace."""
+    import httpx
+
+    from metrics import percentiles
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    lags: List[float] = []
+    slots = asyncio.Semaphore(max_inflight)
+    tasks = set()
+
+    async def send(client: httpx.AsyncClient, query: str) -> None:
+        sent = time.perf_counter()
+        try:
+            resp = await client.post("/run", json={"query": query, "user_id": user_id})
+            key = str(resp.status_code)
+        except Exception as e:
+            key = type(e).__name__
+        latencies.append((time.perf_counter() - sent) * 1000)
+        statuses[key] = statuses.get(key, 0) + 1
+        slots.release()
+
+    limits = httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        wall_start = time.monotonic()
+        first: Optional[datetime] = None
+        async for doc in stream_window(collection, start, end):
+            first = first or doc["created_at"]
+            due = wall_start + (doc["created_at"] - first).total_seconds() / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            lags.append(max(0.0, time.monotonic() - due) * 1000)  # how far behind schedule we fell
+            task = asyncio.create_task(send(client, doc["query"]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - wall_start
+
+    total = len(latencies)
+    return {
+        "window": [start.isoformat(), end.isoformat()],
+        "speed": speed,
+        "requests": total,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "statuses": statuses,
+        "latency_ms": percentiles(latencies),
+        "schedule_lag_ms": percentiles(lags),
+    }
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Warm caches from, or replay, search_history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("warm", help="Ask a running API to pre-compute its top historical queries")
+    warm.add_argument("--url", default="http://localhost:8000")
+    warm.add_argument("--limit", type=int, default=200)
+    warm.add_argument("--days", type=float, default=7.0)
+    warm.add_argument("--rate", type=float, default=2.0, help="Queries per second")
+    warm.add_argument("--embeddings-only", action="store_true", help="Skip the LLM; only warm embeddings")
+    replay = sub.add_parser("replay", help="Replay a captured window against a running API")
+    replay.add_argument("--url", default="http://localhost:8000")
+    replay.add_argument("--start", type=_parse_time, required=True, help="ISO time (UTC), inclusive")
+    replay.add_argument("--end", type=_parse_time, required=True, help="ISO time (UTC), exclusive")
+    replay.add_argument("--speed", type=float, default=1.0, help="1 = original pace, 4 = four times faster")
+    replay.add_argument("--max-inflight", type=int, default=256)
+    replay.add_argument("--output", help="Write JSON results to this path")
+    args = parser.parse_args()
+
+    if args.command == "warm":
+        import httpx
+
+        resp = httpx.post(f"{args.url}/cache/warm", json={
+            "limit": args.limit, "days": args.days, "rate": args.rate, "answers": not args.embeddings_only,
+        }, timeout=30.0)
+        print(resp.status_code, json.dumps(resp.json(), indent=2))
+        return
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        parser.error("MONGO_URI is required for replay")
+    client = AsyncIOMotorClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    collection = client.get_database("bajaj_app").get_collection("search_history")
+    try:
+        results = asyncio.run(replay_window(
+            collection, args.url, args.start, args.end,
+            speed=args.speed, max_inflight=args.max_inflight,
+        ))
+    finally:
+        client.close()
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
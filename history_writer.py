@@ -0,0 +1,285 @@
+# history_writer.py
+"""Write-behind persistence for search history.
+
+Requests hand their history document to `HistoryWriter.submit()`, which only
+enqueues it. A background task drains the queue and writes with `insert_many`
+once `batch_size` documents are waiting or `flush_interval` seconds have
+passed. If Mongo rejects a batch, the unwritten documents are appended to a
+local JSONL spill file, which is replayed once writes succeed again (and on
+the next startup). Workers sharing one spill file take turns replaying it under
+a file lock; lines that cannot be parsed (e.g. torn by a crash mid-write) are
+moved to `<spill>.bad` instead of blocking the replay. On a full queue the writer either drops the document or
+blocks the caller for up to `block_timeout` seconds, depending on `overflow`.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker dev setups, nothing to coordinate with
+    fcntl = None
+
+_DATETIME_KEY = "__datetime__"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {_DATETIME_KEY: value.isoformat()}
+    return str(value)
+
+
+def _decode(obj: Dict[str, Any]):
+    if len(obj) == 1 and _DATETIME_KEY in obj:
+        return datetime.fromisoformat(obj[_DATETIME_KEY])
+    return obj
+
+
+class HistoryWriter:
+    def __init__(
+        self,
+        insert_many: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+        spill_path: Optional[str] = None,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        overflow: str = "drop",
+        block_timeout: float = 5.0,
+        replay_interval: float = 30.0,
+    ):
+        if overflow not in ("drop", "block"):
+            raise ValueError("overflow must be 'drop' or 'block'")
+        self.insert_many = insert_many
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.replay_interval = replay_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._inflight: List[Dict[str, Any]] = []
+        self._next_replay = 0.0
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.corrupt = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        if spill_path:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+
+    def start(self) -> None:
+        """Start the background flusher; must be called from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, doc: Dict[str, Any]) -> bool:
+        """Queue one document. Returns False when it was dropped."""
+        if self._closing:
+            self._spill([doc])
+            return False
+        try:
+            self._queue.put_nowait(doc)
+        except asyncio.QueueFull:
+            if self.overflow == "drop":
+                self.dropped += 1
+                return False
+            try:
+                await asyncio.wait_for(self._queue.put(doc), timeout=self.block_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                return False
+        self.enqueued += 1
+        return True
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """Wait for the first document, then gather more until the batch fills or the interval ends.
+
+        The batch is tracked as in-flight from the first document on, so close() waits for it."""
+        batch = self._inflight = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if self._closing:
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        await self._safe_replay()
+        while True:
+            try:
+                self._inflight = await self._next_batch()
+                ok = await self._write(self._inflight)
+                self._inflight = []
+                if ok and not self._closing and time.monotonic() >= self._next_replay:
+                    await self._safe_replay()
+            except Exception as e:
+                # e.g. the spill file's disk is full; keep flushing what arrives next
+                self._inflight = []
+                self.last_error = str(e)[:200]
+                print("⚠️ History flusher error:", e)
+                await asyncio.sleep(min(1.0, self.flush_interval))
+
+    async def _safe_replay(self) -> None:
+        # A failing replay must not kill the flusher: live documents keep being written.
+        try:
+            await self.replay()
+        except Exception as e:
+            self.last_error = str(e)[:200]
+            self._next_replay = time.monotonic() + self.replay_interval
+            print("⚠️ History spill replay failed:", e)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            await self.insert_many(batch)
+        except Exception as e:
+            # With ordered inserts, the first nInserted documents are already stored.
+            details = getattr(e, "details", None) or {}
+            inserted = int(details.get("nInserted", 0))
+            self.written += inserted
+            self.failures += 1
+            self.last_error = str(e)[:200]
+            self._next_replay = time.monotonic() + self.replay_interval
+            print(f"⚠️ History batch write failed ({len(batch) - inserted} docs spilled):", e)
+            self._spill(batch[inserted:])
+            return False
+        self.written += len(batch)
+        self.batches += 1
+        return True
+
+    def _spill(self, docs: List[Dict[str, Any]]) -> None:
+        if not docs:
+            return
+        if not self.spill_path:
+            self.dropped += len(docs)
+            return
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            for doc in docs:
+                doc = {k: v for k, v in doc.items() if k != "_id"}
+                f.write(json.dumps(doc, default=_encode) + "\n")
+        self.spilled += len(docs)
+
+    def _lock_replay(self) -> Optional[int]:
+        """Take the spill file's replay lock without waiting; None when another worker holds it."""
+        fd = os.open(self.spill_path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return None
+        return fd
+
+    def _quarantine(self, line: str) -> None:
+        with open(self.spill_path + ".bad", "a", encoding="utf-8") as f:
+            f.write(line if line.endswith("\n") else line + "\n")
+        self.corrupt += 1
+
+    async def replay(self) -> int:
+        """Re-insert spilled documents; anything that fails again stays spilled."""
+        self._next_replay = time.monotonic() + self.replay_interval
+        if not self.spill_path:
+            return 0
+        replay_path = self.spill_path + ".replay"
+        if not os.path.exists(self.spill_path) and not os.path.exists(replay_path):
+            return 0
+        lock = self._lock_replay()
+        if lock is None:
+            return 0  # another worker is replaying the shared spill file
+        try:
+            return await self._replay_locked(replay_path)
+        finally:
+            os.close(lock)  # releases the flock
+
+    async def _replay_locked(self, replay_path: str) -> int:
+        if not os.path.exists(replay_path):
+            try:
+                os.replace(self.spill_path, replay_path)
+            except FileNotFoundError:
+                return 0
+        replayed = 0
+        failed = False
+        batch: List[Dict[str, Any]] = []
+        with open(replay_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(json.loads(line, object_hook=_decode))
+                except ValueError:
+                    self._quarantine(line)
+                    continue
+                if len(batch) < self.batch_size:
+                    continue
+                if failed:
+                    self._spill(batch)
+                elif await self._write(batch):  # a failed batch is spilled by _write
+                    replayed += len(batch)
+                else:
+                    failed = True
+                batch = []
+        if batch:
+            if failed:
+                self._spill(batch)
+            elif await self._write(batch):
+                replayed += len(batch)
+        os.remove(replay_path)
+        self.replayed += replayed
+        if replayed:
+            print(f"✅ Replayed {replayed} spilled history records")
+        return replayed
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Flush everything still queued; whatever cannot be written in time is spilled."""
+        self._closing = True
+        pending = self._queue.qsize() + len(self._inflight)
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print("⚠️ History flush timed out on shutdown; spilling the rest")
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        leftover = list(self._inflight)
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        self._inflight = []
+        self._spill(leftover)
+        if pending:
+            print(f"💾 Drained {pending - len(leftover)} queued history records on shutdown")
+
+    async def _drain(self) -> None:
+        while self._task is not None and (self._queue.qsize() or self._inflight):
+            await asyncio.sleep(0.02)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "corrupt": self.corrupt,
+            "failures": self.failures,
+            "overflow": self.overflow,
+            "last_error": self.last_error,
+        }
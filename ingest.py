@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# ingest.py
+"""Streaming PDF ingestion: page-by-page extraction, overlapping chunks,
+hash de-duplication, batched embeddings and bounded concurrent upserts.
+
+Progress is checkpointed per page group under INGEST_STATE_DIR, so a crashed
+run resumes where it stopped and re-ingesting an unchanged document is a no-op.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Iterator, Tuple, Callable
+
+from embedding_cache import normalize_text
+
+DEFAULT_CHUNK_SIZE = 1200  # characters
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_EMBED_BATCH = 128  # chunks per embedding call
+DEFAULT_UPSERT_BATCH = 100  # vectors per upsert request
+DEFAULT_UPSERT_CONCURRENCY = 4
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_pdf_pages(path: str, start: int = 0) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) one page at a time."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+
+    if PdfReader is not None:
+        reader = PdfReader(path)
+        for page_no in range(start, len(reader.pages)):
+            yield page_no, reader.pages[page_no].extract_text() or ""
+        return
+
+    try:
+        import fitz  # pymupdf
+    except ImportError as e:
+        raise RuntimeError("PDF ingestion requires 'pypdf' (or 'pymupdf') to be installed") from e
+    with fitz.open(path) as doc:
+        for page_no in range(start, doc.page_count):
+            yield page_no, doc.load_page(page_no).get_text() or ""
+
+
+def chunk_page(text: str, carry: str, chunk_size: int, overlap: int) -> Tuple[List[str], str]:
+    """Split one page (prefixed with the previous page's tail) into overlapping chunks.
+
+    Returns the chunks and the tail to carry into the next page.
+    """
+    text = normalize_text(text)
+    if not text:
+        return [], carry
+    combined = f"{carry} {text}".strip() if carry else text
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for start in range(0, len(combined), step):
+        piece = combined[start : start + chunk_size].strip()
+        if piece:
+            chunks.append(piece)
+        if start + chunk_size >= len(combined):
+            break
+    return chunks, combined[-overlap:] if overlap else ""
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class IngestCheckpoint:
+    """Per-document progress record stored as a small JSON file.
+
+    The record also holds the scope (policy_id, tenant, namespace) the chunks
+    were tagged with. When a document comes back under a different scope the
+    old progress is discarded, so it is re-ingested (re-tagged) from page one
+    rather than skipped or resumed with mixed tags."""
+
+    def __init__(self, state_dir: str, doc_hash: str, scope: Optional[Dict[str, Any]] = None):
+        os.makedirs(state_dir, exist_ok=True)
+        self.path = os.path.join(state_dir, f"{doc_hash}.json")
+        self.data: Dict[str, Any] = {"doc_hash": doc_hash, "pages_done": 0, "chunks": 0, "complete": False, "scope": scope}
+        self.rescoped = False
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("scope") == scope:
+                self.data.update(saved)
+            else:
+                self.rescoped = True
+
+    def save(self, **updates) -> None:
+        self.data.update(updates)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(tmp, self.path)
+
+
+def ingest_pdf(
+    path: str,
+    embed_batch: Callable[[List[str]], List[list]],
+    index,
+    source: Optional[str] = None,
+    state_dir: str = ".cache/ingest",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overlap: int = DEFAULT_CHUNK_OVERLAP,
+    embed_batch_size: int = DEFAULT_EMBED_BATCH,
+    upsert_batch_size: int = DEFAULT_UPSERT_BATCH,
+    upsert_concurrency: int = DEFAULT_UPSERT_CONCURRENCY,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    on_records: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+    policy_id: Optional[str] = None,
+    tenant: Optional[str] = None,
+    namespace: str = "",
+) -> Dict[str, Any]:
+    """Stream a PDF into the vector index and return a summary.
+
+    Chunks are tagged with policy_id (default: the document id) and tenant so
+    retrieval can be scoped, and upserted into `namespace`.
+    on_records receives each upserted batch (e.g. to update the lexical index)."""
+    started = time.time()
+    doc_hash = file_sha256(path)
+    doc_id = doc_hash[:16]
+    policy_id = policy_id or doc_id
+    source = source or os.path.basename(path)
+    tags = {"policy_id": policy_id, **({"tenant": tenant} if tenant else {})}
+    checkpoint = IngestCheckpoint(state_dir, doc_hash, {"policy_id": policy_id, "tenant": tenant, "namespace": namespace})
+    if checkpoint.data["complete"]:
+        print(f"✅ '{source}' unchanged since last ingestion; skipping")
+        return {"doc_id": doc_id, "policy_id": policy_id, "tenant": tenant, "namespace": namespace,
+                "source": source, "skipped": True, "chunks": checkpoint.data["chunks"],
+                "pages": checkpoint.data["pages_done"], "seconds": round(time.time() - started, 3)}
+    if checkpoint.rescoped:
+        print(f"🏷️ '{source}' was ingested under another policy/tenant/namespace; re-ingesting from page 1")
+
+    resume_from = checkpoint.data["pages_done"]
+    if resume_from:
+        print(f"🔁 Resuming '{source}' from page {resume_from + 1}")
+
+    seen: set = set()
+    totals = {"chunks": checkpoint.data["chunks"], "duplicates": 0}
+    pending: List[Tuple[int, int, str]] = []  # (page, chunk_no, text)
+    carry = ""
+
+    def report(page_no: int) -> None:
+        info = {"doc_id": doc_id, "source": source, "pages_done": page_no + 1, **totals}
+        if progress is not None:
+            progress(info)
+        print(f"📄 {source}: {page_no + 1} pages, {totals['chunks']} chunks upserted")
+
+    with ThreadPoolExecutor(max_workers=upsert_concurrency) as pool:
+
+        def flush(last_page: int) -> None:
+            if pending:
+                texts = [text for _, _, text in pending]
+                vectors = []
+                for start in range(0, len(texts), embed_batch_size):
+                    vectors.extend(embed_batch(texts[start : start + embed_batch_size]))
+                records = [
+                    {
+                        "id": f"{doc_id}-{chunk_hash(text)[:24]}",
+                        "values": vector,
+                        "metadata": {"text": text, "source": source, "doc_id": doc_id, "page": page + 1, "chunk": n, **tags},
+                    }
+                    for (page, n, text), vector in zip(pending, vectors)
+                ]
+                futures = [
+                    pool.submit(index.upsert, vectors=records[start : start + upsert_batch_size], namespace=namespace)
+                    for start in range(0, len(records), upsert_batch_size)
+                ]
+                for future in futures:
+                    future.result()
+                if on_records is not None:
+                    on_records(records)
+                totals["chunks"] += len(records)
+                pending.clear()
+                if hasattr(index, "flush"):
+                    index.flush()  # the local index batches its flushes; make the pages durable before checkpointing
+            checkpoint.save(pages_done=last_page + 1, chunks=totals["chunks"])
+            report(last_page)
+
+        if resume_from:
+            # Rebuild the overlap carried in from the last finished page
+            for _, text in iter_pdf_pages(path, start=resume_from - 1):
+                _, carry = chunk_page(text, "", chunk_size, overlap)
+                break
+
+        last_page = resume_from - 1
+        chunk_no = 0
+        for page_no, text in iter_pdf_pages(path, start=resume_from):
+            chunks, carry = chunk_page(text, carry, chunk_size, overlap)
+            for chunk in chunks:
+                digest = chunk_hash(chunk)
+                if digest in seen:
+                    totals["duplicates"] += 1
+                    continue
+                seen.add(digest)
+                pending.append((page_no, chunk_no, chunk))
+                chunk_no += 1
+            last_page = page_no
+            if len(pending) >= embed_batch_size:
+                flush(page_no)
+        flush(last_page)
+
+    checkpoint.save(complete=True)
+    summary = {"doc_id": doc_id, "policy_id": policy_id, "tenant": tenant, "namespace": namespace,
+               "source": source, "skipped": False, "pages": checkpoint.data["pages_done"],
+               "seconds": round(time.time() - started, 3), **totals}
+    print(f"✅ Ingested '{source}': {summary['chunks']} chunks in {summary['seconds']}s")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest policy PDFs into the vector index")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--embed-batch", type=int, default=DEFAULT_EMBED_BATCH)
+    parser.add_argument("--upsert-concurrency", type=int, default=DEFAULT_UPSERT_CONCURRENCY)
+    parser.add_argument("--space", choices=("openai", "local"), help="Embedding space to ingest into (default: active)")
+    parser.add_argument("--policy-id", help="Policy the PDFs belong to, for scoped retrieval (default: each document's content hash)")
+    parser.add_argument("--tenant", help="Insurer/tenant the policy belongs to")
+    args = parser.parse_args()
+
+    import query_api
+
+    for pdf in args.pdfs:
+        query_api.ingest_document(
+            pdf,
+            chunk_size=args.chunk_size,
+            overlap=args.overlap,
+            embed_batch_size=args.embed_batch,
+            upsert_concurrency=args.upsert_concurrency,
+            space=args.space,
+            policy_id=args.policy_id,
+            tenant=args.tenant,
+        )
+
+
+if __name__ == "__main__":
+    main()
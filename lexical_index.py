@@ -0,0 +1,282 @@
+# lexical_index.py
+"""Local BM25 inverted index over chunk texts, for hybrid retrieval.
+
+Chunks are added with the same ids and metadata that go to the vector index,
+so lexical and vector hits can be fused by id. Everything lives in one SQLite
+file: a docs table (text, length, metadata), a `terms` table with document
+frequencies and a clustered `postings` table keyed by (term, doc), which keeps
+each term's postings contiguous on disk. Adding a chunk that already exists
+replaces its postings, so the index is updated incrementally during ingestion.
+
+Each doc also records its `policy_id` metadata, so a search can be scoped to a
+set of policies (the same scope the vector query uses).
+
+Several processes (uvicorn workers, the ingest CLI) may share the file: writes
+re-read the collection statistics inside their write transaction, and searches
+reload them when `PRAGMA data_version` says another connection has committed.
+
+Tokens keep clause numbers ("4.2") and hyphenated terms ("co-pay", also
+indexed as "copay") intact, because those are what insurance questions hinge on.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+_TOKEN = re.compile(r"\d+(?:\.\d+)+|[a-z0-9]+(?:-[a-z0-9]+)*")
+_IDENTIFIER = re.compile(r"^\d+(?:\.\d+)+$")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or that the this to was what when "
+    "which who will with does do can if my me our your any all under than then there these those".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token:
+            tokens.append(token.replace("-", ""))
+        elif len(token) > 4 and token.endswith("ies"):
+            tokens[-1] = token[:-3] + "y"  # crude plural folding: "policies" -> "policy"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss") and not token[0].isdigit():
+            tokens[-1] = token[:-1]  # "claims" -> "claim"
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.searches = 0
+        self.confident_hits = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " doc INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL,"
+            " text TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, doc)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL);"
+            "INSERT OR IGNORE INTO meta VALUES ('docs', 0), ('total_length', 0);"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(docs)")}
+        if "policy_id" not in columns:  # indexes built before scoped retrieval
+            self._db.execute("ALTER TABLE docs ADD COLUMN policy_id TEXT")
+            self._db.execute("UPDATE docs SET policy_id = COALESCE(json_extract(metadata, '$.policy_id'), json_extract(metadata, '$.doc_id'))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS docs_policy ON docs (policy_id)")
+        self._version: Optional[int] = None
+        self._load_meta()
+
+    def _load_meta(self) -> None:
+        meta = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        self._docs = int(meta["docs"])
+        self._total_length = int(meta["total_length"])
+
+    def _refresh_meta(self) -> None:
+        """Reload the statistics if another connection committed since the last load (caller holds the lock)."""
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            self._load_meta()
+            self._version = version
+
+    def _remove(self, doc: int, length: int) -> None:
+        terms = [row[0] for row in self._db.execute("SELECT term FROM postings WHERE doc = ?", (doc,))]
+        self._db.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(t,) for t in terms])
+        self._db.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+        self._db.execute("DELETE FROM docs WHERE doc = ?", (doc,))
+        self._docs -= 1
+        self._total_length -= length
+
+    def add(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Index [{"id", "metadata": {"text", ...}}] records; existing ids are replaced."""
+        added = 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._load_meta()  # another process may have added docs since our last read
+                for record in records:
+                    metadata = dict(record.get("metadata") or {})
+                    text = metadata.pop("text", None)
+                    if not text:
+                        continue
+                    existing = self._db.execute("SELECT doc, length FROM docs WHERE id = ?", (record["id"],)).fetchone()
+                    if existing is not None:
+                        self._remove(*existing)
+                    counts = Counter(tokenize(text))
+                    length = sum(counts.values())
+                    doc = self._db.execute(
+                        "INSERT INTO docs (id, length, text, metadata, policy_id) VALUES (?, ?, ?, ?, ?)",
+                        (record["id"], length, text, json.dumps(metadata), metadata.get("policy_id") or metadata.get("doc_id")),
+                    ).lastrowid
+                    self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)", [(t, doc, n) for t, n in counts.items()])
+                    self._db.executemany(
+                        "INSERT INTO terms VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                        [(t,) for t in counts],
+                    )
+                    self._docs += 1
+                    self._total_length += length
+                    added += 1
+                self._db.execute("DELETE FROM terms WHERE df <= 0")
+                self._db.executemany(
+                    "UPDATE meta SET value = ? WHERE key = ?",
+                    [(self._docs, "docs"), (self._total_length, "total_length")],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                self._load_meta()
+                raise
+        return added
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._load_meta()
+            for vid in ids:
+                existing = self._db.execute("SELECT doc, length FROM docs WHERE id = ?", (vid,)).fetchone()
+                if existing is not None:
+                    self._remove(*existing)
+            self._db.execute("DELETE FROM terms WHERE df <= 0")
+            self._db.executemany(
+                "UPDATE meta SET value = ? WHERE key = ?",
+                [(self._docs, "docs"), (self._total_length, "total_length")],
+            )
+            self._db.execute("COMMIT")
+
+    def search(self, query: str, top_k: int = 5, policy_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """BM25 top_k as [{"id", "text", "score", "metadata"}], optionally only over the given policies."""
+        terms = set(tokenize(query))
+        sql = "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.doc = p.doc WHERE p.term = ?"
+        scope: tuple = ()
+        if policy_ids is not None:
+            if not policy_ids:
+                return []
+            sql += f" AND d.policy_id IN ({', '.join('?' * len(policy_ids))})"
+            scope = tuple(policy_ids)
+        postings = []
+        with self._lock:
+            self.searches += 1
+            self._refresh_meta()
+            if not terms or not self._docs:
+                return []
+            docs, avg_length = self._docs, self._total_length / self._docs
+            for term in terms:
+                row = self._db.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+                if row is not None:
+                    postings.append((row[0], self._db.execute(sql, (term,) + scope).fetchall()))
+        # Score without the lock, so concurrent searches only serialize on SQLite reads
+        scores: Dict[int, float] = {}
+        for df, rows in postings:
+            idf = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+            for doc, tf, length in rows:
+                norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / norm
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        matches = []
+        with self._lock:
+            for doc, score in best:
+                row = self._db.execute("SELECT id, text, metadata FROM docs WHERE doc = ?", (doc,)).fetchone()
+                if row is None:
+                    continue  # replaced or deleted since its postings were read
+                vid, text, metadata = row
+                matches.append({"id": vid, "text": text, "score": score, "metadata": {**json.loads(metadata), "text": text}})
+        return matches
+
+    def is_confident(self, query: str, matches: List[Dict[str, Any]], margin: float = 1.5) -> bool:
+        """An exact-match hit: the top chunk contains every key query term (its clause numbers,
+        or all its terms when it has none) and clearly outscores the runner-up."""
+        if not matches:
+            return False
+        terms = set(tokenize(query))
+        key_terms = {t for t in terms if _IDENTIFIER.match(t)} or terms
+        if not key_terms or not key_terms <= set(tokenize(matches[0]["text"])):
+            return False
+        if len(matches) > 1 and matches[0]["score"] < margin * matches[1]["score"]:
+            return False
+        with self._lock:
+            self.confident_hits += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_meta()
+            terms = self._db.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+            return {
+                "docs": self._docs,
+                "terms": terms,
+                "avg_length": round(self._total_length / self._docs, 1) if self._docs else 0.0,
+                "searches": self.searches,
+                "confident_hits": self.confident_hits,
+                "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], top_k: int, k: int = 60) -> List[Dict[str, Any]]:
+    """Fuse ranked [{"id", ...}] lists; each match's score becomes its summed 1/(k + rank)."""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, match in enumerate(results, start=1):
+            entry = fused.setdefault(match["id"], {**match, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda m: m["score"], reverse=True)[:top_k]
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build or query the local BM25 index")
+    parser.add_argument("command", choices=["build", "search", "stats"])
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--path", default=os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical.sqlite3"))
+    parser.add_argument("--space", choices=("openai", "local"), help="Vector index to build from (default: active)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--policy", action="append", help="Only search these policy ids (repeatable)")
+    args = parser.parse_args()
+
+    index = BM25Index(args.path)
+    if args.command == "build":
+        import query_api
+        from migrate_embeddings import iter_chunks, list_namespaces
+
+        total = 0
+        vector_index = query_api.init_vector_backend(args.space)
+        for namespace in list_namespaces(vector_index):
+            for batch in iter_chunks(vector_index, namespace=namespace):
+                total += index.add(batch)
+                print(f"📚 Indexed {total} chunks")
+        print(f"✅ Lexical index at {args.path}: {index.stats()}")
+    elif args.command == "search":
+        if not args.query:
+            parser.error("search needs a query")
+        matches = index.search(args.query, args.top_k, args.policy)
+        for match in matches:
+            print(f"{match['score']:.3f}  {match['id']}  {match['text'][:100]}")
+        print("confident exact match" if index.is_confident(args.query, matches) else "no confident exact match")
+    else:
+        print(index.stats())
+
+
+if __name__ == "__main__":
+    main()
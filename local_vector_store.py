@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+# local_vector_store.py
+"""In-process vector search engine, usable as a drop-in for the Pinecone index.
+
+Vectors are stored L2-normalized in a memory-mapped matrix on disk (float32,
+or float16/int8 via vector_codec to cut storage 2-4x), so cosine search is one
+batched matmul. For large corpora an optional IVF (inverted file) mode
+partitions the rows with k-means and only scores the closest partitions. `query()` returns the same `matches`/`metadata` shape as
+`pinecone.Index.query`, and snapshots can be exported from / imported into
+Pinecone.
+
+Queries only hold the index lock while they snapshot the matrix view, row
+count and candidate rows; scoring runs unlocked, so concurrent queries (each
+on its own thread) do not serialize. Growing the matrix writes a new file and
+swaps it in, so a snapshot taken before the swap stays readable. Writes append
+to records.jsonl at once, but the manifest and IVF file are rewritten at most
+every `flush_interval` seconds (and on flush()/close()); after a crash the
+index reopens at the last flush.
+
+Like Pinecone, records live in namespaces and queries take a metadata filter
+($eq / $in on plain values). Rows are indexed by namespace and by the
+FILTER_FIELDS metadata values, so a scoped query only scores the rows of its
+scope instead of the whole matrix.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+
+import numpy as np
+
+from vector_codec import check_dtype, numpy_dtype, quantize, dequantize, scores as score_rows
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"  # per-row scales, int8 storage only
+RECORDS_FILE = "records.jsonl"
+IVF_FILE = "ivf.npz"
+FILTER_FIELDS = ("policy_id", "tenant", "doc_id", "source")  # metadata values with a row index
+
+
+def _record_key(namespace: str, vid: str) -> str:
+    return f"{namespace}\x00{vid}" if namespace else vid
+
+
+def _filter_values(condition) -> List[Any]:
+    """Accepted values of one filter condition: a value, {"$eq": v} or {"$in": [...]}."""
+    if not isinstance(condition, dict):
+        return [condition]
+    if set(condition) == {"$eq"}:
+        return [condition["$eq"]]
+    if set(condition) == {"$in"}:
+        return list(condition["$in"])
+    raise ValueError(f"Unsupported filter condition {condition!r} (use a value, $eq or $in)")
+
+
+def _replace_unmapped(src: str, dst: str, attempts: int = 100) -> None:
+    """os.replace, retried while Windows reports the target in use (a query still scoring a
+    snapshot of the old file keeps it mapped for a few milliseconds). POSIX never retries."""
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.01)
+
+
+class LocalVectorIndex:
+    """Exact (or IVF-partitioned) cosine search over a memory-mapped matrix."""
+
+    def __init__(
+        self,
+        path: str,
+        dim: int,
+        ivf_lists: int = 0,
+        nprobe: int = 8,
+        initial_capacity: int = 1024,
+        dtype: str = "float32",
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self.dim = dim
+        self.dtype = check_dtype(dtype)
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._ids: List[Optional[str]] = []
+        self._namespaces: List[str] = []
+        self._metadata: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}  # record key (namespace + id) -> row
+        self._postings: Dict[Tuple[str, Any], set] = {}  # ("namespace" or field, value) -> live rows
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        os.makedirs(path, exist_ok=True)
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        if os.path.exists(manifest_path) and os.path.exists(vectors_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["dim"] != dim:
+                raise ValueError(f"Local index at {path} has dim {manifest['dim']}, expected {dim}")
+            stored_dtype = manifest.get("dtype", "float32")
+            if stored_dtype != self.dtype:
+                raise ValueError(
+                    f"Local index at {path} stores {stored_dtype}, expected {self.dtype} "
+                    f"(convert it with `python local_vector_store.py convert`)"
+                )
+            self._count = manifest["count"]
+            self._matrix = np.load(vectors_path, mmap_mode="r+")
+            if self.dtype == "int8":
+                self._scales = np.load(os.path.join(path, SCALES_FILE), mmap_mode="r+")
+            self._load_records()
+            self._load_ivf()
+        else:
+            self._count = 0
+            self._matrix = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=numpy_dtype(self.dtype), shape=(initial_capacity, dim)
+            )
+            if self.dtype == "int8":
+                self._scales = np.lib.format.open_memmap(
+                    os.path.join(path, SCALES_FILE), mode="w+", dtype=np.float32, shape=(initial_capacity,)
+                )
+            self._write_manifest()
+
+    # --- persistence ---
+    def _write_manifest(self) -> None:
+        tmp = os.path.join(self.path, MANIFEST_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self._count, "dtype": self.dtype}, f)
+        os.replace(tmp, os.path.join(self.path, MANIFEST_FILE))
+
+    def _index_row(self, row: int, namespace: str, metadata: Optional[Dict[str, Any]]) -> None:
+        self._postings.setdefault(("namespace", namespace), set()).add(row)
+        for field in FILTER_FIELDS:
+            value = (metadata or {}).get(field)
+            if value is not None:
+                self._postings.setdefault((field, value), set()).add(row)
+
+    def _unindex_row(self, row: int) -> None:
+        for field, value in [("namespace", self._namespaces[row])] + [
+            (field, (self._metadata[row] or {}).get(field)) for field in FILTER_FIELDS
+        ]:
+            rows = self._postings.get((field, value))
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._postings[(field, value)]
+
+    def _load_records(self) -> None:
+        self._ids = [None] * self._count
+        self._namespaces = [""] * self._count
+        self._metadata = [None] * self._count
+        records_path = os.path.join(self.path, RECORDS_FILE)
+        if not os.path.exists(records_path):
+            return
+        with open(records_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                row = rec["row"]
+                if row >= self._count:
+                    continue  # written after the last manifest flush
+                old_id = self._ids[row]
+                if old_id is not None:
+                    old_key = _record_key(self._namespaces[row], old_id)
+                    if self._rows.get(old_key) == row:
+                        del self._rows[old_key]
+                self._ids[row] = rec["id"]
+                self._namespaces[row] = rec.get("namespace", "")
+                self._metadata[row] = rec.get("metadata")
+                if rec["id"] is not None:
+                    self._rows[_record_key(self._namespaces[row], rec["id"])] = row
+        for row, vid in enumerate(self._ids):
+            if vid is not None and self._rows.get(_record_key(self._namespaces[row], vid)) == row:
+                self._index_row(row, self._namespaces[row], self._metadata[row])
+
+    def _load_ivf(self) -> None:
+        ivf_path = os.path.join(self.path, IVF_FILE)
+        if self.ivf_lists and os.path.exists(ivf_path):
+            data = np.load(ivf_path)
+            if data["centroids"].shape[0] == self.ivf_lists:
+                self._centroids = data["centroids"]
+                assignments = np.full(self._count, -1, dtype=np.int32)
+                stored = data["assignments"][: self._count]
+                assignments[: stored.shape[0]] = stored
+                self._assignments = assignments
+
+    def _ensure_capacity(self, needed: int) -> None:
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        # Grow into a new file and swap it in: queries holding the old view keep reading the old file
+        self._matrix = self._grown(VECTORS_FILE, "_matrix", (new_capacity, self.dim), numpy_dtype(self.dtype))
+        if self._scales is not None:
+            self._scales = self._grown(SCALES_FILE, "_scales", (new_capacity,), np.float32)
+
+    def _grown(self, name: str, attr: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        final = os.path.join(self.path, name)
+        tmp = final + ".grow"
+        current = getattr(self, attr)
+        grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+        grown[: self._count] = current[: self._count]
+        grown.flush()
+        # Windows refuses to replace a file that is still mapped, so drop our own mappings of both
+        # files first and map the result again afterwards (caller holds the lock, so no query sees None).
+        setattr(self, attr, None)
+        del grown, current
+        _replace_unmapped(tmp, final)
+        return np.load(final, mmap_mode="r+")
+
+    def flush(self) -> None:
+        """Persist the matrix, manifest and IVF partitions now."""
+        with self._lock:
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            self._matrix.flush()
+            if self._scales is not None:
+                self._scales.flush()
+            self._write_manifest()
+            if self._centroids is not None:
+                np.savez(
+                    os.path.join(self.path, IVF_FILE),
+                    centroids=self._centroids,
+                    assignments=self._assignments[: self._count],
+                )
+
+    def _written(self) -> None:
+        """Called under the lock after a write: flush if the last flush is older than flush_interval."""
+        self._dirty = True
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self.flush()
+
+    # --- writes ---
+    def _normalize_rows(self, vectors) -> np.ndarray:
+        mat = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return mat / norms
+
+    def _decode_rows(self, rows) -> np.ndarray:
+        """Stored rows (index array or slice) decoded to float32."""
+        return dequantize(self._matrix[rows], self._scales[rows] if self._scales is not None else None)
+
+    def upsert(self, vectors: Iterable, namespace: str = "", **kwargs) -> Dict[str, int]:
+        """Insert or overwrite vectors (dicts or (id, values, metadata) tuples) in a namespace."""
+        items: List[Tuple[str, Any, Optional[Dict[str, Any]]]] = []
+        for v in vectors:
+            if isinstance(v, dict):
+                items.append((v["id"], v["values"], v.get("metadata")))
+            else:
+                items.append((v[0], v[1], v[2] if len(v) > 2 else None))
+        if not items:
+            return {"upserted_count": 0}
+
+        normalized = self._normalize_rows([values for _, values, _ in items])
+        codes, row_scales = quantize(normalized, self.dtype)
+        with self._lock:
+            rows = []
+            new_rows = sum(1 for vid, _, _ in items if _record_key(namespace, vid) not in self._rows)
+            self._ensure_capacity(self._count + new_rows)
+            with open(os.path.join(self.path, RECORDS_FILE), "a", encoding="utf-8") as f:
+                for i, (vid, _, metadata) in enumerate(items):
+                    key = _record_key(namespace, vid)
+                    row = self._rows.get(key)
+                    if row is None:
+                        row = self._count
+                        self._count += 1
+                        self._ids.append(vid)
+                        self._namespaces.append(namespace)
+                        self._metadata.append(metadata)
+                        self._rows[key] = row
+                    else:
+                        self._unindex_row(row)
+                        self._metadata[row] = metadata
+                    self._index_row(row, namespace, metadata)
+                    self._matrix[row] = codes[i]
+                    if row_scales is not None:
+                        self._scales[row] = row_scales[i]
+                    rows.append(row)
+                    record = {"row": row, "id": vid, "metadata": metadata}
+                    if namespace:
+                        record["namespace"] = namespace
+                    f.write(json.dumps(record) + "\n")
+            if self._centroids is not None:
+                self._assign(np.asarray(rows), normalized)
+            self._written()
+        return {"upserted_count": len(items)}
+
+    def delete(self, ids: List[str], namespace: str = "", **kwargs) -> None:
+        with self._lock:
+            with open(os.path.join(self.path, RECORDS_FILE), "a", encoding="utf-8") as f:
+                for vid in ids:
+                    row = self._rows.pop(_record_key(namespace, vid), None)
+                    if row is None:
+                        continue
+                    self._unindex_row(row)
+                    self._ids[row] = None
+                    self._metadata[row] = None
+                    self._matrix[row] = 0.0
+                    f.write(json.dumps({"row": row, "id": None, "metadata": None}) + "\n")
+            self._written()
+
+    # --- IVF partitioning ---
+    def _assign(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        if self._assignments.shape[0] < self._count:
+            grown = np.full(self._count, -1, dtype=np.int32)
+            grown[: self._assignments.shape[0]] = self._assignments
+            self._assignments = grown
+        self._assignments[rows] = np.argmax(vectors @ self._centroids.T, axis=1)
+
+    def build_ivf(self, iterations: int = 10, seed: int = 0) -> None:
+        """Partition the stored vectors into `ivf_lists` clusters (spherical k-means)."""
+        with self._lock:
+            n = self._count
+            if not self.ivf_lists or n < self.ivf_lists:
+                return
+            data = self._decode_rows(slice(0, n))
+            rng = np.random.default_rng(seed)
+            centroids = np.array(data[rng.choice(n, self.ivf_lists, replace=False)])
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                for c in range(self.ivf_lists):
+                    members = data[labels == c]
+                    if len(members):
+                        centroid = members.sum(axis=0)
+                        norm = np.linalg.norm(centroid)
+                        centroids[c] = centroid / norm if norm else centroids[c]
+            self._centroids = centroids.astype(np.float32)
+            self._assignments = np.argmax(data @ self._centroids.T, axis=1).astype(np.int32)
+            self.flush()
+            print(f"✅ Built IVF partitions: {self.ivf_lists} lists over {n} vectors")
+
+    # --- reads ---
+    def _scope_rows(self, namespace: str, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Live rows in the namespace that pass the filter (None = every row, the unscoped fast path)."""
+        if not namespace and not filter and len(self._postings.get(("namespace", ""), ())) == len(self._rows):
+            return None
+        rows = set(self._postings.get(("namespace", namespace), ()))
+        unindexed = {}
+        for field, condition in (filter or {}).items():
+            values = _filter_values(condition)
+            if field not in FILTER_FIELDS:
+                unindexed[field] = set(values)
+                continue
+            allowed = set()
+            for value in values:
+                allowed |= self._postings.get((field, value), set())
+            rows &= allowed
+        if unindexed:
+            rows = {
+                row for row in rows
+                if all((self._metadata[row] or {}).get(field) in values for field, values in unindexed.items())
+            }
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def query(
+        self,
+        vector=None,
+        top_k: int = 3,
+        include_metadata: bool = True,
+        include_values: bool = False,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """Top_k rows by cosine similarity in `namespace`, restricted to rows matching `filter`."""
+        namespace = namespace or ""
+        q = self._normalize_rows(vector)[0]
+        with self._lock:  # snapshot only; scoring below runs without the lock
+            n = self._count
+            live = len(self._rows)
+            candidates = self._scope_rows(namespace, filter) if n else None
+            matrix, all_scales = self._matrix, self._scales
+            centroids, assignments = self._centroids, self._assignments
+            ids, metadata = self._ids, self._metadata
+        if n == 0 or (candidates is not None and not len(candidates)):
+            return {"matches": [], "namespace": namespace}
+        if centroids is not None and assignments is not None:
+            probe = np.argsort(-(centroids @ q))[: self.nprobe]
+            if candidates is None:
+                candidates = np.nonzero(np.isin(assignments[:n], probe))[0]
+            elif len(candidates) > top_k * self.ivf_lists:
+                # Small scopes are scanned exactly; large ones only in the probed partitions.
+                candidates = candidates[np.isin(assignments[candidates], probe)]
+
+        if candidates is None:
+            scores = score_rows(matrix[:n], q, all_scales[:n] if all_scales is not None else None)
+            rows = np.arange(n)
+        else:
+            scores = score_rows(matrix[candidates], q, all_scales[candidates] if all_scales is not None else None)
+            rows = candidates
+
+        # Over-fetch by the number of deleted rows so tombstones never crowd out live matches
+        k = min(top_k + (n - live), scores.shape[0])
+        if k == 0:
+            return {"matches": [], "namespace": namespace}
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for i in top:
+            row = int(rows[i])
+            vid = ids[row]
+            if vid is None:
+                continue
+            match: Dict[str, Any] = {"id": vid, "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = metadata[row] or {}
+            if include_values:
+                match["values"] = dequantize(matrix[[row]], all_scales[[row]] if all_scales is not None else None)[0].tolist()
+            matches.append(match)
+            if len(matches) == top_k:
+                break
+        return {"matches": matches, "namespace": namespace}
+
+    def list_namespaces(self) -> List[str]:
+        with self._lock:
+            return sorted(ns for field, ns in self._postings if field == "namespace")
+
+    def iter_vectors(self, batch_size: int = 100, namespace: str = ""):
+        """Yield batches of {id, values, metadata} dicts from one namespace (used for snapshots)."""
+        with self._lock:
+            live = sorted(self._postings.get(("namespace", namespace), ()))
+        for start in range(0, len(live), batch_size):
+            rows = live[start : start + batch_size]
+            values = self._decode_rows(rows)
+            yield [
+                {"id": self._ids[row], "values": vec.tolist(), "metadata": self._metadata[row] or {}}
+                for row, vec in zip(rows, values)
+            ]
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "dimension": self.dim,
+                "dtype": self.dtype,
+                "total_vector_count": len(self._rows),
+                "namespaces": {
+                    ns: {"vector_count": len(rows)} for (field, ns), rows in self._postings.items() if field == "namespace"
+                },
+                "ivf_lists": self.ivf_lists if self._centroids is not None else 0,
+            }
+
+
+def export_from_pinecone(pinecone_index, local: LocalVectorIndex, namespace: str = "", batch_size: int = 100) -> int:
+    """Copy every vector of a (serverless) Pinecone index into the local store."""
+    total = 0
+    for ids in pinecone_index.list(namespace=namespace):
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start : start + batch_size]
+            fetched = pinecone_index.fetch(ids=chunk, namespace=namespace)
+            vectors = [
+                {"id": vid, "values": list(v["values"]), "metadata": dict(v.get("metadata") or {})}
+                for vid, v in fetched["vectors"].items()
+            ]
+            local.upsert(vectors=vectors, namespace=namespace)
+            total += len(vectors)
+            print(f"📥 Exported {total} vectors from Pinecone")
+    local.flush()
+    return total
+
+
+def import_into_pinecone(local: LocalVectorIndex, pinecone_index, namespace: str = "", batch_size: int = 100) -> int:
+    """Upsert every vector of the local store into a Pinecone index."""
+    total = 0
+    for batch in local.iter_vectors(batch_size=batch_size, namespace=namespace):
+        pinecone_index.upsert(vectors=batch, namespace=namespace)
+        total += len(batch)
+        print(f"📤 Imported {total} vectors into Pinecone")
+    return total
+
+
+def stored_dtype(path: str, default: str = "float32") -> str:
+    """dtype recorded in an existing index's manifest (or `default` for a new one)."""
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return default
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("dtype", "float32")
+
+
+def convert(source: LocalVectorIndex, out_path: str, dtype: str, batch_size: int = 1000) -> LocalVectorIndex:
+    """Copy an index into a new directory with a different storage dtype."""
+    target = LocalVectorIndex(out_path, dim=source.dim, ivf_lists=source.ivf_lists, nprobe=source.nprobe, dtype=dtype)
+    for namespace in source.list_namespaces():
+        for batch in source.iter_vectors(batch_size=batch_size, namespace=namespace):
+            target.upsert(vectors=batch, namespace=namespace)
+    target.flush()
+    if source.ivf_lists:
+        target.build_ivf()
+    return target
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Snapshot vectors between Pinecone and the local vector store")
+    parser.add_argument("command", choices=["export", "import", "build-ivf", "stats", "convert"])
+    parser.add_argument("--path", default=os.getenv("LOCAL_VECTOR_PATH", ".cache/vector_index"))
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--index", default=os.getenv("PINECONE_INDEX", "policy-index-1536"))
+    parser.add_argument("--namespace", default="")
+    parser.add_argument("--ivf-lists", type=int, default=int(os.getenv("LOCAL_VECTOR_IVF_LISTS", "0")))
+    parser.add_argument("--dtype", help="Storage dtype: float32, float16 or int8 (default: the index's own)")
+    parser.add_argument("--out", help="Target directory for `convert`")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        if not args.out or not args.dtype:
+            parser.error("convert needs --out and --dtype")
+        source = LocalVectorIndex(args.path, dim=args.dim, ivf_lists=args.ivf_lists, dtype=stored_dtype(args.path))
+        target = convert(source, args.out, args.dtype)
+        print(f"✅ Converted {args.path} ({source.dtype}) to {args.out} ({args.dtype}): {target.describe_index_stats()}")
+        return
+
+    dtype = args.dtype or stored_dtype(args.path, os.getenv("LOCAL_VECTOR_DTYPE", "float32"))
+    local = LocalVectorIndex(args.path, dim=args.dim, ivf_lists=args.ivf_lists, dtype=dtype)
+    if args.command == "stats":
+        print(local.describe_index_stats())
+        return
+    if args.command == "build-ivf":
+        local.build_ivf()
+        return
+
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    remote = pc.Index(args.index)
+    if args.command == "export":
+        count = export_from_pinecone(remote, local, namespace=args.namespace)
+        print(f"✅ Exported {count} vectors from '{args.index}' to {args.path}")
+    else:
+        count = import_into_pinecone(local, remote, namespace=args.namespace)
+        print(f"✅ Imported {count} vectors from {args.path} into '{args.index}'")
+
+
+if __name__ == "__main__":
+    main()
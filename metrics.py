@@ -0,0 +1,255 @@
+# metrics.py
+"""Minimal Prometheus-format instrumentation for the query pipeline.
+
+Counters, gauges and histograms are kept in-process and rendered in the text
+exposition format on /metrics. `stage()` times one pipeline stage: it feeds a
+histogram, tracks the in-flight gauge and appends the timing to the current
+request's trace, which `TraceMiddleware` turns into `X-Trace-Id` and
+`Server-Timing` response headers.
+"""
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Callable, Optional, Iterable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        metric = Gauge(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable) -> None:
+        """Register a callback yielding (name, kind, help, labels, value) samples at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        # Collectors yield per stage/guard/flight, interleaving families; the text format
+        # needs each family's samples together, so group them (in first-seen order).
+        families: Dict[str, List[str]] = {}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print("⚠️ Metrics collector failed:", e)
+                continue
+            for name, kind, help_text, labels, value in samples:
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                names = tuple(labels.keys())
+                family.append(f"{name}{_format_labels(names, tuple(str(v) for v in labels.values()))} {value}")
+        for family in families.values():
+            lines.extend(family)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "query_stage_duration_seconds", "Latency of each query pipeline stage", ["stage"]
+)
+STAGE_ERRORS = REGISTRY.counter("query_stage_errors_total", "Failed pipeline stage executions", ["stage"])
+STAGE_INFLIGHT = REGISTRY.gauge("query_stage_inflight", "Pipeline stage executions in progress", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "path", "status"]
+)
+REQUESTS_INFLIGHT = REGISTRY.gauge("http_requests_inflight", "HTTP requests in progress")
+
+
+def current_trace() -> Optional[dict]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage for metrics and the per-request trace."""
+    STAGE_INFLIGHT.inc(stage=name)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_INFLIGHT.dec(stage=name)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["stages"].append((name, elapsed))
+
+
+class TraceMiddleware:
+    """ASGI middleware: request latency metrics plus optional trace headers."""
+
+    def __init__(self, app, emit_headers: bool = True):
+        self.app = app
+        self.emit_headers = emit_headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = dict(scope.get("headers") or []).get(b"x-trace-id")
+        trace = {"id": incoming.decode("latin-1") if incoming else uuid.uuid4().hex, "stages": []}
+        token = _current_trace.set(trace)
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.emit_headers:
+                    headers = list(message.get("headers") or [])
+                    headers.append((b"x-trace-id", trace["id"].encode("latin-1")))
+                    timing = ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in trace["stages"])
+                    if timing:
+                        headers.append((b"server-timing", timing.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        REQUESTS_INFLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_INFLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], path=path, status=status["code"])
+            _current_trace.reset(token)
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Count, p50/p90/p95/p99, max and mean of raw samples (benchmark and replay reports)."""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p95": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 2),
+        "mean": round(sum(ordered) / len(ordered), 2),
+    }
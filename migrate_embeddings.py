@@ -0,0 +1,151 @@
+# migrate_embeddings.py
+"""Re-embed existing chunks into another embedding space's native-dimension index.
+
+Reads every chunk (id + metadata, including its text) from the source space's
+index, embeds the text with the target space's model and upserts it into the
+target index under the same id and metadata. Run it after switching
+USE_LOCAL_EMBEDDINGS so queries find vectors made by the active model, e.g.
+
+    python migrate_embeddings.py --from openai --to local
+
+Chunks ingested before scoped retrieval have no `policy_id` tag and no policy
+catalog entry, so scoped queries reject them. --backfill-policies tags each
+with its document id (the default policy id at ingestion) and registers
+every document found in the index with the catalog:
+
+    python migrate_embeddings.py --backfill-policies [--space local]
+"""
+import argparse
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def list_namespaces(index) -> List[str]:
+    """Namespaces holding vectors (per-policy namespaces when SCOPE_ROUTING=namespace)."""
+    if hasattr(index, "list_namespaces"):
+        return index.list_namespaces()
+    stats = index.describe_index_stats()
+    namespaces = stats.get("namespaces") if isinstance(stats, dict) else stats.namespaces
+    return sorted(namespaces) if namespaces else [""]
+
+
+def iter_chunks(index, batch_size: int = 100, namespace: str = "") -> Iterator[List[Dict[str, Any]]]:
+    """Yield batches of {id, metadata} from one namespace of a local index or a serverless Pinecone index."""
+    if hasattr(index, "iter_vectors"):
+        for batch in index.iter_vectors(batch_size=batch_size, namespace=namespace):
+            yield [{"id": v["id"], "metadata": v["metadata"]} for v in batch]
+        return
+    for ids in index.list(namespace=namespace):
+        for start in range(0, len(ids), batch_size):
+            fetched = index.fetch(ids=ids[start : start + batch_size], namespace=namespace)
+            yield [
+                {"id": vid, "metadata": dict(v.get("metadata") or {})}
+                for vid, v in fetched["vectors"].items()
+            ]
+
+
+def migrate(source: str, target: str, batch_size: int = 100) -> Dict[str, Any]:
+    import query_api
+
+    if source == target:
+        raise ValueError("Source and target embedding spaces must differ")
+    src_index = query_api.init_vector_backend(source)
+    dst_index = query_api.init_vector_backend(target)
+    started = time.time()
+    totals = {"migrated": 0, "skipped": 0}
+    for namespace in list_namespaces(src_index):
+        for batch in iter_chunks(src_index, batch_size=batch_size, namespace=namespace):
+            totals["skipped"] += sum(1 for item in batch if not item["metadata"].get("text"))
+            batch = [item for item in batch if item["metadata"].get("text")]
+            if not batch:
+                continue
+            vectors = query_api.embed_texts([item["metadata"]["text"] for item in batch], space=target)
+            dst_index.upsert(vectors=[
+                {"id": item["id"], "values": vector, "metadata": item["metadata"]}
+                for item, vector in zip(batch, vectors)
+            ], namespace=namespace)
+            totals["migrated"] += len(batch)
+            print(f"🔁 Re-embedded {totals['migrated']} chunks into '{target}'")
+    if hasattr(dst_index, "flush"):
+        dst_index.flush()
+    query_api.invalidate_answers()
+    totals["seconds"] = round(time.time() - started, 3)
+    space = query_api.EMBED_SPACES[target]
+    print(f"✅ Migrated {totals['migrated']} chunks from '{source}' to '{target}' ({space.model}, {space.dim}-dim) in {totals['seconds']}s")
+    return totals
+
+
+def _retag(index, items: List[Dict[str, Any]], namespace: str) -> None:
+    """Write the items' metadata back: a re-upsert for the local index, metadata-only updates for Pinecone."""
+    if hasattr(index, "iter_vectors"):
+        index.upsert(vectors=items, namespace=namespace)
+        return
+    for item in items:
+        index.update(id=item["id"], set_metadata={"policy_id": item["metadata"]["policy_id"]}, namespace=namespace)
+
+
+def backfill_policies(space: Optional[str] = None, batch_size: int = 100) -> Dict[str, Any]:
+    """Tag untagged chunks with policy_id = doc_id and register every document with the policy catalog."""
+    import query_api
+
+    name = space or query_api.ACTIVE_SPACE
+    index = query_api.init_vector_backend(name)
+    started = time.time()
+    totals = {"tagged": 0, "already_tagged": 0, "skipped": 0}
+    documents: Dict[str, Dict[str, Any]] = {}
+    for namespace in list_namespaces(index):
+        batches = (index.iter_vectors(batch_size=batch_size, namespace=namespace) if hasattr(index, "iter_vectors")
+                   else iter_chunks(index, batch_size=batch_size, namespace=namespace))
+        for batch in batches:
+            untagged = []
+            for item in batch:
+                metadata = item["metadata"]
+                doc_id = metadata.get("doc_id")
+                if not doc_id:
+                    totals["skipped"] += 1  # not from ingest.py; nothing to derive a policy from
+                    continue
+                if metadata.get("policy_id"):
+                    totals["already_tagged"] += 1
+                else:
+                    metadata["policy_id"] = doc_id
+                    untagged.append(item)
+                doc = documents.setdefault(doc_id, {
+                    "policy_id": metadata["policy_id"], "tenant": metadata.get("tenant"),
+                    "namespace": namespace, "source": metadata.get("source"), "chunks": 0,
+                })
+                doc["chunks"] += 1
+            if untagged:
+                _retag(index, untagged, namespace)
+                totals["tagged"] += len(untagged)
+                print(f"🏷️ Tagged {totals['tagged']} chunks with their policy_id")
+    if hasattr(index, "flush"):
+        index.flush()
+    for doc_id, doc in documents.items():
+        query_api.policy_catalog.register(
+            doc["policy_id"], doc["tenant"], doc["namespace"], doc["chunks"], doc["source"], doc_id=doc_id
+        )
+    query_api.invalidate_answers()
+    totals.update(documents=len(documents), seconds=round(time.time() - started, 3))
+    print(f"✅ Backfilled '{name}': {totals['tagged']} chunks tagged, {len(documents)} documents registered in {totals['seconds']}s")
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-embed indexed chunks with another embedding model")
+    parser.add_argument("--from", dest="source", choices=("openai", "local"))
+    parser.add_argument("--to", dest="target", choices=("openai", "local"))
+    parser.add_argument("--backfill-policies", action="store_true",
+                        help="Tag pre-scoping chunks with policy_id and register them in the policy catalog")
+    parser.add_argument("--space", choices=("openai", "local"), help="Space to backfill (default: active)")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    if args.backfill_policies:
+        backfill_policies(args.space, batch_size=args.batch_size)
+        return
+    if not args.source or not args.target:
+        parser.error("--from and --to are required (or use --backfill-policies)")
+    migrate(args.source, args.target, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# policy_catalog.py
+"""Catalog of ingested policies, used to scope retrieval per policy or tenant.
+
+Ingestion registers every policy with its tenant (insurer) and the vector
+namespace its chunks went to. A request scope (policy_id and/or tenant) is
+resolved here into the tuple of policy ids it may search, which becomes a
+per-policy namespace route or a `policy_id` `$in` metadata filter.
+
+The tenant -> policies map is pre-computed in memory and only reloaded when
+another process (an ingesting worker or the CLI) has committed to the SQLite
+file, which `PRAGMA data_version` reports cheaply.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class UnknownScopeError(LookupError):
+    """The requested policy or tenant is not in the catalog."""
+
+
+class PolicyCatalog:
+    def __init__(self, path: str):
+        self.path = path
+        self.resolves = 0
+        self.reloads = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS policies ("
+            " policy_id TEXT PRIMARY KEY, tenant TEXT, namespace TEXT NOT NULL, source TEXT,"
+            " chunks INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        # Which policy each ingested document belongs to; policies.chunks is the sum over its documents
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS policy_documents (doc_id TEXT PRIMARY KEY, policy_id TEXT NOT NULL, chunks INTEGER NOT NULL)"
+        )
+        self._version: Optional[int] = None
+        self._namespaces: Dict[str, str] = {}
+        self._by_tenant: Dict[str, Tuple[str, ...]] = {}
+
+    def _refresh(self) -> None:
+        """Reload the maps if the file changed since the last load (caller holds the lock)."""
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._version:
+            return
+        namespaces: Dict[str, str] = {}
+        by_tenant: Dict[str, List[str]] = {}
+        for policy_id, tenant, namespace in self._db.execute("SELECT policy_id, tenant, namespace FROM policies"):
+            namespaces[policy_id] = namespace
+            if tenant:
+                by_tenant.setdefault(tenant, []).append(policy_id)
+        self._namespaces = namespaces
+        self._by_tenant = {tenant: tuple(sorted(ids)) for tenant, ids in by_tenant.items()}
+        self._version = version
+        self.reloads += 1
+
+    def register(
+        self,
+        policy_id: str,
+        tenant: Optional[str],
+        namespace: str,
+        chunks: int,
+        source: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> None:
+        """Record (or refresh) a policy. With doc_id, re-registering the same document
+        replaces its chunk count instead of adding to it, and moves it off its old policy."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT INTO policies VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(policy_id) DO UPDATE SET"
+                    " tenant = excluded.tenant, namespace = excluded.namespace, source = excluded.source,"
+                    " chunks = policies.chunks + excluded.chunks, updated_at = excluded.updated_at",
+                    (policy_id, tenant, namespace, source, 0 if doc_id else chunks, time.time()),
+                )
+                if doc_id:
+                    previous = self._db.execute("SELECT policy_id FROM policy_documents WHERE doc_id = ?", (doc_id,)).fetchone()
+                    self._db.execute(
+                        "INSERT INTO policy_documents VALUES (?, ?, ?) ON CONFLICT(doc_id) DO UPDATE SET"
+                        " policy_id = excluded.policy_id, chunks = excluded.chunks",
+                        (doc_id, policy_id, chunks),
+                    )
+                    for pid in {policy_id, previous[0] if previous else policy_id}:
+                        self._db.execute(
+                            "UPDATE policies SET chunks = (SELECT COALESCE(SUM(chunks), 0) FROM policy_documents"
+                            " WHERE policy_id = ?) WHERE policy_id = ?",
+                            (pid, pid),
+                        )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._version = None  # our own commits do not change data_version on this connection
+
+    def resolve(self, policy_id: Optional[str] = None, tenant: Optional[str] = None) -> Optional[Tuple[str, ...]]:
+        """Policy ids a request may search (None when unscoped).
+
+        Raises UnknownScopeError when the policy or tenant was never registered, or
+        the policy belongs to another tenant: such a scope would silently match nothing."""
+        if not policy_id and not tenant:
+            return None
+        with self._lock:
+            self.resolves += 1
+            self._refresh()
+            if policy_id and policy_id not in self._namespaces:
+                raise UnknownScopeError(f"Unknown policy_id '{policy_id}'")
+            if not tenant:
+                return (policy_id,)
+            allowed = self._by_tenant.get(tenant)
+            if not allowed:
+                raise UnknownScopeError(f"Unknown tenant '{tenant}'")
+            if policy_id:
+                if policy_id not in allowed:
+                    raise UnknownScopeError(f"Policy '{policy_id}' does not belong to tenant '{tenant}'")
+                return (policy_id,)
+            return allowed
+
+    def namespace(self, policy_id: str) -> str:
+        with self._lock:
+            self._refresh()
+            return self._namespaces.get(policy_id, policy_id)
+
+    def namespaces(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return sorted(set(self._namespaces.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "policies": len(self._namespaces),
+                "tenants": len(self._by_tenant),
+                "resolves": self.resolves,
+                "reloads": self.reloads,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -1,23 +1,51 @@
 # query_api.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from openai import OpenAI
-from pinecone import Pinecone, ServerlessSpec
+from openai import OpenAI, AsyncOpenAI
+import base64
 import json
+import httpx
 import os
 from dotenv import load_dotenv
 import re
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable
 import asyncio
+import contextlib
+import shutil
+import time
+import tempfile
+import threading
+import uuid
 from datetime import datetime
+from answer_cache import SemanticAnswerCache
+from embedding_cache import EmbeddingCache
+from cache_backends import make_backend
+from local_vector_store import LocalVectorIndex
+from ingest import ingest_pdf, file_sha256
+from stream_json import IncrementalJSONParser
+from admission import AdmissionController, AdmissionMiddleware, OverloadedError, overloaded_response_parts
+from vector_client import AsyncPineconeQuery, AsyncLocalQuery
+from metrics import REGISTRY, TraceMiddleware, stage
+from history_writer import HistoryWriter
+from embed_batcher import MicroBatcher
+from embed_workers import EmbeddingWorkerPool
+from single_flight import SingleFlight
+from upstream_guard import UpstreamGuard, CircuitOpenError, BREAKER_STATES
+from context_budget import ContextBudgeter, count_tokens
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from history_replay import warm_from_history
+from policy_catalog import PolicyCatalog, UnknownScopeError
 # Optional MongoDB import
 try:
     from motor.motor_asyncio import AsyncIOMotorClient
+    from bson import ObjectId
     MOTOR_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ Motor/MongoDB not available: {e}")
     AsyncIOMotorClient = None
+    ObjectId = None
     MOTOR_AVAILABLE = False
 
 load_dotenv()  # Load keys from .env file
@@ -32,9 +60,144 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()  # 'openai' or 'none'
 USE_LOCAL_EMBEDDINGS = os.getenv("USE_LOCAL_EMBEDDINGS", "false").lower() == "true"
 MONGO_URI = os.getenv("MONGO_URI")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()  # 'pinecone' or 'local'
+LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", ".cache/vector_index")
+LOCAL_VECTOR_IVF_LISTS = int(os.getenv("LOCAL_VECTOR_IVF_LISTS", "0"))  # 0 = exact search
+LOCAL_VECTOR_NPROBE = int(os.getenv("LOCAL_VECTOR_NPROBE", "8"))
+# Retrieval breadth and prompt context budget (retrieve more, then dedupe/rank/trim to the budget)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+CONTEXT_BUDGET_ENABLED = os.getenv("CONTEXT_BUDGET_ENABLED", "true").lower() == "true"
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "600"))
+# Hybrid retrieval: local BM25 index queried alongside the vector index, fused by reciprocal rank
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", ".cache/lexical.sqlite3")
+LEXICAL_SKIP_VECTOR = os.getenv("LEXICAL_SKIP_VECTOR", "true").lower() == "true"  # confident exact match skips the vector call
+LEXICAL_CONFIDENT_MARGIN = float(os.getenv("LEXICAL_CONFIDENT_MARGIN", "1.5"))
+LEXICAL_HEADSTART_MS = float(os.getenv("LEXICAL_HEADSTART_MS", "5"))
+# Per-policy/tenant scoped retrieval: 'filter' (policy_id metadata filter) or 'namespace' (one namespace per policy)
+SCOPE_ROUTING = os.getenv("SCOPE_ROUTING", "filter").lower()
+POLICY_CATALOG_PATH = os.getenv("POLICY_CATALOG_PATH", ".cache/policies.sqlite3")
+# Coalesce identical in-flight /run, embedding and vector-query calls into one execution
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")  # float32, float16 or int8
+# Native-dimension vector space per embedding model (no zero-padding to 1536)
+OPENAI_EMBED_DIM = int(os.getenv("OPENAI_EMBED_DIM", "1536"))
+LOCAL_EMBED_DIM = int(os.getenv("LOCAL_EMBED_DIM", "384"))
+PINECONE_LOCAL_INDEX = os.getenv("PINECONE_LOCAL_INDEX", "policy-index-384")
+PINECONE_LOCAL_INDEX_HOST = os.getenv("PINECONE_LOCAL_INDEX_HOST")
+LOCAL_EMBED_VECTOR_PATH = os.getenv("LOCAL_EMBED_VECTOR_PATH", ".cache/vector_index_384")
+LOCAL_EMBED_MODEL_PATH = os.getenv("LOCAL_EMBED_MODEL_PATH")  # pre-baked model directory
+INGEST_STATE_DIR = os.getenv("INGEST_STATE_DIR", ".cache/ingest")
+INGEST_UPSERT_CONCURRENCY = int(os.getenv("INGEST_UPSERT_CONCURRENCY", "4"))
+# /run/batch limits
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+# Semantic answer cache (near-duplicate queries skip Pinecone + LLM)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", "64"))
+# Persistent embedding cache (memory LRU + SQLite on disk)
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "10000"))
+EMBED_CACHE_DTYPE = os.getenv("EMBED_CACHE_DTYPE", "float32")  # float16 halves the SQLite tier
+# Hot cache tier shared by uvicorn/gunicorn workers: memory (per process), shm (one mmap table per host) or sqlite
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SHM_DIR = os.getenv("CACHE_SHM_DIR") or None  # default /dev/shm
+CACHE_SQLITE_DIR = os.getenv("CACHE_SQLITE_DIR", ".cache")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))  # texts per OpenAI embeddings request
+# Micro-batching of concurrent local-model embeddings on the request path
+LOCAL_EMBED_BATCHING = os.getenv("LOCAL_EMBED_BATCHING", "true").lower() == "true"
+LOCAL_EMBED_BATCH_MAX = int(os.getenv("LOCAL_EMBED_BATCH_MAX", "64"))
+LOCAL_EMBED_BATCH_WAIT_MS = float(os.getenv("LOCAL_EMBED_BATCH_WAIT_MS", "5"))
+# Optional process pool for local embeddings (0 = encode in-process)
+LOCAL_EMBED_WORKERS = int(os.getenv("LOCAL_EMBED_WORKERS", "0"))
+LOCAL_EMBED_WORKER_TIMEOUT = float(os.getenv("LOCAL_EMBED_WORKER_TIMEOUT", "60"))
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST")  # skips describe_index when set
+# Shared HTTP connection pool for upstream calls
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Admission control: per-stage concurrency, bounded queues, load shedding
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2.0"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "32"))
+VECTOR_CONCURRENCY = int(os.getenv("VECTOR_CONCURRENCY", "32"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+# /run/batch items in flight at once; kept within the vector stage's slots so a batch never sheds itself
+BATCH_ITEM_CONCURRENCY = min(int(os.getenv("BATCH_ITEM_CONCURRENCY", str(VECTOR_CONCURRENCY))), VECTOR_CONCURRENCY)
+# Upstream tail-latency controls: adaptive timeouts (p99 x multiplier, capped below), p95 hedging, circuit breakers
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "5"))  # leaves room for the local fallback within 8s
+VECTOR_TIMEOUT_SECONDS = float(os.getenv("VECTOR_TIMEOUT_SECONDS", "6"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "12"))
+UPSTREAM_TIMEOUT_MULTIPLIER = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", "3"))
+UPSTREAM_HEDGING = os.getenv("UPSTREAM_HEDGING", "true").lower() == "true"
+UPSTREAM_HEDGE_PERCENTILE = float(os.getenv("UPSTREAM_HEDGE_PERCENTILE", "0.95"))
+UPSTREAM_HEDGE_BUDGET = float(os.getenv("UPSTREAM_HEDGE_BUDGET", "0.1"))  # max share of calls that may be hedged
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# Cache warm-up from search_history (top queries of the last N days, pre-computed at a fixed rate)
+CACHE_WARMUP_ON_START = os.getenv("CACHE_WARMUP_ON_START", "false").lower() == "true"
+CACHE_WARMUP_LIMIT = int(os.getenv("CACHE_WARMUP_LIMIT", "200"))
+CACHE_WARMUP_DAYS = float(os.getenv("CACHE_WARMUP_DAYS", "7"))
+CACHE_WARMUP_RATE = float(os.getenv("CACHE_WARMUP_RATE", "2"))  # queries per second
+CACHE_WARMUP_ANSWERS = os.getenv("CACHE_WARMUP_ANSWERS", "true").lower() == "true"  # false = embeddings only
+TRACE_HEADERS_ENABLED = os.getenv("TRACE_HEADERS_ENABLED", "true").lower() == "true"  # X-Trace-Id + Server-Timing
+# Write-behind search history (batched insert_many, spill file when Mongo is down)
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "true").lower() == "true"
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "200"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "10000"))
+HISTORY_OVERFLOW = os.getenv("HISTORY_OVERFLOW", "drop").lower()  # 'drop' or 'block'
+HISTORY_SPILL_PATH = os.getenv("HISTORY_SPILL_PATH", ".cache/history_spill.jsonl")
+HISTORY_REPLAY_INTERVAL = float(os.getenv("HISTORY_REPLAY_INTERVAL", "30"))
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "100"))  # hard cap on /history page size
 
 client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, timeout=10.0) if OPENAI_API_KEY else None
 
+# Async request path: one tuned keep-alive pool shared by OpenAI and Pinecone
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    ),
+    timeout=httpx.Timeout(10.0, connect=3.0),
+)
+aclient = AsyncOpenAI(
+    api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, timeout=10.0, max_retries=0, http_client=http_client
+) if OPENAI_API_KEY else None
+
+def _upstream_guard(name: str, min_timeout: float, max_timeout: float, **overrides) -> UpstreamGuard:
+    options = dict(
+        timeout_multiplier=UPSTREAM_TIMEOUT_MULTIPLIER,
+        hedge=UPSTREAM_HEDGING,
+        hedge_percentile=UPSTREAM_HEDGE_PERCENTILE,
+        hedge_budget=UPSTREAM_HEDGE_BUDGET,
+        failure_threshold=BREAKER_FAILURE_THRESHOLD,
+        reset_seconds=BREAKER_RESET_SECONDS,
+    )
+    options.update(overrides)
+    return UpstreamGuard(name, min_timeout, max_timeout, **options)
+
+embed_guard = _upstream_guard("openai_embed", 0.5, EMBED_TIMEOUT_SECONDS)
+# Hedging only pays off against the remote Pinecone API: a local query is a CPU-bound scan in a
+# thread, which cancelling the losing hedge does not stop, so a hedge would just double the work.
+vector_guard = _upstream_guard("vector", 0.25, VECTOR_TIMEOUT_SECONDS, hedge=UPSTREAM_HEDGING and VECTOR_BACKEND != "local")
+llm_guard = _upstream_guard("llm", 2.0, LLM_TIMEOUT_SECONDS)
+# Opening a stream is much faster than a full completion, so it tracks its own latency but shares the LLM breaker.
+llm_stream_guard = _upstream_guard("llm_stream", 1.0, LLM_TIMEOUT_SECONDS, hedge=False, breaker=llm_guard.breaker)
+UPSTREAM_GUARDS = (embed_guard, vector_guard, llm_guard, llm_stream_guard)
+
+admission = AdmissionController()
+admission.add_stage("request", ADMISSION_MAX_INFLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+admission.add_stage("embedding", EMBED_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+admission.add_stage("vector", VECTOR_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+admission.add_stage("llm", LLM_CONCURRENCY, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+
 # Basic runtime diagnostics (do not print the key itself)
 if not OPENAI_API_KEY or len(OPENAI_API_KEY.strip()) == 0:
     print("⚠️ OPENAI_API_KEY is missing or empty. Ensure it is set in a .env file or environment.")
@@ -45,8 +208,68 @@ else:
 PRIMARY_OPENAI_MODEL = (OPENAI_MODEL or "gpt-3.5-turbo").strip()
 print(f"🔧 Configured OpenAI model: {PRIMARY_OPENAI_MODEL}")
 
+# Readiness of lazily initialized dependencies (see /ready)
+readiness: Dict[str, str] = {
+    "vector": "pending",
+    "embeddings": "pending" if USE_LOCAL_EMBEDDINGS else "skipped",
+    "mongo": "pending",
+}
+
+
+async def _warm_up(name: str, func) -> None:
+    try:
+        await asyncio.to_thread(func)
+    except Exception as e:
+        print(f"⚠️ Background init of {name} failed (will retry on first use):", e)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start serving immediately; connect dependencies in the background."""
+    global history_writer
+    init_mongo()
+    if HISTORY_WRITE_BEHIND and history_collection is not None:
+        history_writer = HistoryWriter(
+            insert_many=lambda docs: history_collection.insert_many(docs, ordered=True),
+            spill_path=HISTORY_SPILL_PATH or None,
+            batch_size=HISTORY_BATCH_SIZE,
+            flush_interval=HISTORY_FLUSH_INTERVAL,
+            max_queue=HISTORY_QUEUE_MAX,
+            overflow=HISTORY_OVERFLOW,
+            replay_interval=HISTORY_REPLAY_INTERVAL,
+        )
+        history_writer.start()
+        print(f"✅ Write-behind history enabled (batch {HISTORY_BATCH_SIZE}, every {HISTORY_FLUSH_INTERVAL}s)")
+    tasks = [asyncio.create_task(_warm_up("vector backends", init_vector_spaces))]
+    if history_collection is not None:
+        tasks.append(asyncio.create_task(ensure_history_indexes()))
+        if CACHE_WARMUP_ON_START:
+            tasks.append(start_cache_warmup(CACHE_WARMUP_LIMIT, CACHE_WARMUP_DAYS, CACHE_WARMUP_RATE, CACHE_WARMUP_ANSWERS))
+    if USE_LOCAL_EMBEDDINGS:
+        print("🔄 Loading local embedding model in the background...")
+        warm = _start_embed_pool if embed_pool is not None else _get_sentence_model
+        tasks.append(asyncio.create_task(_warm_up("local embedding model", warm)))
+    else:
+        print("✅ Local embeddings disabled - using OpenAI embeddings only")
+    yield
+    for task in tasks:
+        task.cancel()
+    if history_writer is not None:
+        await history_writer.close()
+    if local_batcher is not None:
+        await local_batcher.close()
+    if embed_pool is not None:
+        await asyncio.to_thread(embed_pool.close)
+    await http_client.aclose()
+    for index in list(vector_indexes.values()):
+        if isinstance(index, LocalVectorIndex):
+            await asyncio.to_thread(index.close)
+    if mongo_client is not None:
+        mongo_client.close()
+
+
 # Initialize app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     # In production, restrict this to your Vercel domain.
@@ -55,6 +278,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(AdmissionMiddleware, controller=admission, stage="request", prefixes=("/run",))
+app.add_middleware(TraceMiddleware, emit_headers=TRACE_HEADERS_ENABLED)
+
+EMBEDDING_FALLBACKS = REGISTRY.counter(
+    "embedding_fallbacks_total",
+    "Embedding fallbacks: openai_to_local (OpenAI failed) and fallback_vector (all providers failed)",
+    ["kind"],
+)
+
+
+@app.exception_handler(OverloadedError)
+async def overloaded_handler(request: Request, exc: OverloadedError):
+    status, body, headers = overloaded_response_parts(exc)
+    print(f"🚦 Shedding load at stage '{exc.stage}' ({status})")
+    return JSONResponse(status_code=status, content=body, headers=headers)
 
 # --- HEALTH CHECK ROUTES ---
 @app.get("/")
@@ -66,104 +304,399 @@ async def ping():
     print("✅ Pinged FastAPI")
     return {"message": "pong"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness: vector backend connected and (if enabled) local model loaded."""
+    required = ["vector"] + (["embeddings"] if USE_LOCAL_EMBEDDINGS else [])
+    is_ready = all(readiness[name] == "ready" for name in required)
+    return JSONResponse(status_code=200 if is_ready else 503, content={"ready": is_ready, "components": readiness})
+
 # --- Embeddings (OpenAI with local fallback) ---
-EMBED_DIM = 1536  # text-embedding-3-small
+LOCAL_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingSpace:
+    """One embedding model and the native-dimension index that holds its vectors."""
+
+    def __init__(self, name: str, model: str, dim: int, pinecone_index: str, pinecone_host: Optional[str],
+                 local_path: str, state_dir: str):
+        self.name = name
+        self.model = model
+        self.dim = dim
+        self.pinecone_index = pinecone_index
+        self.pinecone_host = pinecone_host
+        self.local_path = local_path
+        self.state_dir = state_dir
+
+
+EMBED_SPACES: Dict[str, EmbeddingSpace] = {
+    "openai": EmbeddingSpace("openai", OPENAI_EMBED_MODEL, OPENAI_EMBED_DIM, PINECONE_INDEX, PINECONE_INDEX_HOST,
+                             LOCAL_VECTOR_PATH, INGEST_STATE_DIR),
+    "local": EmbeddingSpace("local", LOCAL_EMBED_MODEL, LOCAL_EMBED_DIM, PINECONE_LOCAL_INDEX, PINECONE_LOCAL_INDEX_HOST,
+                            LOCAL_EMBED_VECTOR_PATH, os.path.join(INGEST_STATE_DIR, "local")),
+}
+# Queries and ingestion use the active space; OpenAI failures fall back to the local space's own index.
+ACTIVE_SPACE = "local" if USE_LOCAL_EMBEDDINGS or not OPENAI_API_KEY else "openai"
+EMBED_DIM = EMBED_SPACES[ACTIVE_SPACE].dim
 _sentence_model = None
 
+_sentence_model_lock = threading.Lock()
+
+def _local_model_source() -> str:
+    return LOCAL_EMBED_MODEL_PATH if LOCAL_EMBED_MODEL_PATH and os.path.isdir(LOCAL_EMBED_MODEL_PATH) else LOCAL_EMBED_MODEL
+
+embed_pool = EmbeddingWorkerPool(
+    _local_model_source(),
+    num_workers=LOCAL_EMBED_WORKERS,
+    max_batch=LOCAL_EMBED_BATCH_MAX,
+    job_timeout=LOCAL_EMBED_WORKER_TIMEOUT,
+) if LOCAL_EMBED_WORKERS > 0 else None
+
+def _start_embed_pool():
+    try:
+        embed_pool.start()
+        readiness["embeddings"] = "ready"
+    except Exception:
+        readiness["embeddings"] = "failed"
+        raise
+
 def _get_sentence_model():
     global _sentence_model
     if _sentence_model is None:
-        try:
-            from sentence_transformers import SentenceTransformer
-            _sentence_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-            print("✅ Local embedding model loaded successfully")
-        except ImportError as e:
-            print("❌ sentence-transformers not installed. Installing now...")
-            import subprocess
-            import sys
+        with _sentence_model_lock:
+            if _sentence_model is not None:
+                return _sentence_model
             try:
-                subprocess.check_call([sys.executable, "-m", "pip", "install", "sentence-transformers"])
                 from sentence_transformers import SentenceTransformer
-                _sentence_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-                print("✅ Local embedding model installed and loaded")
-            except Exception as install_error:
-                print(f"❌ Failed to install sentence-transformers: {install_error}")
-                raise RuntimeError("sentence-transformers is required for local embeddings") from install_error
-        except Exception as e:
-            print(f"❌ Failed to load sentence-transformers model: {e}")
-            raise RuntimeError(f"Failed to load local embedding model: {e}") from e
+            except ImportError as e:
+                readiness["embeddings"] = "failed"
+                raise RuntimeError("sentence-transformers is required for local embeddings; add it to the build") from e
+            source = _local_model_source()
+            try:
+                started = time.time()
+                _sentence_model = SentenceTransformer(source)
+                readiness["embeddings"] = "ready"
+                print(f"✅ Local embedding model loaded from {source} in {time.time() - started:.1f}s")
+            except Exception as e:
+                readiness["embeddings"] = "failed"
+                print(f"❌ Failed to load sentence-transformers model: {e}")
+                raise RuntimeError(f"Failed to load local embedding model: {e}") from e
     return _sentence_model
 
-def _expand_to_dim(vector, target_dim: int):
-    if len(vector) == target_dim:
-        return vector
-    if len(vector) > target_dim:
-        return vector[:target_dim]
-    return vector + [0.0] * (target_dim - len(vector))
+def _check_dim(space: EmbeddingSpace, vectors: List[list]) -> List[list]:
+    if vectors and len(vectors[0]) != space.dim:
+        raise ValueError(
+            f"{space.model} returned {len(vectors[0])}-dim vectors but the '{space.name}' space expects {space.dim}; "
+            f"set {'OPENAI' if space.name == 'openai' else 'LOCAL'}_EMBED_DIM"
+        )
+    return vectors
+
+FALLBACK_VECTOR = [0.1] * EMBED_DIM
+
+def _cache_backend(name: str, max_items: int, value_bytes: int, default_ttl: Optional[float] = None):
+    return make_backend(
+        CACHE_BACKEND, name, max_items, value_bytes, default_ttl, shm_dir=CACHE_SHM_DIR, sqlite_dir=CACHE_SQLITE_DIR
+    )
 
-# Preload local embedding model only if enabled
-if USE_LOCAL_EMBEDDINGS:
-    print("🔄 Loading local embedding model (this may take 10-30 seconds on first run)...")
+embedding_cache = None
+if EMBED_CACHE_ENABLED:
     try:
-        _get_sentence_model()
-        print("✅ Local embedding model preloaded successfully!")
+        embedding_cache = EmbeddingCache(
+            path=EMBED_CACHE_PATH or None,
+            memory_items=EMBED_CACHE_MEMORY_ITEMS,
+            dtype=EMBED_CACHE_DTYPE,
+            backend=_cache_backend("embeddings", EMBED_CACHE_MEMORY_ITEMS, 4 * max(OPENAI_EMBED_DIM, LOCAL_EMBED_DIM)),
+        )
+        print(f"✅ Embedding cache enabled ({CACHE_BACKEND} hot tier, {EMBED_CACHE_PATH or 'no disk tier'})")
     except Exception as e:
-        print("⚠️ Failed to preload local embedding model:", e)
-        print("💡 The model will load on first request (slower)")
-else:
-    print("✅ Local embeddings disabled - using OpenAI embeddings only")
+        print("⚠️ Embedding cache disabled:", e)
+
+def _openai_embed_batch(texts: List[str]) -> List[list]:
+    vectors: List[list] = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=texts[start:start + EMBED_BATCH_SIZE])
+        vectors.extend(item.embedding for item in sorted(resp.data, key=lambda d: d.index))
+    return vectors
+
+def _local_embed_batch(texts: List[str]) -> List[list]:
+    if embed_pool is not None:
+        return embed_pool.encode(texts)
+    model = _get_sentence_model()
+    return model.encode(texts, batch_size=min(len(texts), 64)).tolist()
+
+EMBED_BATCH_ITEMS = REGISTRY.histogram(
+    "local_embed_batch_size", "Texts per batched local encode call", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+EMBED_BATCH_WAIT = REGISTRY.histogram(
+    "local_embed_queue_wait_seconds", "Time a text waited in the local embedding batcher",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+EMBED_BATCH_ENCODE = REGISTRY.histogram("local_embed_encode_seconds", "Duration of one batched local encode call")
+
+def _observe_local_batch(size: int, waits: List[float], encode_seconds: float) -> None:
+    EMBED_BATCH_ITEMS.observe(size)
+    for wait in waits:
+        EMBED_BATCH_WAIT.observe(wait)
+    EMBED_BATCH_ENCODE.observe(encode_seconds)
+
+local_batcher = MicroBatcher(
+    _local_embed_batch,
+    max_batch=LOCAL_EMBED_BATCH_MAX,
+    max_wait_ms=LOCAL_EMBED_BATCH_WAIT_MS,
+    on_batch=_observe_local_batch,
+    concurrency=max(1, LOCAL_EMBED_WORKERS),
+) if LOCAL_EMBED_BATCHING else None
+
+def _embed_with_cache(model_name: str, texts: List[str], compute) -> List[list]:
+    """Serve texts from the embedding cache and compute only the misses in one batch (sync: ingestion threads, CLIs)."""
+    if embedding_cache is None:
+        return compute(texts)
+    vectors = embedding_cache.get_many(model_name, texts)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        computed = compute([texts[i] for i in missing])
+        embedding_cache.put_many(model_name, [texts[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+    return vectors
+
+def embed_texts(texts: List[str], space: Optional[str] = None) -> List[list]:
+    """Embed many texts in one space (default: active) with one provider call or local batch.
+
+    Used for ingestion, so there is no cross-model fallback: vectors must match the target index."""
+    if not texts:
+        return []
+    target = EMBED_SPACES[space or ACTIVE_SPACE]
+    if target.name == "openai":
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY is required to embed into the 'openai' space")
+        return _check_dim(target, _embed_with_cache(target.model, texts, _openai_embed_batch))
+    return _check_dim(target, _embed_with_cache(target.model, texts, _local_embed_batch))
+
+def embed_text(text: str, space: Optional[str] = None) -> list:
+    return embed_texts([text], space)[0]
 
-def embed_text(text: str) -> list:
-    use_local = USE_LOCAL_EMBEDDINGS or not OPENAI_API_KEY
-    
-    # Try OpenAI first if available and not forced to use local
-    if not use_local and client is not None:
+async def _aopenai_embed_batch(texts: List[str]) -> List[list]:
+    vectors: List[list] = []
+    async with admission.slot("embedding"):
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            chunk = texts[start:start + EMBED_BATCH_SIZE]
+            resp = await embed_guard.call(lambda: aclient.embeddings.create(
+                model=OPENAI_EMBED_MODEL, input=chunk, timeout=EMBED_TIMEOUT_SECONDS
+            ))
+            vectors.extend(item.embedding for item in sorted(resp.data, key=lambda d: d.index))
+    return vectors
+
+async def _alocal_embed_batch(texts: List[str]) -> List[list]:
+    async with admission.slot("embedding"):
+        if local_batcher is not None:
+            return await local_batcher.embed(texts)
+        return await asyncio.to_thread(_local_embed_batch, texts)
+
+async def _aembed_with_cache(model_name: str, texts: List[str], compute) -> List[list]:
+    """Request-path variant: in-memory hot-tier hits are served on the loop; SQLite reads/writes go to a thread."""
+    if embedding_cache is None:
+        return await compute(texts)
+    if embedding_cache.hot_tier_in_memory:
+        vectors = embedding_cache.get_hot_many(model_name, texts)
+        cold = embedding_cache.get_disk_many
+    else:
+        vectors = [None] * len(texts)
+        cold = embedding_cache.get_many
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        for i, vector in zip(missing, await asyncio.to_thread(cold, model_name, [texts[i] for i in missing])):
+            vectors[i] = vector
+        missing = [i for i in missing if vectors[i] is None]
+    if missing:
+        computed = await compute([texts[i] for i in missing])
+        await asyncio.to_thread(embedding_cache.put_many, model_name, [texts[i] for i in missing], computed)
+        for i, vector in zip(missing, computed):
+            vectors[i] = vector
+    return vectors
+
+async def aembed_texts(texts: List[str]) -> Tuple[str, List[list]]:
+    """Async embedding for the request path. Returns (space name, vectors) so the
+    caller queries the index that matches the model that actually answered."""
+    if not texts:
+        return ACTIVE_SPACE, []
+
+    if ACTIVE_SPACE == "openai" and aclient is not None:
+        space = EMBED_SPACES["openai"]
         try:
-            resp = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=text)
-            return resp.data[0].embedding
+            return space.name, _check_dim(space, await _aembed_with_cache(space.model, texts, _aopenai_embed_batch))
+        except OverloadedError:
+            raise
         except Exception as e:
+            if not fallback_space_ready("local"):
+                # The local space's index is missing or empty: its matches would silently be nothing
+                raise RuntimeError(f"OpenAI embedding failed and the local fallback index is not populated: {e}") from e
+            EMBEDDING_FALLBACKS.inc(kind="openai_to_local")
             print("⚠️ OpenAI embedding failed; falling back to local model:", e)
-    
-    # Fallback to local model
+
+    space = EMBED_SPACES["local"]
     try:
-        model = _get_sentence_model()
-        local_vec = model.encode(text).tolist()
-        return _expand_to_dim(local_vec, EMBED_DIM)
+        return space.name, _check_dim(space, await _aembed_with_cache(space.model, texts, _alocal_embed_batch))
+    except OverloadedError:
+        raise
     except Exception as e:
+        EMBEDDING_FALLBACKS.inc(kind="fallback_vector")
         print(f"❌ Local embedding also failed: {e}")
-        # Return a simple fallback vector to prevent complete failure
-        fallback_vector = [0.1] * EMBED_DIM
-        return fallback_vector
-
-# Connect to Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-if PINECONE_INDEX not in pc.list_indexes().names():
-    pc.create_index(
-        name=PINECONE_INDEX,
-        dimension=EMBED_DIM,
-        metric='cosine',
-        spec=ServerlessSpec(cloud='aws', region='us-east-1')
-    )
-index = pc.Index(PINECONE_INDEX)
+        return ACTIVE_SPACE, [list(FALLBACK_VECTOR) for _ in texts]
+
+run_flight = SingleFlight("run") if SINGLE_FLIGHT_ENABLED else None
+embed_flight = SingleFlight("embed") if SINGLE_FLIGHT_ENABLED else None
+vector_flight = SingleFlight("vector") if SINGLE_FLIGHT_ENABLED else None
+
+async def aembed_text(text: str) -> Tuple[str, list]:
+    if embed_flight is not None:
+        (space, vectors), _ = await embed_flight.do(text, lambda: aembed_texts([text]))
+    else:
+        space, vectors = await aembed_texts([text])
+    return space, vectors[0]
+
+# Vector backends (Pinecone or the in-process local index), one per embedding space, connected at startup
+vector_indexes: Dict[str, Any] = {}
+vector_queries: Dict[str, Any] = {}
+space_vectors: Dict[str, Optional[int]] = {}  # vectors per connected space when it was connected/last ingested into
+_vector_lock = threading.Lock()
+
+def _count_vectors(index) -> Optional[int]:
+    try:
+        stats = index.describe_index_stats()
+        return stats["total_vector_count"] if isinstance(stats, dict) else stats.total_vector_count
+    except Exception as e:
+        print("⚠️ Could not read index stats:", e)
+        return None
+
+def init_vector_backend(space_name: Optional[str] = None, create: bool = True):
+    """Connect the index for one embedding space (default: active) once; safe from any thread.
+
+    With create=False a missing Pinecone index raises instead of being created."""
+    space = EMBED_SPACES[space_name or ACTIVE_SPACE]
+    with _vector_lock:
+        if space.name in vector_indexes:
+            return vector_indexes[space.name]
+        try:
+            if VECTOR_BACKEND == "local":
+                local_index = LocalVectorIndex(
+                    space.local_path, dim=space.dim, ivf_lists=LOCAL_VECTOR_IVF_LISTS,
+                    nprobe=LOCAL_VECTOR_NPROBE, dtype=LOCAL_VECTOR_DTYPE,
+                )
+                if LOCAL_VECTOR_IVF_LISTS and local_index.describe_index_stats()["ivf_lists"] == 0:
+                    local_index.build_ivf()
+                print(f"✅ Using local vector index at {space.local_path} ({local_index.describe_index_stats()['total_vector_count']} vectors, {space.dim}-dim {LOCAL_VECTOR_DTYPE})")
+                vector_queries[space.name] = AsyncLocalQuery(local_index)
+                vector_indexes[space.name] = local_index
+            else:
+                from pinecone import Pinecone, ServerlessSpec
+                pc = Pinecone(api_key=PINECONE_API_KEY)
+                index_host = space.pinecone_host
+                if not index_host:
+                    if space.pinecone_index not in pc.list_indexes().names():
+                        if not create:
+                            raise RuntimeError(f"Pinecone index '{space.pinecone_index}' does not exist")
+                        pc.create_index(
+                            name=space.pinecone_index,
+                            dimension=space.dim,
+                            metric='cosine',
+                            spec=ServerlessSpec(cloud='aws', region='us-east-1')
+                        )
+                    index_host = pc.describe_index(space.pinecone_index).host
+                vector_queries[space.name] = AsyncPineconeQuery(http_client, index_host, PINECONE_API_KEY)
+                vector_indexes[space.name] = pc.Index(space.pinecone_index, host=index_host)
+                print(f"✅ Connected to Pinecone index '{space.pinecone_index}' ({space.dim}-dim, {space.model})")
+            space_vectors[space.name] = _count_vectors(vector_indexes[space.name])
+            if space.name == ACTIVE_SPACE:
+                readiness["vector"] = "ready"
+        except Exception:
+            if space.name == ACTIVE_SPACE:
+                readiness["vector"] = "failed"
+            raise
+    return vector_indexes[space.name]
+
+async def ensure_vector_backend(space_name: Optional[str] = None):
+    space_name = space_name or ACTIVE_SPACE
+    if space_name not in vector_queries:
+        # Only the active space may be (re)connected here; fallback spaces are connected at startup
+        await asyncio.to_thread(init_vector_backend, space_name, space_name == ACTIVE_SPACE)
+    return vector_queries[space_name]
+
+def init_vector_spaces() -> None:
+    """Startup: connect the active space (creating its index if needed) and, when OpenAI is active,
+    the local fallback space if its index already exists."""
+    init_vector_backend(ACTIVE_SPACE)
+    if ACTIVE_SPACE != "local":
+        try:
+            init_vector_backend("local", create=False)
+        except Exception as e:
+            print("⚠️ Local fallback space unavailable; OpenAI embedding failures will not fall back:", e)
+    for name, count in space_vectors.items():
+        if name != ACTIVE_SPACE and not count:
+            print(f"⚠️ The '{name}' space's index is empty; run `python migrate_embeddings.py --from {ACTIVE_SPACE} --to {name}`")
+
+def fallback_space_ready(space_name: str) -> bool:
+    """Whether queries embedded in a non-active space have an index with vectors to search."""
+    return space_name in vector_queries and bool(space_vectors.get(space_name))
+
+answer_cache = SemanticAnswerCache(
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    max_bytes=int(ANSWER_CACHE_MAX_MB * 1024 * 1024),
+) if ANSWER_CACHE_ENABLED else None
+
+policy_catalog = PolicyCatalog(POLICY_CATALOG_PATH)
+
+# Exact-query answers in the shared backend, so a question answered by one worker is a hit in all of them
+# (the semantic cache above stays per process).
+shared_answers = None
+if ANSWER_CACHE_ENABLED and CACHE_BACKEND != "memory":
+    try:
+        shared_answers = _cache_backend("answers", ANSWER_CACHE_MAX_ENTRIES, 8192, ANSWER_CACHE_TTL_SECONDS)
+        if shared_answers.kind == "memory":  # shm unavailable here; a per-process copy adds nothing
+            shared_answers = None
+        else:
+            print(f"✅ Shared answer cache enabled ({CACHE_BACKEND})")
+    except Exception as e:
+        print("⚠️ Shared answer cache disabled:", e)
+
+
+async def _shared_answers_call(fn, *args):
+    """Run a shared answer-cache operation; SQLite (5 s busy timeout under write
+    contention) goes to a thread, shared-memory reads and writes stay on the loop."""
+    if shared_answers.kind == "sqlite":
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
 
 """-------------------- MongoDB (users + history) --------------------"""
 mongo_client = None
 history_collection = None
 users_collection = None
+history_writer: Optional[HistoryWriter] = None
 
-if MONGO_URI and MOTOR_AVAILABLE and AsyncIOMotorClient:
-    try:
-        mongo_client = AsyncIOMotorClient(MONGO_URI)
-        db = mongo_client.get_database("bajaj_app")
-        history_collection = db.get_collection("search_history")
-        users_collection = db.get_collection("users")
-        print("✅ Connected to MongoDB (collections: users, search_history)")
-    except Exception as e:
-        print("⚠️ Mongo connection failed:", e)
-elif not MOTOR_AVAILABLE:
-    print("⚠️ MongoDB disabled - Motor not available")
-else:
-    print("⚠️ MongoDB disabled - no MONGO_URI provided")
+def init_mongo() -> None:
+    """Create the Motor client (it connects lazily, so this does no network I/O)."""
+    global mongo_client, history_collection, users_collection
+    if mongo_client is not None:
+        return
+    if MONGO_URI and MOTOR_AVAILABLE and AsyncIOMotorClient:
+        try:
+            mongo_client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+            db = mongo_client.get_database("bajaj_app")
+            history_collection = db.get_collection("search_history")
+            users_collection = db.get_collection("users")
+            readiness["mongo"] = "ready"
+            print("✅ Connected to MongoDB (collections: users, search_history)")
+        except Exception as e:
+            readiness["mongo"] = "failed"
+            print("⚠️ Mongo connection failed:", e)
+    elif not MOTOR_AVAILABLE:
+        readiness["mongo"] = "disabled"
+        print("⚠️ MongoDB disabled - Motor not available")
+    else:
+        readiness["mongo"] = "disabled"
+        print("⚠️ MongoDB disabled - no MONGO_URI provided")
 
 
 def extract_json_object_from_text(text: str) -> Optional[Dict[str, Any]]:
@@ -213,26 +746,29 @@ async def call_openai_for_json(messages: List[Dict[str, str]], models_to_try: Li
             "justification": "LLM disabled. Retrieved relevant clauses and prepared summary context, but cannot generate a decision without an LLM.",
         }
 
-    if client is None:
+    if aclient is None:
         raise RuntimeError("OPENAI_API_KEY missing and LLM_PROVIDER is not 'none'. Set a key or set LLM_PROVIDER=none")
 
     last_error: Optional[Exception] = None
     for model_name in models_to_try:
         try:
             print(f"🧠 Calling OpenAI model: {model_name}")
-            def _call():
-                return client.chat.completions.create(
-                    model=model_name,
-                    messages=messages,
-                    temperature=0.2,
-                    timeout=10.0,
-                )
-            response = await asyncio.wait_for(asyncio.to_thread(_call), timeout=12.0)
+            async with admission.slot("llm"):
+                with stage("llm"):
+                    response = await llm_guard.call(lambda: aclient.chat.completions.create(
+                        model=model_name,
+                        messages=messages,
+                        temperature=0.2,
+                        timeout=LLM_TIMEOUT_SECONDS,
+                    ))
             content = response.choices[0].message.content
-            parsed = extract_json_object_from_text(content)
+            with stage("json_extract"):
+                parsed = extract_json_object_from_text(content)
             if parsed is None:
                 raise ValueError("Model returned non-JSON content")
             return parsed
+        except (OverloadedError, CircuitOpenError):
+            raise
         except Exception as e:
             print(f"⚠️ OpenAI call failed for model '{model_name}':", e)
             last_error = e
@@ -240,42 +776,372 @@ async def call_openai_for_json(messages: List[Dict[str, str]], models_to_try: Li
     assert last_error is not None
     raise last_error
 
+DEGRADED_ANSWERS = REGISTRY.counter(
+    "degraded_answers_total", "Answers served from retrieved clauses without the LLM", ["reason"]
+)
+
+
+def degraded_answer(chunks: List[str], error: Exception) -> Dict[str, Any]:
+    """LLM_PROVIDER=none-style answer from the top clause when the LLM is failing or its breaker is open."""
+    reason = "circuit_open" if isinstance(error, CircuitOpenError) else "llm_error"
+    DEGRADED_ANSWERS.inc(reason=reason)
+    return {
+        "decision": "unknown",
+        "amount": None,
+        "justification": "The decision model is temporarily unavailable, so no decision was made. "
+                         f"Most relevant clause: {chunks[0][:500]}",
+        "degraded": True,
+    }
+
+
 class Query(BaseModel):
     query: str
     user_id: Optional[str] = None
     user_email: Optional[str] = None
+    policy_id: Optional[str] = None  # search only this policy's clauses
+    tenant: Optional[str] = None  # search only this insurer's policies
+
+
+def normalize_query(query: str) -> str:
+    """Coalescing key for /run: case- and whitespace-insensitive."""
+    return " ".join(query.split()).casefold()
+
+
+def scope_key(data: Query) -> str:
+    """Cache/coalescing key of a request's retrieval scope ("" when unscoped)."""
+    if not data.policy_id and not data.tenant:
+        return ""
+    return f"{data.policy_id or ''}@{data.tenant or ''}"
+
+
+def resolve_scope(data: Query) -> Optional[Tuple[str, ...]]:
+    """Policy ids the request may search (None = whole index); 404 for a policy/tenant the catalog does not know."""
+    try:
+        return policy_catalog.resolve(data.policy_id, data.tenant)
+    except UnknownScopeError as e:
+        print(f"⚠️ Rejected scope: {e}")
+        raise HTTPException(
+            status_code=404,
+            detail=f"{e}. Ingest it with that policy_id/tenant, or register existing chunks with "
+                   "`python migrate_embeddings.py --backfill-policies`",
+        )
+
+
+async def save_history(data: Query, parsed: Dict[str, Any], start_time: Optional[float] = None) -> None:
+    """Save a history record if Mongo is available (queued when write-behind is on)."""
+    try:
+        if history_collection is not None:
+            doc = {
+                "user_id": data.user_id,
+                "user_email": data.user_email,
+                "query": data.query,
+                "decision": parsed.get("decision"),
+                "amount": parsed.get("amount"),
+                "justification": parsed.get("justification"),
+                "created_at": datetime.utcnow(),
+            }
+            if start_time is not None:
+                doc["latency_ms"] = round((time.time() - start_time) * 1000, 1)
+            if data.policy_id or data.tenant:
+                doc.update(policy_id=data.policy_id, tenant=data.tenant)
+            if history_writer is not None:
+                with stage("history_enqueue"):
+                    await history_writer.submit(doc)
+                return
+            with stage("history_write"):
+                await history_collection.insert_one(doc)
+    except Exception as e:
+        print("⚠️ Failed to write history:", e)
 
 @app.post("/run")
 async def run_query(data: Query):
-    import time
     start_time = time.time()
     print("🚀 Endpoint hit")
     print(f"📩 Received query: {data.query[:100]}...")
+    resolve_scope(data)  # fail fast on an unknown scope, before embedding
+    if run_flight is None:
+        return await answer_query(data, start_time)
+
+    async def shared_pipeline():
+        answered: Dict[str, Any] = {}
+
+        async def keep(parsed: Dict[str, Any]) -> None:
+            answered["parsed"] = parsed
+
+        response = await answer_query(data, start_time, on_answer=keep)
+        return response, answered.get("parsed")
+
+    # Identical concurrent queries share one pipeline run; each caller still writes its own history.
+    (response, parsed), shared = await run_flight.do((scope_key(data), normalize_query(data.query)), shared_pipeline)
+    if parsed is not None:
+        await save_history(data, parsed, start_time)
+    if shared:
+        print("🔗 Joined an identical in-flight query")
+        response = dict(response, coalesced=True)
+        if "response_time" in response:
+            response["response_time"] = f"{time.time() - start_time:.2f}s"
+    return response
 
+
+async def answer_query(
+    data: Query,
+    start_time: float,
+    on_answer: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """Steps 1-5 for one query: embedding, then answer_with_vector."""
     # Step 1: Generate query embedding
     try:
         embedding_start = time.time()
-        query_vector = await asyncio.wait_for(asyncio.to_thread(embed_text, data.query), timeout=8.0)
+        with stage("embedding"):
+            space, query_vector = await asyncio.wait_for(aembed_text(data.query), timeout=8.0)
         embedding_time = time.time() - embedding_start
         print(f"✅ Query embedding created in {embedding_time:.2f}s")
+    except OverloadedError:
+        raise
     except Exception as e:
         print("❌ Embedding failed:", e)
         return {"decision": None, "amount": None, "justification": "Embedding failed"}
 
-    # Step 2: Query Pinecone
+    return await answer_with_vector(data, space, query_vector, start_time, on_answer=on_answer)
+
+
+def _shared_answer_key(data: Query) -> str:
+    return f"{ACTIVE_SPACE}:{scope_key(data)}:{normalize_query(data.query)}"
+
+
+async def lookup_cached_answer(space: str, query_vector: list, data: Query) -> Optional[Dict[str, Any]]:
+    """Step 1b: Shared exact-query cache, then the semantic answer cache (skip Pinecone + LLM)."""
+    if answer_cache is None or space != ACTIVE_SPACE or query_vector == FALLBACK_VECTOR:
+        return None
+    if shared_answers is not None:
+        blob = await _shared_answers_call(shared_answers.get, _shared_answer_key(data))
+        if blob is not None:
+            print("⚡ Shared answer cache hit")
+            return json.loads(blob)
+    cached = answer_cache.lookup(query_vector, scope_key(data))
+    if cached is not None:
+        print(f"⚡ Answer cache hit (similarity {cached['similarity']:.3f})")
+    return cached
+
+
+lexical_index = None
+if LEXICAL_INDEX_ENABLED:
     try:
-        def _q():
-            return index.query(vector=query_vector, top_k=3, include_metadata=True)
-        pinecone_res = await asyncio.wait_for(asyncio.to_thread(_q), timeout=6.0)
-        matches = pinecone_res.get('matches', [])
-        print(f"🔍 Pinecone matches: {len(matches)}")
+        lexical_index = BM25Index(LEXICAL_INDEX_PATH)
+        print(f"✅ Lexical index enabled ({LEXICAL_INDEX_PATH}, {lexical_index.stats()['docs']} chunks)")
     except Exception as e:
-        print("❌ Pinecone query failed:", e)
-        return {"decision": None, "amount": None, "justification": "Pinecone query failed"}
+        print("⚠️ Lexical index disabled:", e)
+
+RETRIEVAL_PATHS = REGISTRY.counter(
+    "retrieval_path_total", "Retrievals by path: hybrid, vector only, or lexical exact match (vector call skipped)", ["path"]
+)
+
+
+def vector_routes(scope: Optional[Tuple[str, ...]]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+    """(namespace, filter) queries that cover a scope; their matches are merged by score."""
+    if SCOPE_ROUTING == "namespace":
+        if scope is None:  # unscoped: the default namespace plus every policy namespace
+            return [("", None)] + [(ns, None) for ns in policy_catalog.namespaces() if ns]
+        return [(policy_catalog.namespace(policy_id), None) for policy_id in scope]
+    if scope is None:
+        return [("", None)]
+    return [("", {"policy_id": scope[0] if len(scope) == 1 else {"$in": list(scope)}})]
+
+
+async def vector_matches(space: str, query_vector: list, top_k: int, scope: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+    vq = await ensure_vector_backend(space)
+
+    async def routed(namespace: str, metadata_filter: Optional[Dict[str, Any]]):
+        async def query():
+            async with admission.slot("vector"):
+                with stage("vector_query"):
+                    return await vector_guard.call(lambda: vq.query(
+                        vector=query_vector, top_k=top_k, include_metadata=True,
+                        namespace=namespace or None, filter=metadata_filter,
+                    ), hedge=isinstance(vq, AsyncPineconeQuery))
+
+        if vector_flight is None:
+            return await query()
+        key = (space, top_k, namespace, json.dumps(metadata_filter, sort_keys=True), tuple(query_vector))
+        result, _ = await vector_flight.do(key, query)
+        return result
+
+    routes = vector_routes(scope)
+    if not routes:
+        return []
+    if len(routes) == 1:
+        matches = (await routed(*routes[0])).get('matches', [])
+    else:
+        results = await asyncio.gather(*(routed(ns, f) for ns, f in routes))
+        matches = sorted((m for r in results for m in r.get('matches', [])), key=lambda m: m.get('score') or 0.0, reverse=True)[:top_k]
+    print(f"🔍 Pinecone matches: {len(matches)}")
+    return [
+        {"id": m.get('id'), "text": m['metadata']['text'], "score": m.get('score')}
+        for m in matches if 'metadata' in m and 'text' in m['metadata']
+    ]
+
+
+async def lexical_matches(query: str, top_k: int, scope: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+    with stage("lexical_query"):
+        return await asyncio.to_thread(lexical_index.search, query, top_k, scope)
+
+
+async def retrieve_matches(
+    space: str, query_vector: list, query: str, top_k: Optional[int] = None, scope: Optional[Tuple[str, ...]] = None
+) -> List[Dict[str, Any]]:
+    """Steps 2-3: vector (and lexical) search; returns [{"id", "text", "score"}] for the matched clauses.
+
+    `scope` limits both searches to those policy ids (None searches everything).
+    The lexical search gets a short head start: a confident exact match skips the vector call,
+    otherwise both run concurrently and are fused by reciprocal rank."""
+    top_k = top_k or RETRIEVAL_TOP_K
+    if scope is not None and not scope:
+        print("⚠️ No policy matches the requested scope")
+        return []
+    if lexical_index is None:
+        RETRIEVAL_PATHS.inc(path="vector")
+        return await vector_matches(space, query_vector, top_k, scope)
+
+    lexical_task = asyncio.create_task(lexical_matches(query, top_k, scope))
+    done, _ = await asyncio.wait({lexical_task}, timeout=LEXICAL_HEADSTART_MS / 1000.0)
+    if (LEXICAL_SKIP_VECTOR and done and not lexical_task.exception()
+            and lexical_index.is_confident(query, lexical_task.result(), LEXICAL_CONFIDENT_MARGIN)):
+        RETRIEVAL_PATHS.inc(path="lexical_exact")
+        print("🎯 Confident lexical match; skipping the vector query")
+        return lexical_task.result()
 
-    # Step 3: Show chunks
-    chunks = [m['metadata']['text'] for m in matches if 'metadata' in m and 'text' in m['metadata']]
+    try:
+        vector = await vector_matches(space, query_vector, top_k, scope)
+    except BaseException:
+        lexical_task.cancel()
+        raise
+    try:
+        lexical = await lexical_task
+    except Exception as e:
+        print("⚠️ Lexical search failed; using vector matches only:", e)
+        RETRIEVAL_PATHS.inc(path="vector")
+        return vector
+    RETRIEVAL_PATHS.inc(path="hybrid" if lexical else "vector")
+    return reciprocal_rank_fusion([vector, lexical], top_k) if lexical else vector
+
+
+context_budgeter = ContextBudgeter(max_tokens=CONTEXT_MAX_TOKENS) if CONTEXT_BUDGET_ENABLED else None
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "llm_context_tokens", "Clause tokens sent to the LLM after context budgeting",
+    buckets=(50, 100, 200, 400, 600, 800, 1200, 1600, 2400, 3200),
+)
+
+
+def assemble_context(query: str, matches: List[Dict[str, Any]]) -> Tuple[List[str], int]:
+    """Step 3b: drop near-duplicate clauses, rank by score and trim to the token budget."""
+    if context_budgeter is None:
+        chunks = [m["text"] for m in matches]
+        tokens = sum(count_tokens(c) for c in chunks)
+    else:
+        with stage("context"):
+            context = context_budgeter.assemble(query, matches)
+        chunks, tokens = context["chunks"], context["tokens"]
+        print(f"✂️ Context: {len(chunks)} clauses, {tokens} tokens (from {context['input_tokens']}, {context['duplicates']} duplicates)")
+    CONTEXT_TOKENS.observe(tokens)
     print(f"🧩 Extracted chunks: {len(chunks)}")
+    return chunks, tokens
+
+
+def build_messages(query: str, chunks: List[str]) -> List[Dict[str, str]]:
+    """Step 4: GPT prompt."""
+    prompt = f"Query: {query}\n\nRelevant Clauses:\n" + "\n".join(chunks)
+    system_msg = "You are an insurance policy assistant. Analyze the query based on the clauses."
+    user_msg = "Respond ONLY in JSON with keys: decision, amount, justification. No explanation text."
+    return [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": prompt},
+        {"role": "user", "content": user_msg},
+    ]
+
+
+async def record_answer(
+    data: Query,
+    space: str,
+    query_vector: list,
+    parsed: Dict[str, Any],
+    start_time: float,
+    on_answer: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    context_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cache and persist a fresh answer (on_answer replaces the history write), then shape the /run response.
+
+    Degraded answers are returned but neither cached nor written to history."""
+    degraded = bool(parsed.get("degraded"))
+    if answer_cache is not None and not degraded and space == ACTIVE_SPACE and query_vector != FALLBACK_VECTOR:
+        answer = {
+            "decision": parsed.get("decision"),
+            "amount": parsed.get("amount"),
+            "justification": parsed.get("justification"),
+        }
+        answer_cache.store(query_vector, answer, scope_key(data))
+        if shared_answers is not None:
+            await _shared_answers_call(
+                shared_answers.set, _shared_answer_key(data), json.dumps(answer, default=str).encode("utf-8")
+            )
+
+    if not degraded:
+        await (on_answer(parsed) if on_answer is not None else save_history(data, parsed, start_time))
+
+    total_time = time.time() - start_time
+    print(f"🎯 Total response time: {total_time:.2f}s")
+    response = {
+        "decision": parsed.get("decision"),
+        "amount": parsed.get("amount"),
+        "justification": parsed.get("justification"),
+        "response_time": f"{total_time:.2f}s"
+    }
+    if context_tokens is not None:
+        response["context_tokens"] = context_tokens
+    if degraded:
+        response["degraded"] = True
+    return response
+
+
+async def cached_response(
+    data: Query,
+    cached: Dict[str, Any],
+    start_time: float,
+    on_answer: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    await (on_answer(cached) if on_answer is not None else save_history(data, cached, start_time))
+    total_time = time.time() - start_time
+    print(f"🎯 Total response time: {total_time:.2f}s")
+    return {
+        "decision": cached.get("decision"),
+        "amount": cached.get("amount"),
+        "justification": cached.get("justification"),
+        "response_time": f"{total_time:.2f}s",
+        "cached": True,
+    }
+
+
+async def answer_with_vector(
+    data: Query,
+    space: str,
+    query_vector: list,
+    start_time: float,
+    llm_limit: Optional[asyncio.Semaphore] = None,
+    on_answer: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> Dict[str, Any]:
+    """Run the pipeline after embedding: answer cache, vector query, LLM, history."""
+    scope = resolve_scope(data)
+    cached = await lookup_cached_answer(space, query_vector, data)
+    if cached is not None:
+        return await cached_response(data, cached, start_time, on_answer=on_answer)
+
+    try:
+        matches = await retrieve_matches(space, query_vector, data.query, scope=scope)
+    except OverloadedError:
+        raise
+    except Exception as e:
+        print("❌ Pinecone query failed:", e)
+        return {"decision": None, "amount": None, "justification": "Pinecone query failed"}
+    chunks, context_tokens = assemble_context(data.query, matches)
 
     if not chunks:
         print("⚠️ No text chunks found in matches")
@@ -285,65 +1151,467 @@ async def run_query(data: Query):
             "justification": "No relevant policy text found."
         }
 
-    # Step 4: GPT prompt
-    prompt = f"Query: {data.query}\n\nRelevant Clauses:\n" + "\n".join(chunks)
-    system_msg = "You are an insurance policy assistant. Analyze the query based on the clauses."
-    user_msg = "Respond ONLY in JSON with keys: decision, amount, justification. No explanation text."
-
     try:
-        messages = [
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": prompt},
-            {"role": "user", "content": user_msg},
-        ]
+        messages = build_messages(data.query, chunks)
         candidate_models = get_candidate_models(PRIMARY_OPENAI_MODEL)
-        parsed = await call_openai_for_json(messages, candidate_models)
+        async with llm_limit or contextlib.nullcontext():
+            parsed = await call_openai_for_json(messages, candidate_models)
+    except OverloadedError:
+        raise
+    except Exception as e:
+        print(f"❌ GPT call or JSON parse failed in {time.time() - start_time:.2f}s; serving a degraded answer:", e)
+        parsed = degraded_answer(chunks, e)
+    return await record_answer(
+        data, space, query_vector, parsed, start_time, on_answer=on_answer, context_tokens=context_tokens
+    )
+
+
+def _sse(event: str, payload: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+async def stream_openai_completion(messages: List[Dict[str, str]], model_name: str):
+    """Yield content deltas of a streamed chat completion."""
+    async with admission.slot("llm"):
+        with stage("llm"):
+            # Only opening the stream is guarded (breaker + adaptive timeout); a stream is never hedged.
+            stream = await llm_stream_guard.call(lambda: aclient.chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=0.2,
+                timeout=LLM_TIMEOUT_SECONDS,
+                stream=True,
+            ), hedge=False)
+            async for event in stream:
+                delta = event.choices[0].delta.content if event.choices else None
+                if delta:
+                    yield delta
 
-        # Save history if Mongo is available
+
+@app.post("/run/stream")
+async def run_query_stream(data: Query):
+    """SSE variant of /run: clauses first, then LLM tokens, early `field` events
+    for decision/amount, and finally the same JSON /run would return."""
+    start_time = time.time()
+    print(f"📡 Streaming query: {data.query[:100]}...")
+    scope = resolve_scope(data)
+
+    async def events():
         try:
-            if history_collection is not None:
-                doc = {
-                    "user_id": data.user_id,
-                    "user_email": data.user_email,
-                    "query": data.query,
-                    "decision": parsed.get("decision"),
-                    "amount": parsed.get("amount"),
-                    "justification": parsed.get("justification"),
-                    "created_at": datetime.utcnow(),
-                }
-                await history_collection.insert_one(doc)
+            with stage("embedding"):
+                space, query_vector = await asyncio.wait_for(aembed_text(data.query), timeout=8.0)
         except Exception as e:
-            print("⚠️ Failed to write history:", e)
+            print("❌ Embedding failed:", e)
+            yield _sse("result", {"decision": None, "amount": None, "justification": "Embedding failed"})
+            return
 
-        total_time = time.time() - start_time
-        print(f"🎯 Total response time: {total_time:.2f}s")
-        return {
-            "decision": parsed.get("decision"),
-            "amount": parsed.get("amount"),
-            "justification": parsed.get("justification"),
-            "response_time": f"{total_time:.2f}s"
-        }
+        cached = await lookup_cached_answer(space, query_vector, data)
+        if cached is not None:
+            yield _sse("result", await cached_response(data, cached, start_time))
+            return
+
+        try:
+            matches = await retrieve_matches(space, query_vector, data.query, scope=scope)
+        except Exception as e:
+            print("❌ Pinecone query failed:", e)
+            yield _sse("result", {"decision": None, "amount": None, "justification": "Pinecone query failed"})
+            return
+        chunks, context_tokens = assemble_context(data.query, matches)
+        yield _sse("clauses", {"chunks": chunks})
+        if not chunks:
+            yield _sse("result", {"decision": None, "amount": None, "justification": "No relevant policy text found."})
+            return
+
+        messages = build_messages(data.query, chunks)
+        content = ""
+        try:
+            if LLM_PROVIDER == "none" or aclient is None:
+                parsed = await call_openai_for_json(messages, get_candidate_models(PRIMARY_OPENAI_MODEL))
+            else:
+                parser = IncrementalJSONParser()
+                async for delta in stream_openai_completion(messages, get_candidate_models(PRIMARY_OPENAI_MODEL)[0]):
+                    content += delta
+                    yield _sse("token", {"text": delta})
+                    for key, value in parser.feed(delta):
+                        yield _sse("field", {"key": key, "value": value})
+                with stage("json_extract"):
+                    parsed = extract_json_object_from_text(content)
+                if parsed is None:
+                    raise ValueError("Model returned non-JSON content")
+            yield _sse("result", await record_answer(
+                data, space, query_vector, parsed, start_time, context_tokens=context_tokens
+            ))
+        except Exception as e:
+            if not content:
+                print("❌ GPT stream failed before any tokens; serving a degraded answer:", e)
+                yield _sse("result", await record_answer(
+                    data, space, query_vector, degraded_answer(chunks, e), start_time, context_tokens=context_tokens
+                ))
+                return
+            total_time = time.time() - start_time
+            print(f"❌ GPT stream or JSON parse failed in {total_time:.2f}s:", e)
+            yield _sse("result", {
+                "decision": None,
+                "amount": None,
+                "justification": "GPT processing failed",
+                "response_time": f"{total_time:.2f}s"
+            })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class BatchQuery(BaseModel):
+    queries: List[Query]
+
+
+@app.post("/run/batch")
+async def run_batch(data: BatchQuery):
+    """Answer many queries at once: one embedding batch, concurrent retrieval,
+    LLM calls under a concurrency limit, and per-item results/errors."""
+    if len(data.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_QUERIES} queries")
+    start_time = time.time()
+    print(f"📦 Batch endpoint hit with {len(data.queries)} queries")
+    if not data.queries:
+        return {"results": [], "count": 0, "response_time": "0.00s"}
+
+    try:
+        with stage("embedding"):
+            space, vectors = await asyncio.wait_for(
+                aembed_texts([q.query for q in data.queries]),
+                timeout=8.0 + 0.05 * len(data.queries),
+            )
+        print(f"✅ Batch embeddings created in {time.time() - start_time:.2f}s")
     except Exception as e:
-        total_time = time.time() - start_time
-        print(f"❌ GPT call or JSON parse failed in {total_time:.2f}s:", e)
+        print("❌ Batch embedding failed:", e)
         return {
-            "decision": None,
-            "amount": None,
-            "justification": "GPT processing failed",
-            "response_time": f"{total_time:.2f}s"
+            "results": [
+                {"index": i, "decision": None, "amount": None, "justification": "Embedding failed", "error": str(e)}
+                for i in range(len(data.queries))
+            ],
+            "count": len(data.queries),
+            "response_time": f"{time.time() - start_time:.2f}s",
         }
 
+    llm_limit = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    item_limit = asyncio.Semaphore(max(1, BATCH_ITEM_CONCURRENCY))
+
+    async def _answer(i: int, item: Query, vector: list) -> Dict[str, Any]:
+        try:
+            async with item_limit:
+                result = await answer_with_vector(item, space, vector, start_time, llm_limit=llm_limit)
+        except Exception as e:
+            print(f"❌ Batch item {i} failed:", e)
+            result = {"decision": None, "amount": None, "justification": "Processing failed", "error": str(e)}
+        return {"index": i, **result}
+
+    results = await asyncio.gather(*(_answer(i, q, v) for i, (q, v) in enumerate(zip(data.queries, vectors))))
+    total_time = time.time() - start_time
+    print(f"🎯 Batch of {len(results)} answered in {total_time:.2f}s")
+    return {"results": results, "count": len(results), "response_time": f"{total_time:.2f}s"}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "embedding_cache": await asyncio.to_thread(embedding_cache.stats) if embedding_cache is not None else None,
+        "shared_answer_cache": await _shared_answers_call(shared_answers.stats) if shared_answers is not None else None,
+        "lexical_index": lexical_index.stats() if lexical_index is not None else None,
+        "policy_catalog": policy_catalog.stats(),
+        "context_budget": context_budgeter.stats() if context_budgeter is not None else None,
+        "upstreams": {g.name: g.stats() for g in UPSTREAM_GUARDS},
+        "single_flight": {f.name: f.stats() for f in (run_flight, embed_flight, vector_flight) if f is not None},
+    }
+
+
+def _collect_pipeline_metrics():
+    """Scrape-time samples from the caches and the admission controller."""
+    if answer_cache is not None:
+        stats = answer_cache.stats()
+        for result, key in (("hit", "hits"), ("miss", "misses")):
+            yield ("answer_cache_lookups_total", "counter", "Semantic answer cache lookups", {"result": result}, stats[key])
+        yield ("answer_cache_hit_ratio", "gauge", "Semantic answer cache hit ratio", {}, stats["hit_ratio"])
+        yield ("answer_cache_entries", "gauge", "Cached answers", {}, stats["entries"])
+    if embedding_cache is not None:
+        stats = embedding_cache.stats(count_disk=False)  # runs on the event loop: no SQLite scan
+        for result, key in (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses")):
+            yield ("embedding_cache_lookups_total", "counter", "Embedding cache lookups", {"result": result}, stats[key])
+        yield ("embedding_cache_hit_ratio", "gauge", "Embedding cache hit ratio", {}, stats["hit_ratio"])
+    if shared_answers is not None:
+        stats = shared_answers.stats(count_entries=shared_answers.kind != "sqlite")  # no table scan on the loop
+        for result, key in (("hit", "hits"), ("miss", "misses")):
+            yield ("shared_answer_cache_lookups_total", "counter", "Exact-query answer lookups in the cross-worker cache", {"result": result, "backend": stats["backend"]}, stats[key])
+        if stats["entries"] is not None:
+            yield ("shared_answer_cache_entries", "gauge", "Answers in the cross-worker cache (all workers)", {"backend": stats["backend"]}, stats["entries"])
+    for name, stats in admission.stats().items():
+        yield ("admission_active", "gauge", "Work holding an admission slot", {"stage": name}, stats["active"])
+        yield ("admission_waiting", "gauge", "Work queued for an admission slot", {"stage": name}, stats["waiting"])
+        yield ("admission_rejected_total", "counter", "Load-shed requests", {"stage": name, "reason": "queue_full"}, stats["rejected_full"])
+        yield ("admission_rejected_total", "counter", "Load-shed requests", {"stage": name, "reason": "queue_timeout"}, stats["rejected_timeout"])
+    if history_writer is not None:
+        stats = history_writer.stats()
+        yield ("history_queue_depth", "gauge", "History records waiting to be written", {}, stats["queued"])
+        for outcome in ("written", "dropped", "spilled", "replayed"):
+            yield ("history_records_total", "counter", "History records by outcome", {"outcome": outcome}, stats[outcome])
+        yield ("history_batches_total", "counter", "History insert_many batches", {}, stats["batches"])
+    if embed_pool is not None:
+        stats = embed_pool.stats()
+        yield ("embed_workers_alive", "gauge", "Live local embedding worker processes", {}, stats["alive"])
+        yield ("embed_worker_restarts_total", "counter", "Embedding worker restarts after a crash or timeout", {}, stats["restarts"])
+        for slot, pending in enumerate(stats["pending"]):
+            yield ("embed_worker_pending", "gauge", "Outstanding batches per embedding worker", {"worker": slot}, pending)
+    if context_budgeter is not None:
+        stats = context_budgeter.stats()
+        yield ("context_tokens_total", "counter", "Clause tokens before and after context budgeting", {"stage": "retrieved"}, stats["tokens_in"])
+        yield ("context_tokens_total", "counter", "Clause tokens before and after context budgeting", {"stage": "sent"}, stats["tokens_out"])
+        yield ("context_duplicate_chunks_total", "counter", "Retrieved chunks dropped as near-duplicates", {}, stats["duplicates"])
+    for guard in UPSTREAM_GUARDS:
+        stats = guard.stats()
+        labels = {"upstream": guard.name}
+        yield ("upstream_breaker_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)", labels, BREAKER_STATES[stats["breaker"]])
+        yield ("upstream_breaker_opens_total", "counter", "Times the circuit breaker opened", labels, stats["breaker_opens"])
+        for result, key in (("failure", "failures"), ("timeout", "timeouts"), ("rejected", "rejected")):
+            yield ("upstream_call_errors_total", "counter", "Upstream calls that failed, timed out or were rejected by an open breaker", {**labels, "result": result}, stats[key])
+        yield ("upstream_calls_total", "counter", "Guarded upstream calls", labels, stats["calls"])
+        yield ("upstream_hedges_total", "counter", "Hedged duplicate requests sent", labels, stats["hedges"])
+        yield ("upstream_hedge_wins_total", "counter", "Hedged duplicates that answered first", labels, stats["hedge_wins"])
+        yield ("upstream_hedge_rate", "gauge", "Share of calls that were hedged", labels, stats["hedge_rate"])
+        yield ("upstream_timeout_seconds", "gauge", "Current adaptive timeout", labels, stats["timeout_seconds"])
+    for flight in (run_flight, embed_flight, vector_flight):
+        if flight is None:
+            continue
+        stats = flight.stats()
+        yield ("single_flight_calls_total", "counter", "Coalesced calls: leaders ran the work, followers joined it", {"layer": flight.name, "role": "leader"}, stats["leaders"])
+        yield ("single_flight_calls_total", "counter", "Coalesced calls: leaders ran the work, followers joined it", {"layer": flight.name, "role": "follower"}, stats["followers"])
+        yield ("single_flight_inflight", "gauge", "Distinct keys currently executing", {"layer": flight.name}, stats["inflight"])
+
+REGISTRY.add_collector(_collect_pipeline_metrics)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admission")
+async def admission_stats():
+    return admission.stats()
+
+
+def invalidate_answers() -> int:
+    """Drop this worker's semantic answers and the shared exact-query answers of every worker."""
+    if shared_answers is not None:
+        shared_answers.clear()
+    return answer_cache.invalidate() if answer_cache is not None else 0
+
+
+@app.post("/cache/invalidate")
+async def invalidate_cache():
+    """Drop cached answers; call this whenever the index content changes."""
+    dropped = await asyncio.to_thread(invalidate_answers)  # may clear a SQLite table
+    print(f"🧹 Answer cache invalidated ({dropped} entries dropped)")
+    return {"invalidated": dropped}
+
+
+# --- Ingestion ---
+ingest_jobs: Dict[str, Dict[str, Any]] = {}
+_background_tasks: set = set()
+
+def ingest_document(
+    path: str,
+    source: Optional[str] = None,
+    progress=None,
+    space: Optional[str] = None,
+    policy_id: Optional[str] = None,
+    tenant: Optional[str] = None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Ingest one PDF into an embedding space's index (default: active), register its policy
+    for scoped retrieval and drop stale cached answers."""
+    target = EMBED_SPACES[space or ACTIVE_SPACE]
+    kwargs.setdefault("upsert_concurrency", INGEST_UPSERT_CONCURRENCY)
+    if SCOPE_ROUTING == "namespace" and policy_id is None:
+        policy_id = file_sha256(path)[:16]  # the default policy id, needed up front to name the namespace
+    summary = ingest_pdf(
+        path,
+        embed_batch=lambda texts: embed_texts(texts, target.name),
+        index=init_vector_backend(target.name),
+        source=source,
+        state_dir=target.state_dir,
+        on_records=lexical_index.add if lexical_index is not None else None,
+        progress=progress,
+        policy_id=policy_id,
+        tenant=tenant,
+        namespace=policy_id if SCOPE_ROUTING == "namespace" else "",
+        **kwargs,
+    )
+    # Also on a skip: the catalog may predate this document's entry (or have been reset)
+    policy_catalog.register(
+        summary["policy_id"], tenant, summary["namespace"], summary["chunks"], summary["source"], doc_id=summary["doc_id"]
+    )
+    if not summary["skipped"]:
+        space_vectors[target.name] = (space_vectors.get(target.name) or 0) + summary["chunks"]
+        invalidate_answers()
+    return summary
+
+
+async def _run_ingest_job(job_id: str, path: str, source: str, policy_id: Optional[str], tenant: Optional[str]) -> None:
+    job = ingest_jobs[job_id]
+    try:
+        job["status"] = "running"
+        job["result"] = await asyncio.to_thread(
+            ingest_document, path, source=source, progress=lambda info: job.update(progress=info),
+            policy_id=policy_id, tenant=tenant,
+        )
+        job["status"] = "done"
+    except Exception as e:
+        print(f"❌ Ingestion failed for '{source}':", e)
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        os.unlink(path)
+
+
+@app.post("/ingest")
+async def ingest(
+    file: UploadFile = File(...),
+    policy_id: Optional[str] = Form(None),
+    tenant: Optional[str] = Form(None),
+):
+    """Upload a policy PDF (optionally tagged with its policy_id and tenant); ingestion runs
+    in the background (poll /ingest/{job_id})."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, 1024 * 1024)
+    job_id = uuid.uuid4().hex
+    ingest_jobs[job_id] = {"job_id": job_id, "source": file.filename, "status": "queued", "progress": None}
+    task = asyncio.create_task(_run_ingest_job(job_id, tmp.name, file.filename, policy_id, tenant))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return ingest_jobs[job_id]
+
+
+@app.get("/ingest/{job_id}")
+async def ingest_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return job
+
+
+# --- Cache warm-up ---
+warmup_status: Dict[str, Any] = {"state": "idle"}
+_warmup_task: Optional[asyncio.Task] = None
+
+
+class WarmupRequest(BaseModel):
+    limit: int = CACHE_WARMUP_LIMIT
+    days: float = CACHE_WARMUP_DAYS
+    rate: float = CACHE_WARMUP_RATE
+    answers: bool = CACHE_WARMUP_ANSWERS
+
+
+async def warm_query(text: str, answers: bool = True) -> None:
+    """Pre-compute one historical query: its embedding, and (with answers) its cached answer.
+
+    Runs the normal pipeline with a no-op on_answer, so nothing is written to history."""
+    if not answers:
+        await aembed_text(text)
+        return
+
+    async def skip_history(parsed: Dict[str, Any]) -> None:
+        return None
+
+    await answer_query(Query(query=text, user_id="warmup"), time.time(), on_answer=skip_history)
+
+
+def start_cache_warmup(limit: int, days: float, rate: float, answers: bool) -> asyncio.Task:
+    global _warmup_task
+    print(f"🔥 Warming caches from search_history (top {limit} of {days:g} days, {rate:g}/s)")
+    _warmup_task = asyncio.create_task(warm_from_history(
+        history_collection, lambda text: warm_query(text, answers),
+        limit=limit, days=days, rate=rate, status=warmup_status,
+    ))
+    _background_tasks.add(_warmup_task)
+    _warmup_task.add_done_callback(_background_tasks.discard)
+    return _warmup_task
+
+
+@app.post("/cache/warm")
+async def cache_warm(req: WarmupRequest):
+    """Start a background warm-up from the most frequent recent queries (poll GET /cache/warm)."""
+    if history_collection is None:
+        raise HTTPException(status_code=503, detail="History database unavailable")
+    if _warmup_task is not None and not _warmup_task.done():
+        raise HTTPException(status_code=409, detail="A warm-up is already running")
+    start_cache_warmup(req.limit, req.days, req.rate, req.answers)
+    return warmup_status
+
+
+@app.get("/cache/warm")
+async def cache_warm_status():
+    return warmup_status
+
+
+HISTORY_INDEX_KEYS = [("user_id", 1), ("created_at", -1), ("_id", -1)]
+HISTORY_PROJECTION = {"query": 1, "decision": 1, "amount": 1, "justification": 1, "created_at": 1}
+
+
+async def ensure_history_indexes() -> None:
+    """Create the compound index that serves /history lookups and keyset paging."""
+    try:
+        await history_collection.create_index(HISTORY_INDEX_KEYS, name="user_id_created_at")
+        print("✅ Ensured search_history index (user_id, created_at)")
+    except Exception as e:
+        print("⚠️ Could not ensure search_history index:", e)
+
+
+def encode_history_cursor(item: Dict[str, Any]) -> str:
+    raw = json.dumps({"t": item["created_at"].isoformat(), "id": str(item["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_history_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["t"]), ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
 
 @app.get("/history/{user_id}")
-async def get_history(user_id: str, limit: int = 20):
+async def get_history(user_id: str, limit: int = 20, before: Optional[str] = None):
+    """Newest-first history page. Pass the returned `next_cursor` as `before` for the next page."""
     if history_collection is None:
         raise HTTPException(status_code=503, detail="History store not configured")
-    cursor = history_collection.find({"user_id": user_id}).sort("created_at", -1).limit(limit)
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    query: Dict[str, Any] = {"user_id": user_id}
+    if before:
+        created_at, last_id = decode_history_cursor(before)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+    cursor = (
+        history_collection.find(query, HISTORY_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    with stage("history_read"):
+        docs = await cursor.to_list(length=limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    next_cursor = encode_history_cursor(docs[-1]) if has_more else None
     items: List[Dict[str, Any]] = []
-    async for item in cursor:
-        item.pop("_id", None)
-        items.append(item)
-    return {"items": items}
+    for doc in docs:
+        doc.pop("_id", None)
+        items.append(doc)
+    return {"items": items, "next_cursor": next_cursor}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,48 @@
+# single_flight.py
+"""Request coalescing for identical in-flight work.
+
+The first caller for a key starts the work as a task; callers that arrive with
+the same key while it is running await that task instead of repeating it, and
+all of them get its result or its exception. The task is shielded, so one
+caller disconnecting does not cancel the work for the others. Keys are dropped
+as soon as the work finishes: this coalesces bursts, it does not cache.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn() once per key at a time; returns (result, shared) where shared is
+        True for callers that joined work started by someone else."""
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.followers += 1
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller has gone away
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            "inflight": len(self._calls),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_ratio": round(self.followers / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,112 @@
+# stream_json.py
+"""Incremental parser for a JSON object that arrives token by token.
+
+The LLM answers with a flat object like {"decision": ..., "amount": ...,
+"justification": ...}, possibly wrapped in a ```json fence. `feed()` accepts
+text deltas and returns the top-level fields whose values have just become
+complete, so callers can forward `decision` and `amount` before the
+`justification` has finished streaming.
+"""
+import json
+from typing import List, Tuple, Any, Optional
+
+# Parser states
+_BEFORE_OBJECT = 0
+_BEFORE_KEY = 1
+_IN_KEY = 2
+_BEFORE_COLON = 3
+_BEFORE_VALUE = 4
+_IN_VALUE = 5
+_DONE = 6
+
+
+class IncrementalJSONParser:
+    """Emit (key, value) pairs of the first top-level JSON object as they complete."""
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._state = _BEFORE_OBJECT
+        self._key_start = 0
+        self._key: Optional[str] = None
+        self._value_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.fields: dict = {}
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def _finish_value(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        raw = self._buf[self._value_start:end].strip()
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = raw
+        self.fields[self._key] = value
+        out.append((self._key, value))
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        self._buf += text
+        out: List[Tuple[str, Any]] = []
+        buf = self._buf
+        while self._pos < len(buf) and self._state != _DONE:
+            ch = buf[self._pos]
+            state = self._state
+            if state == _BEFORE_OBJECT:
+                if ch == "{":
+                    self._state = _BEFORE_KEY
+            elif state == _BEFORE_KEY:
+                if ch == '"':
+                    self._state = _IN_KEY
+                    self._key_start = self._pos
+                    self._escape = False
+                elif ch == "}":
+                    self._state = _DONE
+            elif state == _IN_KEY:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._key = json.loads(buf[self._key_start:self._pos + 1])
+                    self._state = _BEFORE_COLON
+            elif state == _BEFORE_COLON:
+                if ch == ":":
+                    self._state = _BEFORE_VALUE
+            elif state == _BEFORE_VALUE:
+                if not ch.isspace():
+                    self._state = _IN_VALUE
+                    self._value_start = self._pos
+                    self._depth = 0
+                    self._in_string = False
+                    self._escape = False
+                    continue  # re-read this character in _IN_VALUE
+            elif state == _IN_VALUE:
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif ch == "\\":
+                        self._escape = True
+                    elif ch == '"':
+                        self._in_string = False
+                        if self._depth == 0:
+                            self._finish_value(self._pos + 1, out)
+                            self._state = _BEFORE_KEY
+                elif ch == '"':
+                    self._in_string = True
+                elif ch in "[{":
+                    self._depth += 1
+                elif ch in "]}" and self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._finish_value(self._pos + 1, out)
+                        self._state = _BEFORE_KEY
+                elif self._depth == 0 and ch in ",}":
+                    # end of a bare literal (number, true/false/null)
+                    self._finish_value(self._pos, out)
+                    self._state = _DONE if ch == "}" else _BEFORE_KEY
+            self._pos += 1
+        return out
@@ -0,0 +1,36 @@
+# tests/conftest.py
+"""Shared setup: repo root on sys.path, and every on-disk cache of query_api
+pointed at a throwaway directory before the module is imported."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_STATE = tempfile.mkdtemp(prefix="policy-api-tests-")
+for name, value in {
+    "VECTOR_BACKEND": "local",
+    "LLM_PROVIDER": "none",
+    "OPENAI_API_KEY": "test",
+    "MONGO_URI": "",
+    "CACHE_BACKEND": "memory",
+    "LOCAL_VECTOR_PATH": os.path.join(_STATE, "vector_index"),
+    "LOCAL_EMBED_VECTOR_PATH": os.path.join(_STATE, "vector_index_384"),
+    "LEXICAL_INDEX_PATH": os.path.join(_STATE, "lexical.sqlite3"),
+    "POLICY_CATALOG_PATH": os.path.join(_STATE, "policies.sqlite3"),
+    "INGEST_STATE_DIR": os.path.join(_STATE, "ingest"),
+    "EMBED_CACHE_PATH": os.path.join(_STATE, "embeddings.sqlite3"),
+    "CACHE_SQLITE_DIR": _STATE,
+    "HISTORY_SPILL_PATH": os.path.join(_STATE, "history_spill.jsonl"),
+}.items():
+    os.environ[name] = value
+
+
+@pytest.fixture(scope="session")
+def api():
+    import query_api
+
+    return query_api
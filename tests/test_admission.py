@@ -0,0 +1,52 @@
+# tests/test_admission.py
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, OverloadedError
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController()
+        controller.add_stage("vector", limit=1, max_queue=1, max_wait=5.0)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("vector"):
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]  # one active, one queued
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError) as err:
+            async with controller.slot("vector"):
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return err.value, controller.stats()["vector"]
+
+    error, stats = asyncio.run(scenario())
+    assert error.status_code == 429 and error.retry_after >= 1
+    assert stats["rejected_full"] == 1 and stats["admitted"] == 2
+
+
+def test_queue_wait_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = AdmissionController()
+        controller.add_stage("llm", limit=1, max_queue=4, max_wait=0.05)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot("llm"):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError) as err:
+            async with controller.slot("llm"):
+                pass
+        release.set()
+        await holder
+        return err.value
+
+    assert asyncio.run(scenario()).status_code == 503
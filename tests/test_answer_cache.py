@@ -0,0 +1,80 @@
+# tests/test_answer_cache.py
+import numpy as np
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+ANSWER = {"decision": "covered", "amount": 50000, "justification": "Clause 4.2"}
+
+
+def _vector(angle: float, dim: int = 8) -> np.ndarray:
+    vec = np.zeros(dim, dtype=np.float32)
+    vec[0], vec[1] = np.cos(angle), np.sin(angle)
+    return vec
+
+
+def test_hit_only_above_the_similarity_threshold():
+    cache = SemanticAnswerCache(threshold=0.97)
+    cache.store(_vector(0.0), ANSWER)
+    near = cache.lookup(_vector(0.2) * 3)  # cos 0.98; lookups are length-independent
+    assert near is not None and near["decision"] == "covered" and near["similarity"] > 0.97
+    assert cache.lookup(_vector(0.3)) is None  # cos 0.955
+    assert cache.lookup(np.zeros(8)) is None and cache.lookup(np.ones(4)) is None
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 3)
+
+
+def test_scopes_are_isolated():
+    cache = SemanticAnswerCache()
+    cache.store(_vector(0.0), ANSWER, scope="policy:p1|tenant:acme")
+    assert cache.lookup(_vector(0.0), scope="policy:p1|tenant:acme") is not None
+    assert cache.lookup(_vector(0.0), scope="policy:p2|tenant:acme") is None
+    assert cache.lookup(_vector(0.0), scope="policy:p1|tenant:other") is None
+    assert cache.lookup(_vector(0.0)) is None
+
+
+def test_expired_entries_miss_and_are_removed(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    cache.store(_vector(0.0), ANSWER)
+    now[0] += 59
+    assert cache.lookup(_vector(0.0)) is not None
+    now[0] += 2
+    assert cache.lookup(_vector(0.0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store(_vector(0.0), {"decision": "a"})
+    cache.store(_vector(1.0), {"decision": "b"})
+    assert cache.lookup(_vector(0.0))["decision"] == "a"  # b is now least recently used
+    cache.store(_vector(2.0), {"decision": "c"})
+    assert cache.lookup(_vector(1.0)) is None
+    assert cache.lookup(_vector(0.0))["decision"] == "a" and cache.lookup(_vector(2.0))["decision"] == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_cap_counts_the_vector_matrix_and_evicts_on_payload():
+    dim = 256
+    cache = SemanticAnswerCache(max_entries=5000, max_bytes=64 * 1024)
+    cache.store(_vector(0.0, dim), ANSWER)
+    stats = cache.stats()
+    assert stats["capacity"] == 32 * 1024 // (dim * 4)  # half the budget, not 5000 slots
+    assert stats["memory_bytes"] <= 64 * 1024
+
+    big = {"justification": "x" * 10 * 1024}
+    for i in range(6):
+        cache.store(_vector(0.1 * (i + 1), dim), big)
+        assert cache.stats()["memory_bytes"] <= 64 * 1024
+    assert cache.stats()["evictions"] > 0
+
+
+def test_invalidate_drops_everything():
+    cache = SemanticAnswerCache()
+    for i in range(3):
+        cache.store(_vector(float(i)), ANSWER, scope=f"s{i}")
+    assert cache.invalidate() == 3
+    assert cache.lookup(_vector(0.0), scope="s0") is None
+    stats = cache.stats()
+    assert stats["entries"] == 0 and stats["memory_bytes"] == 0 and stats["invalidations"] == 1
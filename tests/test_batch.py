@@ -0,0 +1,48 @@
+# tests/test_batch.py
+import asyncio
+
+from admission import AdmissionController
+
+
+class SlowVectorIndex:
+    def __init__(self):
+        self.inflight = 0
+        self.peak = 0
+
+    async def query(self, vector, top_k, include_metadata=True, namespace=None, filter=None):
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        await asyncio.sleep(0.01)
+        self.inflight -= 1
+        return {"matches": [{"id": "c1", "score": 0.9, "metadata": {"text": "Knee surgery is covered up to 50000 INR."}}]}
+
+
+def test_batch_larger_than_vector_limit_plus_queue_is_not_shed(api, monkeypatch):
+    controller = AdmissionController()
+    for name in ("request", "embedding", "vector", "llm"):
+        controller.add_stage(name, limit=4, max_queue=4, max_wait=2.0)
+    index = SlowVectorIndex()
+    batch = 60  # well past vector limit + queue (8)
+
+    async def fake_embed(texts):
+        return "batch-test", [[float(i), 1.0, 0.0] for i in range(len(texts))]
+
+    async def fake_backend(space):
+        return index
+
+    monkeypatch.setattr(api, "admission", controller)
+    monkeypatch.setattr(api, "BATCH_ITEM_CONCURRENCY", 4)
+    monkeypatch.setattr(api, "aembed_texts", fake_embed)
+    monkeypatch.setattr(api, "ensure_vector_backend", fake_backend)
+    monkeypatch.setattr(api, "lexical_index", None)
+    monkeypatch.setattr(api, "vector_flight", None)
+
+    body = api.BatchQuery(queries=[api.Query(query=f"knee surgery {i}") for i in range(batch)])
+    response = asyncio.run(api.run_batch(body))
+
+    failed = [r for r in response["results"] if r.get("error")]
+    assert response["count"] == batch and not failed
+    vector = controller.stats()["vector"]
+    assert vector["rejected_full"] == 0 and vector["rejected_timeout"] == 0
+    assert vector["admitted"] == batch
+    assert index.peak <= 4
@@ -0,0 +1,105 @@
+# tests/test_cache_backends.py
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from cache_backends import BACKENDS, make_backend
+
+
+def _backend(kind, tmp_path, **kwargs):
+    options = dict(max_items=64, value_bytes=256, shm_dir=str(tmp_path), sqlite_dir=str(tmp_path))
+    options.update(kwargs)
+    return make_backend(kind, "test", **options)
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_get_set_delete_clear_and_ttl(kind, tmp_path):
+    cache = _backend(kind, tmp_path)
+    assert cache.get("a") is None
+    assert cache.set("a", b"alpha") and cache.set("b", b"beta")
+    assert cache.get("a") == b"alpha"
+    cache.delete("a")
+    assert cache.get("a") is None and cache.get("b") == b"beta"
+    cache.clear()
+    assert cache.get("b") is None and cache.entries() == 0
+
+    cache.set("short", b"x", ttl=0.05)
+    time.sleep(0.08)
+    assert cache.get("short") is None
+    cache.close()
+
+
+@pytest.mark.parametrize("kind", ("shm", "sqlite"))
+def test_shared_backends_are_seen_by_other_workers(kind, tmp_path):
+    writer, reader = _backend(kind, tmp_path), _backend(kind, tmp_path)  # two workers on one host
+    writer.set("answer", b"covered")
+    assert reader.get("answer") == b"covered"
+    reader.clear()  # e.g. invalidation after ingestion
+    assert writer.get("answer") is None
+    writer.close()
+    reader.close()
+
+
+def test_memory_backend_evicts_least_recently_used(tmp_path):
+    cache = _backend("memory", tmp_path, max_items=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None and cache.get("a") == b"1" and cache.get("c") == b"3"
+
+
+def test_shm_rejects_values_larger_than_a_slot(tmp_path):
+    cache = _backend("shm", tmp_path)
+    assert not cache.set("big", b"x" * (cache.capacity + 1))
+    assert cache.oversize == 1 and cache.get("big") is None
+    cache.close()
+
+
+def test_unknown_backend_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        _backend("redis", tmp_path)
+
+
+def test_shm_falls_back_to_memory_without_fcntl(tmp_path):
+    script = (
+        "import sys; sys.modules['fcntl'] = None\n"  # as on Windows
+        "from cache_backends import make_backend\n"
+        f"print(make_backend('shm', 'test', 16, shm_dir={str(tmp_path)!r}).kind)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().endswith("memory")
+
+
+def test_sqlite_shared_answers_stay_off_the_event_loop(api, monkeypatch, tmp_path):
+    backend = _backend("sqlite", tmp_path)
+    threads = []
+    get, set_ = backend.get, backend.set
+
+    def recording_get(key):
+        threads.append(threading.get_ident())
+        return get(key)
+
+    def recording_set(key, value, ttl=None):
+        threads.append(threading.get_ident())
+        return set_(key, value, ttl)
+
+    monkeypatch.setattr(backend, "get", recording_get)
+    monkeypatch.setattr(backend, "set", recording_set)
+    monkeypatch.setattr(api, "shared_answers", backend)
+    data = api.Query(query="Is knee surgery covered?")
+
+    async def run():
+        await api._shared_answers_call(backend.set, api._shared_answer_key(data), b'{"decision": "covered"}')
+        return await api.lookup_cached_answer(api.ACTIVE_SPACE, [0.3] * 8, data), threading.get_ident()
+
+    cached, loop_thread = asyncio.run(run())
+    assert cached == {"decision": "covered"}
+    assert len(threads) == 2 and loop_thread not in threads
+    backend.close()
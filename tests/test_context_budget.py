@@ -0,0 +1,30 @@
+# tests/test_context_budget.py
+import os
+import subprocess
+import sys
+
+from context_budget import ContextBudgeter, count_tokens
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_load_the_tokenizer():
+    code = "import sys, context_budget; print('tiktoken' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "False"
+
+
+def test_count_tokens_loads_lazily():
+    assert count_tokens("Knee surgery is covered.") > 0
+
+
+def test_overlap_between_chunks_is_dropped_and_budget_respected():
+    shared = "Knee surgery is covered up to 50000 INR after a two year waiting period."
+    matches = [
+        {"text": shared + " Claims need a hospital bill.", "score": 0.9},
+        {"text": shared, "score": 0.8},  # pure overlap with the first chunk
+        {"text": "Maternity is excluded in the first year. " * 40, "score": 0.5},
+    ]
+    result = ContextBudgeter(max_tokens=60).assemble("knee surgery claim", matches)
+    assert result["duplicates"] == 1
+    assert result["tokens"] <= 60 and result["chunks"][0].startswith("Knee surgery")
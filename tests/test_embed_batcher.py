@@ -0,0 +1,94 @@
+# tests/test_embed_batcher.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from embed_batcher import MicroBatcher
+
+
+class RecordingModel:
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.calls = []
+        self.delay = delay
+        self.fail = fail
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return [[float(len(t))] for t in texts]
+
+
+def test_concurrent_callers_share_one_encode_call():
+    model = RecordingModel()
+
+    async def run():
+        batcher = MicroBatcher(model.encode, max_batch=64, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.embed(["a" * n]) for n in range(1, 9)), batcher.embed(["xx", "yyy"]))
+        await batcher.close()
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == [[[float(n)]] for n in range(1, 9)] + [[[2.0], [3.0]]]
+    assert len(model.calls) == 1 and len(model.calls[0]) == 10
+    assert stats["batches"] == 1 and stats["max_batch_size"] == 10
+
+
+def test_partial_batch_is_flushed_after_max_wait_and_full_batches_split():
+    model = RecordingModel()
+
+    async def run():
+        batcher = MicroBatcher(model.encode, max_batch=4, max_wait_ms=30)
+        started = time.perf_counter()
+        assert await batcher.embed(["lonely"]) == [[6.0]]
+        waited = time.perf_counter() - started
+        await batcher.embed([str(i) for i in range(10)])
+        await batcher.close()
+        return waited
+
+    waited = asyncio.run(run())
+    assert 0.02 <= waited < 0.5
+    assert [len(call) for call in model.calls] == [1, 4, 4, 2]
+
+
+def test_encode_error_reaches_every_caller_in_the_batch():
+    model = RecordingModel(fail=True)
+
+    async def run():
+        batcher = MicroBatcher(model.encode, max_wait_ms=20)
+        results = await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b", "c"]), return_exceptions=True)
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert len(model.calls) == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "model crashed" for r in results)
+
+
+def test_cancelled_caller_does_not_drop_the_others():
+    model = RecordingModel(delay=0.05)
+    started = threading.Event()
+
+    def encode(texts):
+        started.set()
+        return model.encode(texts)
+
+    async def run():
+        batcher = MicroBatcher(encode, max_wait_ms=10)
+        leaving = asyncio.ensure_future(batcher.embed(["gone"]))
+        staying = [asyncio.ensure_future(batcher.embed([t])) for t in ("knee", "hip")]
+        await asyncio.sleep(0.03)  # the batch is encoding now
+        assert started.is_set()
+        leaving.cancel()
+        results = await asyncio.gather(*staying)
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        late = await batcher.embed(["after"])  # the consumer task is still serving
+        await batcher.close()
+        return results, late
+
+    results, late = asyncio.run(run())
+    assert results == [[[4.0]], [[3.0]]] and late == [[5.0]]
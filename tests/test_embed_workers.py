@@ -0,0 +1,93 @@
+# tests/test_embed_workers.py
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import embed_workers
+from embed_workers import EmbeddingWorkerPool
+
+
+class StubModel:
+    """Deterministic 'embeddings' (text length, byte sum, ...) configured by the model source:
+    "<dim>" or "<dim>:<marker path>" (the first "__die__" text kills the worker, once)."""
+
+    def __init__(self, source: str):
+        dim, _, self.marker = source.partition(":")
+        self.dim = int(dim)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=32):
+        if "__die__" in texts and self.marker and not os.path.exists(self.marker):
+            open(self.marker, "w").close()
+            os._exit(1)
+        return [[len(t), sum(t.encode())] + [float(i) for i in range(self.dim - 2)] for t in texts]
+
+
+def stub_worker_main(model_source, conn, in_name, out_name, threads):
+    embed_workers._serve(lambda: StubModel(model_source), conn, in_name, out_name)
+
+
+def expected(text: str, dim: int):
+    return [float(len(text)), float(sum(text.encode()))] + [float(i) for i in range(dim - 2)]
+
+
+@pytest.fixture
+def stub_workers(monkeypatch):
+    monkeypatch.setattr(embed_workers, "_worker_main", stub_worker_main)  # spawned by reference
+    pools = []
+
+    def make(source: str, **kwargs):
+        pool = EmbeddingWorkerPool(source, **{"num_workers": 2, "start_timeout": 60, **kwargs})
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_round_trip_split_and_restarts(stub_workers, tmp_path):
+    pool = stub_workers(f"6:{tmp_path / 'died'}", max_batch=4, max_text_bytes=32, job_timeout=30)
+    assert pool.start() == 6
+
+    texts = [f"clause {i} " * (i % 3) + "ünïcode" for i in range(11)]  # 3 chunks, run in parallel
+    assert pool.encode(texts) == [expected(t, 6) for t in texts]
+    assert pool.encode(["x" * 100]) == [expected("x" * 32, 6)]  # truncated to max_text_bytes
+
+    pool._workers[0].process.kill()  # dead before dispatch: replaced, then used
+    pool._workers[0].process.join()
+    pool._workers[1].pending = 5  # so the dead worker is the least loaded one
+    assert pool.encode(["knee"]) == [expected("knee", 6)]
+    pool._workers[1].pending = 0
+    assert pool.stats()["restarts"] == 1
+
+    assert pool.encode(["__die__"]) == [expected("__die__", 6)]  # dies mid-job: restarted and retried once
+    stats = pool.stats()
+    assert stats["restarts"] == 2 and stats["alive"] == 2 and stats["pending"] == [0, 0]
+
+
+def test_model_wider_than_the_output_buffer_is_rejected(stub_workers):
+    pool = stub_workers(str(embed_workers.MAX_OUTPUT_DIM + 1), num_workers=1)
+    with pytest.raises(RuntimeError, match="exceeds MAX_OUTPUT_DIM"):
+        pool.start()
+
+
+def test_dispatch_picks_the_least_loaded_worker():
+    pool = EmbeddingWorkerPool("unused", num_workers=3)
+    pool._workers = [SimpleNamespace(pending=n) for n in (2, 0, 1)]
+    picks = [pool._acquire_least_loaded()[0] for _ in range(4)]
+    assert [next(i for i, w in enumerate(pool._workers) if w is pick) for pick in picks] == [1, 1, 2, 0]
+    assert [w.pending for w in pool._workers] == [3, 2, 2]
+    pool._workers = []
+    pool.close()
+
+
+def test_chunks_respect_batch_size_and_buffer_bytes():
+    pool = EmbeddingWorkerPool("unused", num_workers=1, max_batch=3, max_text_bytes=10)  # 30 data bytes
+    assert [len(c) for c in pool._chunks([b"a"] * 7)] == [3, 3, 1]
+    assert [len(c) for c in pool._chunks([b"x" * 10, b"y" * 10, b"z" * 6, b"w" * 5])] == [3, 1]
+    assert [len(c) for c in pool._chunks([b"x" * 10] * 2 + [b"y" * 9])] == [3]
+    pool.close()
@@ -0,0 +1,48 @@
+# tests/test_embedding_cache.py
+import asyncio
+import threading
+
+from embedding_cache import EmbeddingCache
+
+
+def test_tiers_and_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, memory_items=10)
+    assert cache.get_many("m", ["a", "b"]) == [None, None]
+    cache.put_many("m", ["a"], [[1.0, 2.0]])
+    assert cache.get("m", "  a ") == [1.0, 2.0]  # normalized text shares the entry
+    cache.close()
+
+    reopened = EmbeddingCache(path, memory_items=10)
+    assert reopened.get_hot_many("m", ["a"]) == [None]
+    assert reopened.get_disk_many("m", ["a"]) == [[1.0, 2.0]]
+    assert reopened.get_hot_many("m", ["a"]) == [[1.0, 2.0]]  # promoted to the hot tier
+    stats = reopened.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_request_path_reads_sqlite_off_the_event_loop(api, monkeypatch, tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), memory_items=10)
+    cache.put_many("m", ["warm"], [[0.5, 0.5]])
+    cache._memory.clear()  # only on disk now
+    cache.put_many("m", ["hot"], [[1.0, 0.0]])
+    disk_threads = []
+    real_disk = cache.get_disk_many
+
+    def tracking_disk(model, texts):
+        disk_threads.append(threading.current_thread())
+        return real_disk(model, texts)
+
+    async def compute(texts):
+        return [[0.0, 1.0] for _ in texts]
+
+    monkeypatch.setattr(cache, "get_disk_many", tracking_disk)
+    monkeypatch.setattr(api, "embedding_cache", cache)
+
+    vectors = asyncio.run(api._aembed_with_cache("m", ["hot", "warm", "new"], compute))
+    assert vectors == [[1.0, 0.0], [0.5, 0.5], [0.0, 1.0]]
+    assert disk_threads and all(t is not threading.main_thread() for t in disk_threads)
+
+    disk_threads.clear()
+    asyncio.run(api._aembed_with_cache("m", ["hot"], compute))
+    assert not disk_threads  # a hot-tier hit never leaves the loop
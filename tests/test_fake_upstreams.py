@@ -0,0 +1,61 @@
+# tests/test_fake_upstreams.py
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from fake_upstreams import FakeCollection, LatencyModel  # noqa: E402
+from history_replay import REPLAY_USER_ID, stream_top_queries, stream_window  # noqa: E402
+
+
+def _collection(rows):
+    collection = FakeCollection(LatencyModel(0.0))
+    asyncio.run(collection.insert_many([dict(row) for row in rows]))
+    return collection
+
+
+def test_history_pages_through_fake_collection(api, monkeypatch):
+    now = datetime.utcnow().replace(microsecond=0)
+    rows = [{"user_id": "u1", "query": f"q{i}", "decision": "covered", "created_at": now - timedelta(minutes=i // 2)}
+            for i in range(25)]  # pairs share a timestamp, so paging has to break ties on _id
+    rows.append({"user_id": "u2", "query": "other", "created_at": now})
+    monkeypatch.setattr(api, "history_collection", _collection(rows))
+
+    seen, before = [], None
+    while True:
+        page = asyncio.run(api.get_history("u1", limit=7, before=before))
+        seen.extend(item["query"] for item in page["items"])
+        assert all("_id" not in item and "user_id" not in item for item in page["items"])
+        before = page["next_cursor"]
+        if before is None:
+            break
+    assert sorted(seen) == sorted(f"q{i}" for i in range(25))
+    assert len(seen) == len(set(seen))
+    times = [row["created_at"] for q in seen for row in rows if row["query"] == q]
+    assert times == sorted(times, reverse=True)
+
+
+def test_replay_and_warm_up_reads():
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": "u1", "query": "Knee surgery", "created_at": now - timedelta(hours=3)},
+        {"user_id": "u2", "query": " knee surgery ", "created_at": now - timedelta(hours=1)},
+        {"user_id": "u1", "query": "cataract", "created_at": now - timedelta(hours=2)},
+        {"user_id": REPLAY_USER_ID, "query": "cataract", "created_at": now},
+        {"user_id": "u1", "query": "old", "created_at": now - timedelta(days=30)},
+        {"user_id": "u1", "query": "", "created_at": now},
+    ]
+    collection = _collection(rows)
+
+    async def collect(stream):
+        return [row async for row in stream]
+
+    top = asyncio.run(collect(stream_top_queries(collection, days=7, limit=10)))
+    assert [(row["query"], row["count"]) for row in top] == [("Knee surgery", 2), ("cataract", 1)]
+    assert top[0]["last_seen"] == rows[1]["created_at"]
+
+    window = asyncio.run(collect(stream_window(collection, now - timedelta(days=1), now)))
+    assert [doc["query"] for doc in window] == ["Knee surgery", "cataract", " knee surgery "]
+    assert all(set(doc) == {"query", "created_at"} for doc in window)
@@ -0,0 +1,114 @@
+# tests/test_history_writer.py
+import asyncio
+import os
+from datetime import datetime
+
+import pytest
+
+import history_writer
+from history_writer import HistoryWriter
+
+
+class FlakyStore:
+    def __init__(self):
+        self.docs = []
+        self.calls = []
+        self.down = False
+
+    async def insert_many(self, docs):
+        self.calls.append(len(docs))
+        if self.down:
+            raise RuntimeError("mongo unreachable")
+        self.docs.extend(docs)
+
+
+def test_writes_are_batched():
+    store = FlakyStore()
+
+    async def run():
+        writer = HistoryWriter(store.insert_many, batch_size=10, flush_interval=0.5)
+        writer.start()
+        for i in range(25):
+            assert await writer.submit({"query": f"q{i}"})
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(run())
+    assert [doc["query"] for doc in store.docs] == [f"q{i}" for i in range(25)]
+    assert store.calls == [10, 10, 5]
+    assert writer.stats()["written"] == 25
+
+
+def test_failed_batches_spill_and_replay_with_datetimes(tmp_path):
+    store = FlakyStore()
+    spill = str(tmp_path / "spill.jsonl")
+    created = datetime(2025, 1, 1, 12, 30)
+
+    async def run():
+        store.down = True
+        writer = HistoryWriter(store.insert_many, spill_path=spill, batch_size=4, flush_interval=0.05)
+        writer.start()
+        for i in range(6):
+            await writer.submit({"_id": i, "query": f"q{i}", "created_at": created})
+        await writer.close()
+        assert writer.stats()["spilled"] == 6 and not store.docs
+
+        store.down = False
+        restarted = HistoryWriter(store.insert_many, spill_path=spill, batch_size=4)
+        assert await restarted.replay() == 6
+
+    asyncio.run(run())
+    assert [doc["query"] for doc in store.docs] == [f"q{i}" for i in range(6)]
+    assert all(doc["created_at"] == created and "_id" not in doc for doc in store.docs)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    store = FlakyStore()
+
+    async def run():
+        writer = HistoryWriter(store.insert_many, max_queue=2, overflow="drop")
+        accepted = [await writer.submit({"query": f"q{i}"}) for i in range(3)]  # flusher not started
+        return writer, accepted
+
+    writer, accepted = asyncio.run(run())
+    assert accepted == [True, True, False]
+    assert writer.stats()["dropped"] == 1
+
+
+def test_torn_spill_line_is_quarantined_and_the_flusher_keeps_running(tmp_path):
+    store = FlakyStore()
+    spill = tmp_path / "spill.jsonl"
+    spill.write_text('{"query": "q0"}\n{"query": "q1", "created_at": {"__datet\n{"query": "q2"}\n')
+
+    async def run():
+        writer = HistoryWriter(store.insert_many, spill_path=str(spill), batch_size=10, flush_interval=0.05)
+        writer.start()
+        await asyncio.sleep(0.05)
+        assert not writer._task.done()
+        await writer.submit({"query": "live"})
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(run())
+    assert [doc["query"] for doc in store.docs] == ["q0", "q2", "live"]
+    assert writer.stats()["corrupt"] == 1
+    assert (tmp_path / "spill.jsonl.bad").read_text().startswith('{"query": "q1"')
+    assert not spill.exists() and not (tmp_path / "spill.jsonl.replay").exists()
+
+
+@pytest.mark.skipif(history_writer.fcntl is None, reason="needs fcntl")
+def test_only_one_worker_replays_a_shared_spill_file(tmp_path):
+    store = FlakyStore()
+    spill = str(tmp_path / "spill.jsonl")
+    with open(spill, "w") as f:
+        f.write('{"query": "q0"}\n')
+    first, second = HistoryWriter(store.insert_many, spill_path=spill), HistoryWriter(store.insert_many, spill_path=spill)
+
+    lock = first._lock_replay()
+    try:
+        assert asyncio.run(second.replay()) == 0  # first holds the lock
+    finally:
+        os.close(lock)
+    assert asyncio.run(second.replay()) == 1
+    assert asyncio.run(first.replay()) == 0
+    assert [doc["query"] for doc in store.docs] == ["q0"]
@@ -0,0 +1,95 @@
+# tests/test_ingest.py
+import pytest
+
+import ingest
+from local_vector_store import LocalVectorIndex
+from policy_catalog import PolicyCatalog
+
+DIM = 8
+PAGES = [f"Page {n}: clause {n} covers treatment number {n} after a waiting period of {n} months." for n in range(6)]
+
+
+def embed(texts):
+    return [[float(len(t) % 7 + 1)] + [1.0] * (DIM - 1) for t in texts]
+
+
+@pytest.fixture
+def pdf(tmp_path, monkeypatch):
+    path = tmp_path / "policy.pdf"
+    path.write_bytes(b"%PDF-1.4 test policy")
+
+    def pages(_path, start=0):
+        for n in range(start, len(PAGES)):
+            yield n, PAGES[n]
+
+    monkeypatch.setattr(ingest, "iter_pdf_pages", pages)
+    return str(path)
+
+
+def run(pdf, index, state_dir, **kwargs):
+    return ingest.ingest_pdf(pdf, embed, index, state_dir=state_dir, chunk_size=60, overlap=0, embed_batch_size=2, **kwargs)
+
+
+def policy_tags(index, namespace=""):
+    return {r["metadata"]["policy_id"] for batch in index.iter_vectors(namespace=namespace) for r in batch}
+
+
+def test_unchanged_document_with_same_scope_is_skipped(pdf, tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=DIM)
+    first = run(pdf, index, str(tmp_path / "state"), policy_id="gold")
+    second = run(pdf, index, str(tmp_path / "state"), policy_id="gold")
+    assert not first["skipped"] and second["skipped"]
+    assert second["chunks"] == first["chunks"] and second["policy_id"] == "gold"
+
+
+def test_new_policy_id_re_tags_instead_of_skipping(pdf, tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=DIM)
+    run(pdf, index, str(tmp_path / "state"), policy_id="gold")
+    summary = run(pdf, index, str(tmp_path / "state"), policy_id="platinum", tenant="acme")
+    assert not summary["skipped"] and summary["chunks"] > 0
+    assert policy_tags(index) == {"platinum"}  # same chunk ids, overwritten with the new tags
+    hits = index.query([1.0] * DIM, top_k=3, filter={"policy_id": "platinum"})["matches"]
+    assert hits and all(m["metadata"]["tenant"] == "acme" for m in hits)
+
+
+def test_resume_under_a_different_scope_restarts_from_page_one(pdf, tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=DIM)
+    calls = {"n": 0}
+
+    def flaky(texts):
+        calls["n"] += 1
+        if calls["n"] == 3:
+            raise RuntimeError("embedding upstream down")
+        return embed(texts)
+
+    with pytest.raises(RuntimeError):
+        ingest.ingest_pdf(pdf, flaky, index, state_dir=str(tmp_path / "state"), chunk_size=60, overlap=0,
+                          embed_batch_size=2, policy_id="gold")
+    assert policy_tags(index) == {"gold"}
+
+    summary = run(pdf, index, str(tmp_path / "state"), policy_id="platinum")
+    assert summary["pages"] == len(PAGES)
+    assert policy_tags(index) == {"platinum"}  # no chunk left behind with the old tag
+
+
+def test_namespace_change_re_ingests_into_the_new_namespace(pdf, tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=DIM)
+    run(pdf, index, str(tmp_path / "state"), policy_id="gold", namespace="gold")
+    summary = run(pdf, index, str(tmp_path / "state"), policy_id="gold", namespace="gold-v2")
+    assert not summary["skipped"]
+    assert policy_tags(index, namespace="gold-v2") == {"gold"}
+
+
+def test_ingest_document_registers_the_policy_on_skip(api, monkeypatch, tmp_path):
+    catalog = PolicyCatalog(str(tmp_path / "policies.sqlite3"))
+    monkeypatch.setattr(api, "policy_catalog", catalog)
+    monkeypatch.setattr(api, "init_vector_backend", lambda name: None)
+    monkeypatch.setattr(api, "ingest_pdf", lambda path, **kw: {
+        "doc_id": "d1", "policy_id": kw["policy_id"], "tenant": kw["tenant"], "namespace": kw["namespace"],
+        "source": "policy.pdf", "skipped": True, "chunks": 12, "pages": 3, "seconds": 0.0,
+    })
+    api.ingest_document(str(tmp_path / "policy.pdf"), policy_id="gold", tenant="acme")
+    api.ingest_document(str(tmp_path / "policy.pdf"), policy_id="gold", tenant="acme")
+    assert catalog.resolve(tenant="acme") == ("gold",)
+    assert catalog.stats()["policies"] == 1
+    assert catalog._db.execute("SELECT chunks FROM policies").fetchone()[0] == 12  # not double counted
@@ -0,0 +1,79 @@
+# tests/test_lexical_index.py
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+CLAUSES = {
+    "c42": ("p1", "4.2 Joint replacement surgery (knee, hip) is covered after a waiting period of 24 months."),
+    "c43": ("p1", "4.3 A co-pay of 10% applies to all claims for insured persons above 60 years of age."),
+    "c51": ("p1", "5.1 Pre-existing diseases are covered after 36 months of continuous coverage."),
+    "x42": ("p2", "4.2 Dental treatment is excluded unless required due to an accident."),
+}
+
+
+def _index(tmp_path) -> BM25Index:
+    index = BM25Index(str(tmp_path / "lexical.sqlite3"))
+    index.add([{"id": vid, "metadata": {"text": text, "policy_id": policy}} for vid, (policy, text) in CLAUSES.items()])
+    return index
+
+
+def test_tokenize_keeps_clause_numbers_and_hyphenated_terms():
+    tokens = tokenize("What does clause 4.2 say about the co-pay on claims for policies?")
+    assert "4.2" in tokens and "co-pay" in tokens and "copay" in tokens
+    assert "claim" in tokens and "policy" in tokens and "the" not in tokens
+
+
+def test_search_ranks_and_scopes_by_policy(tmp_path):
+    index = _index(tmp_path)
+    assert index.search("knee replacement waiting period")[0]["id"] == "c42"
+    assert {m["id"] for m in index.search("clause 4.2")} == {"c42", "x42"}
+    assert [m["id"] for m in index.search("clause 4.2", policy_ids=["p2"])] == ["x42"]
+    assert index.search("clause 4.2", policy_ids=[]) == []
+    assert index.search("copay")[0]["metadata"]["policy_id"] == "p1"
+    index.close()
+
+
+def test_readding_replaces_postings_and_survives_reopen(tmp_path):
+    index = _index(tmp_path)
+    index.add([{"id": "c42", "metadata": {"text": "4.2 Cataract surgery is covered.", "policy_id": "p1"}}])
+    assert index.search("knee") == []
+    assert index.stats()["docs"] == len(CLAUSES)
+    index.delete(["c51"])
+    index.close()
+
+    reopened = BM25Index(str(tmp_path / "lexical.sqlite3"))
+    assert reopened.stats()["docs"] == len(CLAUSES) - 1
+    assert reopened.search("cataract")[0]["id"] == "c42"
+    assert reopened.search("pre-existing diseases") == []
+    reopened.close()
+
+
+def test_confident_only_for_a_clear_exact_match(tmp_path):
+    index = _index(tmp_path)
+    matches = index.search("what is clause 5.1", policy_ids=["p1"])
+    assert index.is_confident("what is clause 5.1", matches)
+    ambiguous = index.search("clause 4.2")
+    assert not index.is_confident("clause 4.2", ambiguous)
+    assert not index.is_confident("clause 9.9", index.search("clause 9.9 covered"))
+    index.close()
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    vector = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "b"}, {"id": "c"}]
+    fused = reciprocal_rank_fusion([vector, lexical], top_k=2)
+    assert [m["id"] for m in fused] == ["b", "c"]
+
+
+def test_instances_sharing_a_file_see_each_others_writes(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    worker, cli = BM25Index(path), BM25Index(path)  # e.g. a uvicorn worker and `ingest.py`
+    assert worker.search("knee") == []
+    cli.add([{"id": "c42", "metadata": {"text": CLAUSES["c42"][1], "policy_id": "p1"}}])
+    assert [m["id"] for m in worker.search("knee")] == ["c42"]
+
+    worker.add([{"id": "c43", "metadata": {"text": CLAUSES["c43"][1], "policy_id": "p1"}}])
+    assert worker.stats()["docs"] == cli.stats()["docs"] == 2
+    cli.close()
+    worker.close()
+    reopened = BM25Index(path)
+    assert reopened.stats()["docs"] == 2
+    reopened.close()
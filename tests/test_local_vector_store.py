@@ -0,0 +1,100 @@
+# tests/test_local_vector_store.py
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import local_vector_store
+from local_vector_store import LocalVectorIndex
+
+
+def records(prefix, count, dim=4, **metadata):
+    rng = np.random.default_rng(len(prefix) + count)
+    return [
+        {"id": f"{prefix}{i}", "values": rng.normal(size=dim).tolist(), "metadata": {"text": f"{prefix} {i}", **metadata}}
+        for i in range(count)
+    ]
+
+
+def test_query_filters_namespaces_and_deletes(tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=4)
+    index.upsert(records("gold", 5, policy_id="gold"))
+    index.upsert(records("silver", 5, policy_id="silver"))
+    index.upsert(records("ns", 3, policy_id="gold"), namespace="gold")
+    probe = [1.0, 0.0, 0.0, 0.0]
+    assert {m["metadata"]["policy_id"] for m in index.query(probe, top_k=10, filter={"policy_id": "silver"})["matches"]} == {"silver"}
+    assert len(index.query(probe, top_k=10, filter={"policy_id": {"$in": ["gold", "silver"]}})["matches"]) == 10
+    assert len(index.query(probe, top_k=10, namespace="gold")["matches"]) == 3
+    index.delete(["gold0", "gold1"])
+    ids = {m["id"] for m in index.query(probe, top_k=10)["matches"]}
+    assert "gold0" not in ids and len(ids) == 8
+    with pytest.raises(ValueError):
+        index.query(probe, filter={"policy_id": {"$gt": "a"}})
+
+
+def test_growth_and_reopen_after_flush(tmp_path):
+    path = str(tmp_path / "index")
+    index = LocalVectorIndex(path, dim=4, initial_capacity=2, flush_interval=0)
+    index.upsert(records("doc", 50, policy_id="p"))
+    index.upsert(records("doc", 1, policy_id="q"))  # overwrite keeps the row
+    reopened = LocalVectorIndex(path, dim=4)
+    stats = reopened.describe_index_stats()
+    assert stats["total_vector_count"] == 50
+    assert reopened.query([1.0, 0, 0, 0], top_k=1, filter={"policy_id": "q"})["matches"][0]["id"] == "doc0"
+
+
+def test_upserts_batch_manifest_writes(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=4, flush_interval=3600)
+    writes = []
+    real_write = index._write_manifest
+    monkeypatch.setattr(index, "_write_manifest", lambda: (writes.append(1), real_write()))
+    for n in range(20):
+        index.upsert(records(f"batch{n}-", 5))
+    assert writes == []
+    index.close()
+    assert writes == [1]
+    assert LocalVectorIndex(index.path, dim=4).describe_index_stats()["total_vector_count"] == 100
+
+
+def test_scoring_does_not_hold_the_lock(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=4, initial_capacity=4)
+    index.upsert(records("doc", 4))
+    real_scores = local_vector_store.score_rows
+    finished = []
+
+    def scores_while_writing(*args):
+        # A writer that needs the lock (and grows the matrix) must get through while this query scores
+        writer = threading.Thread(target=lambda: finished.append(index.upsert(records("more", 20))))
+        writer.start()
+        writer.join(timeout=5)
+        return real_scores(*args)
+
+    monkeypatch.setattr(local_vector_store, "score_rows", scores_while_writing)
+    matches = index.query([1.0, 0, 0, 0], top_k=3)["matches"]
+    assert finished, "upsert blocked behind a running query"
+    assert len(matches) == 3 and all(m["id"].startswith("doc") for m in matches)  # the snapshot taken before the write
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="needs /proc/self/maps")
+def test_growth_replaces_files_only_once_unmapped(tmp_path, monkeypatch):
+    """Windows cannot replace a mapped file; check our own mappings are gone at the swap."""
+    index = LocalVectorIndex(str(tmp_path / "idx"), dim=4, initial_capacity=4, dtype="int8")
+    replace = os.replace
+    swaps = []
+
+    def checked_replace(src, dst):
+        if src.endswith(".grow"):
+            with open("/proc/self/maps") as f:
+                mapped = f.read()
+            assert os.path.realpath(src) not in mapped and os.path.realpath(dst) not in mapped
+            swaps.append(os.path.basename(dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(local_vector_store.os, "replace", checked_replace)
+    rows = records("a", 10)
+    index.upsert(rows)
+    assert swaps == ["vectors.npy", "scales.npy"]
+    assert index.describe_index_stats()["total_vector_count"] == 10
+    for row in rows:  # rows copied before the swap are still there
+        assert index.query(vector=row["values"], top_k=1)["matches"][0]["id"] == row["id"]
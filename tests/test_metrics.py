@@ -0,0 +1,53 @@
+# tests/test_metrics.py
+import asyncio
+
+from metrics import Registry, percentiles
+
+
+def test_percentiles():
+    assert percentiles([])["count"] == 0
+    stats = percentiles([float(v) for v in range(1, 101)])
+    assert (stats["count"], stats["p50"], stats["p99"], stats["max"], stats["mean"]) == (100, 51.0, 100.0, 100.0, 50.5)
+
+
+def test_registry_renders_counters_and_histograms():
+    registry = Registry()
+    hits = registry.counter("cache_hits_total", "Hits", ["tier"])
+    latency = registry.histogram("stage_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    hits.inc(tier="memory")
+    hits.inc(2, tier="memory")
+    latency.observe(0.5, stage="vector")
+    text = registry.render()
+    assert 'cache_hits_total{tier="memory"} 3' in text
+    assert 'stage_seconds_bucket{stage="vector",le="1.0"} 1' in text
+
+
+def test_collector_families_are_contiguous():
+    registry = Registry()
+
+    def collector():
+        for stage in ("embedding", "vector"):
+            yield ("admission_active", "gauge", "Active", {"stage": stage}, 1)
+            yield ("admission_waiting", "gauge", "Waiting", {"stage": stage}, 0)
+
+    registry.add_collector(collector)
+    lines = registry.render().splitlines()
+    assert lines == [
+        "# HELP admission_active Active", "# TYPE admission_active gauge",
+        'admission_active{stage="embedding"} 1', 'admission_active{stage="vector"} 1',
+        "# HELP admission_waiting Waiting", "# TYPE admission_waiting gauge",
+        'admission_waiting{stage="embedding"} 0', 'admission_waiting{stage="vector"} 0',
+    ]
+
+
+def test_api_metrics_families_are_contiguous(api):
+    families, current = set(), None
+    for line in asyncio.run(api.metrics_endpoint()).body.decode().splitlines():
+        if line.startswith("# TYPE"):
+            current = line.split()[2]
+            assert current not in families, f"{current} declared twice"
+            families.add(current)
+        elif line and not line.startswith("#"):
+            name = line.split("{")[0].split()[0]
+            assert name in (current, f"{current}_bucket", f"{current}_sum", f"{current}_count"), f"{name} outside its family"
+    assert "upstream_calls_total" in families and "admission_waiting" in families
@@ -0,0 +1,77 @@
+# tests/test_policy_catalog.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import migrate_embeddings
+from local_vector_store import LocalVectorIndex
+from policy_catalog import PolicyCatalog, UnknownScopeError
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = PolicyCatalog(str(tmp_path / "policies.sqlite3"))
+    catalog.register("gold", "acme", "", 10, "gold.pdf")
+    catalog.register("silver", "acme", "", 5, "silver.pdf")
+    catalog.register("basic", "globex", "", 3, "basic.pdf")
+    yield catalog
+    catalog.close()
+
+
+def test_resolve(catalog):
+    assert catalog.resolve() is None
+    assert catalog.resolve(policy_id="gold") == ("gold",)
+    assert catalog.resolve(tenant="acme") == ("gold", "silver")
+    assert catalog.resolve(policy_id="basic", tenant="globex") == ("basic",)
+
+
+@pytest.mark.parametrize("policy_id, tenant", [("legacy", None), (None, "initech"), ("basic", "acme"), ("legacy", "acme")])
+def test_resolve_rejects_unknown_scopes(catalog, policy_id, tenant):
+    with pytest.raises(UnknownScopeError):
+        catalog.resolve(policy_id=policy_id, tenant=tenant)
+
+
+def test_other_connections_see_new_policies(catalog, tmp_path):
+    reader = PolicyCatalog(catalog.path)
+    assert reader.resolve(tenant="acme") == ("gold", "silver")
+    catalog.register("platinum", "acme", "platinum", 7)
+    assert reader.resolve(tenant="acme") == ("gold", "platinum", "silver")
+    assert reader.namespace("platinum") == "platinum"
+    reader.close()
+
+
+def test_document_moves_between_policies(catalog):
+    catalog.register("gold", "acme", "", 4, doc_id="d1")
+    catalog.register("silver", "acme", "", 4, doc_id="d1")
+    chunks = dict(catalog._db.execute("SELECT policy_id, chunks FROM policies"))
+    assert chunks["gold"] == 0 and chunks["silver"] == 4
+
+
+def test_run_rejects_unknown_policy_before_embedding(api, monkeypatch, catalog):
+    async def no_embedding(*args, **kwargs):
+        raise AssertionError("embedding should not run for an unknown scope")
+
+    monkeypatch.setattr(api, "policy_catalog", catalog)
+    monkeypatch.setattr(api, "aembed_text", no_embedding)
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(api.run_query(api.Query(query="knee surgery", policy_id="legacy")))
+    assert err.value.status_code == 404 and "backfill" in err.value.detail
+
+
+def test_backfill_tags_legacy_chunks_and_registers_them(api, monkeypatch, tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "index"), dim=4)
+    index.upsert([
+        {"id": f"doc1-{n}", "values": [1.0, n, 0.0, 0.0], "metadata": {"text": f"clause {n}", "doc_id": "doc1", "source": "a.pdf"}}
+        for n in range(3)
+    ] + [{"id": "manual", "values": [0.0, 1.0, 0.0, 0.0], "metadata": {"text": "hand-written"}}])
+    catalog = PolicyCatalog(str(tmp_path / "policies.sqlite3"))
+    monkeypatch.setattr(api, "policy_catalog", catalog)
+    monkeypatch.setattr(api, "init_vector_backend", lambda name: index)
+
+    totals = migrate_embeddings.backfill_policies()
+    assert totals["tagged"] == 3 and totals["skipped"] == 1 and totals["documents"] == 1
+    assert catalog.resolve(policy_id="doc1") == ("doc1",)
+    hits = index.query([1.0, 0.0, 0.0, 0.0], top_k=5, filter={"policy_id": "doc1"})["matches"]
+    assert len(hits) == 3
+    assert migrate_embeddings.backfill_policies()["tagged"] == 0  # idempotent
@@ -0,0 +1,60 @@
+# tests/test_single_flight.py
+import asyncio
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("knee", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert calls == [1]
+    assert [r for r, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert flight.stats()["inflight"] == 0  # coalesces bursts, does not cache
+
+    asyncio.run(run())
+    assert calls == [1, 1]
+
+
+def test_followers_get_the_exception_and_survive_a_cancelled_leader():
+    flight = SingleFlight("test")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def run():
+        results = await asyncio.gather(flight.do("a", failing), flight.do("a", failing), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+        leader = asyncio.ensure_future(flight.do("b", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("b", slow))
+        await asyncio.sleep(0)
+        leader.cancel()  # the client that started the work disconnects
+        return await follower
+
+    assert asyncio.run(run()) == (42, True)
+
+
+def test_distinct_keys_do_not_coalesce():
+    flight = SingleFlight("test")
+
+    async def run():
+        return await asyncio.gather(flight.do(1, lambda: asyncio.sleep(0, "x")), flight.do(2, lambda: asyncio.sleep(0, "y")))
+
+    assert asyncio.run(run()) == [("x", False), ("y", False)]
@@ -0,0 +1,38 @@
+# tests/test_stream_json.py
+import json
+
+from stream_json import IncrementalJSONParser
+
+ANSWER = {"decision": "covered", "amount": 50000, "justification": 'Clause 4.2 says "knee, hip" \\ and {braces}.',
+          "clauses": [{"id": "4.2"}, {"id": "4.3"}], "co_pay": None}
+
+
+def _feed_in_pieces(text: str, size: int):
+    parser = IncrementalJSONParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+def test_fields_complete_in_order_whatever_the_chunking():
+    text = "```json\n" + json.dumps(ANSWER, indent=2) + "\n```"
+    for size in (1, 3, 17, len(text)):
+        parser, events = _feed_in_pieces(text, size)
+        assert events == list(ANSWER.items())
+        assert parser.done and parser.fields == ANSWER
+
+
+def test_decision_is_emitted_before_justification_finishes():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"decision": "rejected", "amount": 0, "justification": "Cosmetic') == [
+        ("decision", "rejected"), ("amount", 0)]
+    assert not parser.done
+    assert parser.feed(' treatment is excluded."}') == [("justification", "Cosmetic treatment is excluded.")]
+    assert parser.done
+    assert parser.feed('{"decision": "covered"}') == []  # only the first object is parsed
+
+
+def test_unparseable_literal_is_kept_as_text():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"amount": N/A, "decision": "covered"}') == [("amount", "N/A"), ("decision", "covered")]
@@ -0,0 +1,72 @@
+# tests/test_upstream_guard.py
+import asyncio
+import time
+
+import pytest
+
+from upstream_guard import CircuitOpenError, UpstreamGuard
+
+
+async def _fail():
+    raise ConnectionError("refused")
+
+
+async def _ok():
+    return "ok"
+
+
+def test_breaker_opens_rejects_and_closes_after_a_probe():
+    guard = UpstreamGuard("test", 0.1, 1.0, hedge=False, failure_threshold=3, reset_seconds=0.05)
+
+    async def run():
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                await guard.call(_fail)
+        assert guard.breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await guard.call(_ok)
+        await asyncio.sleep(0.06)
+        assert await guard.call(_ok) == "ok"  # the half-open probe
+
+    asyncio.run(run())
+    stats = guard.stats()
+    assert stats["breaker"] == "closed" and stats["breaker_opens"] == 1
+    assert stats["failures"] == 3 and stats["rejected"] == 1
+
+
+def test_timeout_adapts_to_observed_latency():
+    guard = UpstreamGuard("test", 0.05, 5.0, timeout_multiplier=3.0, hedge=False, min_samples=5)
+    assert guard.timeout() == 5.0  # not enough samples yet
+    for _ in range(10):
+        guard.latency.add(0.02)
+    assert guard.timeout() == pytest.approx(0.06)
+
+    async def hang():
+        await asyncio.sleep(1.0)
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(guard.call(hang))
+    assert time.monotonic() - started < 0.5
+    assert guard.stats()["timeouts"] == 1
+    assert len(guard.latency) == 10 and guard.timeout() == pytest.approx(0.06)  # timeouts do not ratchet it up
+
+
+def test_slow_call_is_hedged_and_the_duplicate_wins():
+    guard = UpstreamGuard("test", 0.1, 2.0, hedge=True, hedge_budget=1.0, min_samples=5)
+    for _ in range(10):
+        guard.latency.add(0.01)
+    attempts = []
+
+    async def first_attempt_stalls():
+        attempts.append(1)
+        await asyncio.sleep(1.0 if len(attempts) == 1 else 0.0)
+        return len(attempts)
+
+    assert asyncio.run(guard.call(first_attempt_stalls)) == 2
+    assert guard.hedges == 1 and guard.hedge_wins == 1
+    assert asyncio.run(guard.call(_ok, hedge=False)) == "ok"
+
+
+def test_local_vector_queries_are_never_hedged(api):
+    assert not api.vector_guard.hedge  # VECTOR_BACKEND=local in the test environment
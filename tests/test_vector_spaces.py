@@ -0,0 +1,61 @@
+# tests/test_vector_spaces.py
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def openai_active(api, monkeypatch):
+    """OpenAI is the active space and its embedding call fails; the local model works."""
+    local = api.EMBED_SPACES["local"]
+
+    async def fake_cache(model_name, texts, compute):
+        if model_name != local.model:
+            raise TimeoutError("openai embeddings timed out")
+        return [[1.0] * local.dim for _ in texts]
+
+    monkeypatch.setattr(api, "ACTIVE_SPACE", "openai")
+    monkeypatch.setattr(api, "aclient", object())
+    monkeypatch.setattr(api, "_aembed_with_cache", fake_cache)
+    monkeypatch.setattr(api, "vector_queries", {"openai": object()})
+    monkeypatch.setattr(api, "space_vectors", {"openai": 100})
+    monkeypatch.setattr(api, "embed_flight", None)
+    monkeypatch.setattr(api, "run_flight", None)
+    return api
+
+
+def test_no_fallback_to_a_missing_local_index(openai_active):
+    api = openai_active
+    with pytest.raises(RuntimeError, match="not populated"):
+        asyncio.run(api.aembed_texts(["knee surgery"]))
+    response = asyncio.run(api.run_query(api.Query(query="knee surgery")))
+    assert response["justification"] == "Embedding failed"
+
+
+def test_no_fallback_to_an_empty_local_index(openai_active):
+    api = openai_active
+    api.vector_queries["local"] = object()
+    api.space_vectors["local"] = 0
+    with pytest.raises(RuntimeError):
+        asyncio.run(api.aembed_texts(["knee surgery"]))
+
+
+def test_fallback_to_a_populated_local_index(openai_active):
+    api = openai_active
+    api.vector_queries["local"] = object()
+    api.space_vectors["local"] = 42
+    space, vectors = asyncio.run(api.aembed_texts(["knee surgery"]))
+    assert space == "local" and len(vectors[0]) == api.EMBED_SPACES["local"].dim
+
+
+def test_request_path_never_creates_a_fallback_index(openai_active, monkeypatch):
+    api = openai_active
+    calls = []
+
+    def fake_init(space_name=None, create=True):
+        calls.append((space_name, create))
+        api.vector_queries[space_name] = object()
+
+    monkeypatch.setattr(api, "init_vector_backend", fake_init)
+    asyncio.run(api.ensure_vector_backend("local"))
+    assert calls == [("local", False)]
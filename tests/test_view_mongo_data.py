@@ -0,0 +1,79 @@
+# tests/test_view_mongo_data.py
+import asyncio
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import view_mongo_data  # noqa: E402
+from fake_upstreams import FakeCollection, LatencyModel  # noqa: E402
+
+BASE = datetime(2025, 1, 1)
+
+
+class FakeDB:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_collection(self, name, **kwargs):
+        return self.collection
+
+
+def _db(rows: int) -> FakeDB:
+    collection = FakeCollection(LatencyModel(0.0))
+    docs = [{"user_id": f"u{i % 7}", "query": f"q{i}", "decision": "covered", "amount": i,
+             "created_at": BASE + timedelta(seconds=i // 3)} for i in range(rows)]  # ties on created_at
+    asyncio.run(collection.insert_many(docs))
+    return FakeDB(collection)
+
+
+def _exported(out_dir: str):
+    rows = []
+    for name in sorted(os.listdir(out_dir)):
+        if name.endswith(".jsonl.gz"):
+            with gzip.open(os.path.join(out_dir, name), "rt") as f:
+                rows.extend(json.loads(line) for line in f)
+    return rows
+
+
+def test_export_resumes_after_crash_without_gaps_or_duplicates(tmp_path, monkeypatch):
+    db = _db(2347)
+    out = str(tmp_path / "export")
+    write = view_mongo_data.JSONLPartWriter.write
+    calls = {"n": 0}
+
+    def crashing_write(self, docs):
+        calls["n"] += 1
+        if calls["n"] == 7:  # inside the second part
+            raise RuntimeError("killed")
+        write(self, docs)
+
+    monkeypatch.setattr(view_mongo_data.JSONLPartWriter, "write", crashing_write)
+    with pytest.raises(RuntimeError):
+        asyncio.run(view_mongo_data.export_history(db, out, batch_size=200, part_rows=1000, until=BASE + timedelta(days=1)))
+    assert sorted(os.listdir(out)) == ["checkpoint.json", "part-00000.jsonl.gz", "part-00001.jsonl.gz.tmp"]
+    assert view_mongo_data.load_checkpoint(os.path.join(out, "checkpoint.json"))["rows"] == 1000
+
+    monkeypatch.setattr(view_mongo_data.JSONLPartWriter, "write", write)
+    state = asyncio.run(view_mongo_data.export_history(db, out, batch_size=200, part_rows=1000))
+    assert state["done"] and state["rows"] == 2347 and state["parts"] == 3
+
+    rows = _exported(out)
+    assert [row["query"] for row in rows] == [f"q{i}" for i in range(2347)]
+    assert len({row["_id"] for row in rows}) == 2347
+
+    again = asyncio.run(view_mongo_data.export_history(db, out, batch_size=200, part_rows=1000))
+    assert again["rows"] == 2347 and len(_exported(out)) == 2347
+
+
+def test_export_refuses_to_mix_formats(tmp_path):
+    db = _db(10)
+    out = str(tmp_path / "export")
+    asyncio.run(view_mongo_data.export_history(db, out, until=BASE + timedelta(days=1)))
+    with pytest.raises(SystemExit):
+        asyncio.run(view_mongo_data.export_history(db, out, fmt="parquet"))
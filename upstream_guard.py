@@ -0,0 +1,223 @@
+# upstream_guard.py
+"""Tail-latency controls for one upstream dependency (OpenAI, Pinecone).
+
+`UpstreamGuard.call()` wraps a single upstream call with:
+
+- an adaptive timeout: `timeout_multiplier` x the observed p99, clamped to
+  [min_timeout, max_timeout] (max_timeout until enough samples exist). Timed-out
+  calls are not samples: they would ratchet the timeout up to its cap exactly
+  when the upstream is slow; repeated timeouts open the breaker instead;
+- hedging: when the call is still running at the observed p95, a duplicate is
+  sent, the first success wins and the loser is cancelled. Hedges are capped
+  at `hedge_budget` of all calls so a slow upstream is not hit twice as hard;
+- a circuit breaker: after `failure_threshold` consecutive failures the guard
+  rejects calls with `CircuitOpenError` for `reset_seconds`, then lets one
+  probe through (half-open) to decide whether to close again.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"Upstream '{upstream}' circuit open (retry in {retry_in:.0f}s)")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+class LatencyTracker:
+    """Percentiles over the most recent successful call latencies."""
+
+    def __init__(self, window: int = 512):
+        self._samples: deque = deque(maxlen=window)
+        self._sorted: Optional[list] = None
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._sorted = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(len(self._sorted) - 1, int(p * len(self._sorted)))]
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def retry_in(self) -> float:
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+    def release_probe(self) -> None:
+        """The probe was cancelled before it said anything about the upstream."""
+        self._probing = False
+
+    def record_success(self) -> bool:
+        """Count a success; returns True when this success closed the breaker."""
+        self.consecutive_failures = 0
+        self._probing = False
+        closed = self.state != "closed"
+        self.state = "closed"
+        return closed
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True when this failure opened the breaker."""
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            opened = self.state != "open"
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            if opened:
+                self.opens += 1
+            return opened
+        return False
+
+
+class UpstreamGuard:
+    def __init__(
+        self,
+        name: str,
+        min_timeout: float,
+        max_timeout: float,
+        timeout_multiplier: float = 3.0,
+        hedge: bool = True,
+        hedge_percentile: float = 0.95,
+        hedge_budget: float = 0.1,
+        min_samples: int = 20,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        self.breaker = breaker or CircuitBreaker(failure_threshold, reset_seconds)  # may be shared between guards
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def timeout(self) -> float:
+        p99 = self.latency.percentile(0.99)
+        if p99 is None or len(self.latency) < self.min_samples:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latency) < self.min_samples:
+            return None
+        if self.hedges >= self.hedge_budget * max(self.calls, 1):
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        """Run fn() under the breaker, adaptive timeout and (optionally) hedging."""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.breaker.retry_in())
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            result = await self._race(fn, hedge)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self.failures += 1
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+            if self.breaker.record_failure():
+                print(f"🔌 Circuit opened for '{self.name}' after {self.breaker.consecutive_failures} failures: {e}")
+            raise
+        self.latency.add(time.perf_counter() - started)
+        if self.breaker.record_success():
+            print(f"✅ Circuit closed for '{self.name}' after a successful probe")
+        return result
+
+    async def _race(self, fn: Callable[[], Awaitable[Any]], hedge: bool) -> Any:
+        # A half-open probe gets the full timeout: it decides whether the upstream is back.
+        timeout = self.max_timeout if self.breaker.state == "half_open" else self.timeout()
+        deadline = time.monotonic() + timeout
+        delay = self.hedge_delay() if hedge else None
+        tasks = [asyncio.ensure_future(fn())]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=min(delay, deadline - time.monotonic()))
+                if not done and time.monotonic() < deadline:
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(fn()))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            raise asyncio.TimeoutError(f"{self.name} timed out after {timeout:.2f}s")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # a losing failure must not be reported as unretrieved
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.latency.percentile(0.95)
+        return {
+            "breaker": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0,
+            "p95_seconds": round(p95, 4) if p95 is not None else None,
+            "timeout_seconds": round(self.timeout(), 4),
+        }
@@ -0,0 +1,67 @@
+# vector_client.py
+"""Async vector-query clients used on the request path.
+
+`AsyncPineconeQuery` talks to the Pinecone data plane over the shared httpx
+connection pool instead of pushing the blocking SDK call into a thread.
+`AsyncLocalQuery` wraps the in-process LocalVectorIndex, whose search is
+CPU-bound, so it still runs in a worker thread.
+"""
+import asyncio
+from typing import Optional, Dict, Any
+
+import httpx
+
+PINECONE_API_VERSION = "2024-07"
+
+
+class AsyncPineconeQuery:
+    def __init__(self, http: httpx.AsyncClient, host: str, api_key: str):
+        if not host.startswith("http"):
+            host = f"https://{host}"
+        self.url = host.rstrip("/") + "/query"
+        self.http = http
+        self.headers = {
+            "Api-Key": api_key or "",
+            "X-Pinecone-API-Version": PINECONE_API_VERSION,
+            "Content-Type": "application/json",
+        }
+
+    async def query(
+        self,
+        vector,
+        top_k: int = 3,
+        include_metadata: bool = True,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        body: Dict[str, Any] = {
+            "vector": list(vector),
+            "topK": top_k,
+            "includeMetadata": include_metadata,
+            "includeValues": False,
+        }
+        if namespace:
+            body["namespace"] = namespace
+        if filter:
+            body["filter"] = filter
+        resp = await self.http.post(self.url, json=body, headers=self.headers)
+        resp.raise_for_status()
+        return resp.json()
+
+
+class AsyncLocalQuery:
+    def __init__(self, index):
+        self.index = index
+
+    async def query(
+        self,
+        vector,
+        top_k: int = 3,
+        include_metadata: bool = True,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        return await asyncio.to_thread(
+            self.index.query, vector=vector, top_k=top_k, include_metadata=include_metadata,
+            namespace=namespace, filter=filter,
+        )
@@ -0,0 +1,58 @@
+# vector_codec.py
+"""Compact storage formats for embedding vectors.
+
+`float16` halves storage with no measurable recall loss for normalized
+embeddings. `int8` quarters it by storing each row as signed bytes plus one
+float32 scale (max |x| / 127). Scoring dequantizes on the fly, in chunks, so
+memory stays bounded for large memory-mapped matrices.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+SCORE_CHUNK_ROWS = 65536
+
+
+def check_dtype(dtype: str) -> str:
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported vector dtype '{dtype}' (expected one of {', '.join(STORAGE_DTYPES)})")
+    return dtype
+
+
+def numpy_dtype(dtype: str):
+    return {"float32": np.float32, "float16": np.float16, "int8": np.int8}[check_dtype(dtype)]
+
+
+def quantize(rows: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode float32 rows; returns (codes, per-row scales or None)."""
+    rows = np.asarray(rows, dtype=np.float32)
+    if dtype == "float32":
+        return rows, None
+    if dtype == "float16":
+        return rows.astype(np.float16), None
+    check_dtype(dtype)
+    scales = np.abs(rows).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(rows / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    rows = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        rows = rows * np.asarray(scales, dtype=np.float32)[:, None]
+    return rows
+
+
+def scores(codes: np.ndarray, query: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Dot products of every stored row with a float32 query vector."""
+    if codes.dtype == np.float32:
+        return codes @ query
+    out = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], SCORE_CHUNK_ROWS):
+        block = np.asarray(codes[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+        out[start:start + block.shape[0]] = block @ query
+    if scales is not None:
+        out *= np.asarray(scales[: codes.shape[0]], dtype=np.float32)
+    return out
@@ -1,105 +1,415 @@
 #!/usr/bin/env python3
 """
-Performance-optimized MongoDB data viewer
+MongoDB data viewer, history analytics and streaming export.
+
+  python view_mongo_data.py                       # latest rows + collection sizes
+  python view_mongo_data.py stats --days 30       # aggregates computed by the server
+  python view_mongo_data.py export --out exports/history --format jsonl
+  python view_mongo_data.py export --out exports/history --format parquet   # needs pyarrow
+
+Aggregates (top queries, decision distribution, per-user volume, latency
+trend) run as aggregation pipelines, so only the summary rows leave the
+server. Exports page through search_history with (created_at, _id) keyset
+queries of --batch-size rows into part files of --part-rows rows; a part is
+written to a temp file, renamed, and only then recorded in the checkpoint, so
+an interrupted export resumes after the last finished part.
 """
 import os
 import asyncio
+import argparse
+import gzip
+import json
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from bson import ObjectId
+from pymongo import ReadPreference
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from history_replay import top_queries_pipeline
 
 load_dotenv()
 
-async def view_mongo_data():
+EXPORT_FIELDS = [
+    "user_id", "user_email", "query", "decision", "amount", "justification",
+    "created_at", "latency_ms", "policy_id", "tenant",
+]
+EXPORT_INDEX_KEYS = [("created_at", 1), ("_id", 1)]
+
+
+def connect(pool_size: int = 1) -> AsyncIOMotorClient:
     mongo_uri = os.getenv("MONGO_URI")
     if not mongo_uri:
-        print("❌ MONGO_URI not found in .env file")
-        return
-    
-    try:
-        # Connect to MongoDB with optimized settings
-        client = AsyncIOMotorClient(
-            mongo_uri,
-            maxPoolSize=1,  # Reduce connection pool for single use
-            serverSelectionTimeoutMS=5000,  # Faster timeout
-            connectTimeoutMS=5000
+        raise SystemExit("❌ MONGO_URI not found in .env file")
+    return AsyncIOMotorClient(
+        mongo_uri,
+        maxPoolSize=pool_size,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Aggregation pipelines
+# ---------------------------------------------------------------------------
+
+def decision_pipeline(since: datetime) -> List[Dict[str, Any]]:
+    """Answers per decision value, most common first."""
+    return [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {"_id": {"$ifNull": ["$decision", "unknown"]}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+    ]
+
+
+def user_volume_pipeline(since: datetime, limit: int) -> List[Dict[str, Any]]:
+    """Most active users: query count, distinct queries and last activity."""
+    return [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": "$user_id",
+            "count": {"$sum": 1},
+            "queries": {"$addToSet": {"$toLower": {"$trim": {"input": "$query"}}}},
+            "last_seen": {"$max": "$created_at"},
+        }},
+        {"$project": {"count": 1, "distinct_queries": {"$size": "$queries"}, "last_seen": 1}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+
+
+def latency_trend_pipeline(since: datetime, unit: str) -> List[Dict[str, Any]]:
+    """Request count and latency per `unit` (hour/day) bucket; needs MongoDB 5.0+ for $dateTrunc.
+
+    Rows written before history recorded latency_ms only count towards `requests`."""
+    return [
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$created_at", "unit": unit}},
+            "requests": {"$sum": 1},
+            "timed": {"$sum": {"$cond": [{"$isNumber": "$latency_ms"}, 1, 0]}},
+            "avg_ms": {"$avg": "$latency_ms"},
+            "max_ms": {"$max": "$latency_ms"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+async def run_pipeline(collection, pipeline: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    cursor = collection.aggregate(pipeline, allowDiskUse=True, batchSize=500)
+    return [row async for row in cursor]
+
+
+def _fmt_time(value: Any) -> str:
+    return value.strftime("%Y-%m-%d %H:%M") if isinstance(value, datetime) else str(value)
+
+
+async def show_stats(db, days: float, limit: int, unit: str) -> None:
+    history = db.get_collection("search_history", read_preference=ReadPreference.SECONDARY_PREFERRED)
+    since = datetime.utcnow() - timedelta(days=days)
+    print(f"\n📈 SEARCH HISTORY ANALYTICS (last {days:g} days, since {_fmt_time(since)} UTC)")
+    print(f"📋 ~{await history.estimated_document_count():,} documents in total (estimated)")
+
+    top, decisions, users, trend = await asyncio.gather(
+        run_pipeline(history, top_queries_pipeline(since, limit)),
+        run_pipeline(history, decision_pipeline(since)),
+        run_pipeline(history, user_volume_pipeline(since, limit)),
+        run_pipeline(history, latency_trend_pipeline(since, unit)),
+    )
+
+    print(f"\n🔥 Top {limit} queries:")
+    print("-" * 50)
+    for row in top:
+        print(f"{row['count']:>7,}  {row['query'][:80]}  (last {_fmt_time(row['last_seen'])})")
+
+    total = sum(row["count"] for row in decisions) or 1
+    print("\n✅ Decisions:")
+    print("-" * 50)
+    for row in decisions:
+        print(f"{str(row['_id']):<20} {row['count']:>9,}  {row['count'] / total:6.1%}")
+
+    print(f"\n👤 Top {limit} users:")
+    print("-" * 50)
+    for row in users:
+        print(f"{str(row['_id']):<28} {row['count']:>7,} queries  {row['distinct_queries']:>6,} distinct  "
+              f"last {_fmt_time(row['last_seen'])}")
+
+    print(f"\n⏱️ Latency per {unit}:")
+    print("-" * 50)
+    for row in trend:
+        latency = (f"avg {row['avg_ms']:8.1f}ms  max {row['max_ms']:8.1f}ms  ({row['timed']:,} timed)"
+                   if row["timed"] else "no latency recorded")
+        print(f"{_fmt_time(row['_id'])}  {row['requests']:>7,} requests  {latency}")
+
+
+# ---------------------------------------------------------------------------
+# Streaming export
+# ---------------------------------------------------------------------------
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def export_filter(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Rows after the (created_at, _id) checkpoint and before the export's fixed end."""
+    query: Dict[str, Any] = {"created_at": {"$lt": datetime.fromisoformat(state["until"])}}
+    if state.get("created_at"):
+        created_at = datetime.fromisoformat(state["created_at"])
+        query["$or"] = [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "_id": {"$gt": ObjectId(state["_id"])}},
+        ]
+    elif state.get("since"):
+        query["created_at"]["$gte"] = datetime.fromisoformat(state["since"])
+    return query
+
+
+def _json_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    row = {"_id": str(doc["_id"])}
+    for field in EXPORT_FIELDS:
+        value = doc.get(field)
+        row[field] = value.isoformat() if isinstance(value, datetime) else value
+    return row
+
+
+class JSONLPartWriter:
+    suffix = ".jsonl.gz"
+
+    def __init__(self, path: str):
+        self._file = gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+
+    def write(self, docs: List[Dict[str, Any]]) -> None:
+        for doc in docs:
+            self._file.write(json.dumps(_json_row(doc), default=str) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetPartWriter:
+    """One row group per batch, so memory stays at one batch regardless of part size."""
+    suffix = ".parquet"
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires 'pyarrow' to be installed (or use --format jsonl)") from e
+        self._pa = pa
+        fields = [pa.field("_id", pa.string())]
+        for name in EXPORT_FIELDS:
+            if name == "created_at":
+                fields.append(pa.field(name, pa.timestamp("ms")))
+            elif name == "latency_ms":
+                fields.append(pa.field(name, pa.float64()))
+            else:
+                fields.append(pa.field(name, pa.string()))
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, docs: List[Dict[str, Any]]) -> None:
+        columns: Dict[str, List[Any]] = {"_id": [str(doc["_id"]) for doc in docs]}
+        for name in EXPORT_FIELDS:
+            values = [doc.get(name) for doc in docs]
+            if name not in ("created_at", "latency_ms"):
+                values = [None if v is None else str(v) for v in values]  # amount is a number or free text
+            columns[name] = values
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+WRITERS = {"jsonl": JSONLPartWriter, "parquet": ParquetPartWriter}
+
+
+async def export_history(
+    db,
+    out_dir: str,
+    fmt: str = "jsonl",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 5000,
+    part_rows: int = 500_000,
+    pause: float = 0.0,
+) -> Dict[str, Any]:
+    """Stream search_history into numbered part files under out_dir, resuming from its checkpoint."""
+    writer_cls = WRITERS[fmt]
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint_path = os.path.join(out_dir, "checkpoint.json")
+    state = load_checkpoint(checkpoint_path)
+    if state is None:
+        state = {
+            "format": fmt,
+            "since": since.isoformat() if since else None,
+            "until": (until or datetime.utcnow()).isoformat(),  # fixed end: rows arriving later are not chased
+            "created_at": None,
+            "_id": None,
+            "parts": 0,
+            "rows": 0,
+        }
+        save_checkpoint(checkpoint_path, state)
+    elif state["format"] != fmt:
+        raise SystemExit(f"❌ {out_dir} holds a {state['format']} export; use another --out for {fmt}")
+    else:
+        print(f"⏩ Resuming after {state['rows']:,} rows ({state['parts']} parts), at created_at {state['created_at']}")
+
+    history = db.get_collection("search_history", read_preference=ReadPreference.SECONDARY_PREFERRED)
+    await history.create_index(EXPORT_INDEX_KEYS, name="created_at_id")
+    projection = {field: 1 for field in EXPORT_FIELDS}
+
+    while True:
+        part = state["parts"]
+        final = os.path.join(out_dir, f"part-{part:05d}{writer_cls.suffix}")
+        tmp = final + ".tmp"
+        writer = writer_cls(tmp)
+        cursor_state = dict(state)
+        written = 0
+        try:
+            while written < part_rows:
+                limit = min(batch_size, part_rows - written)
+                docs = await (
+                    history.find(export_filter(cursor_state), projection)
+                    .sort(EXPORT_INDEX_KEYS)
+                    .limit(limit)
+                    .to_list(length=limit)
+                )
+                if not docs:
+                    break
+                writer.write(docs)
+                written += len(docs)
+                cursor_state.update(created_at=docs[-1]["created_at"].isoformat(), _id=str(docs[-1]["_id"]))
+                if len(docs) < limit:
+                    break
+                if pause:
+                    await asyncio.sleep(pause)  # leave room for the API's own queries
+        finally:
+            writer.close()
+        if not written:
+            os.remove(tmp)
+            break
+        os.replace(tmp, final)
+        state.update(
+            created_at=cursor_state["created_at"], _id=cursor_state["_id"],
+            parts=part + 1, rows=state["rows"] + written,
         )
+        save_checkpoint(checkpoint_path, state)
+        print(f"💾 {final}: {written:,} rows ({state['rows']:,} total)")
+        if written < part_rows:
+            break
+
+    state["done"] = True
+    save_checkpoint(checkpoint_path, state)
+    print(f"✅ Export complete: {state['rows']:,} rows in {state['parts']} parts under {out_dir}")
+    return state
+
+
+# ---------------------------------------------------------------------------
+# Overview
+# ---------------------------------------------------------------------------
+
+async def view_mongo_data(db):
+    # List collections efficiently
+    collections = await db.list_collection_names()
+    print(f"📁 Collections: {collections}")
+
+    # View search_history data with optimized query
+    if "search_history" in collections:
+        print("\n📋 SEARCH HISTORY (Latest 10):")
+        print("-" * 50)
+
+        # Use projection to only fetch needed fields
+        projection = {
+            'user_id': 1,
+            'query': 1,
+            'decision': 1,
+            'amount': 1,
+            'created_at': 1
+        }
+
+        cursor = db.search_history.find(
+            {},
+            projection
+        ).sort("created_at", -1).limit(10)
+
+        async for doc in cursor:
+            user_id = doc.get('user_id', 'N/A')
+            query = doc.get('query', 'N/A')[:80] + "..." if len(doc.get('query', '')) > 80 else doc.get('query', 'N/A')
+            decision = doc.get('decision', 'N/A')
+            amount = doc.get('amount', 'N/A')
+            date = doc.get('created_at', 'N/A')
+
+            if isinstance(date, datetime):
+                date = date.strftime("%Y-%m-%d %H:%M")
+
+            print(f"👤 User: {user_id}")
+            print(f"❓ Query: {query}")
+            print(f"✅ Decision: {decision}")
+            print(f"💰 Amount: {amount}")
+            print(f"📅 Date: {date}")
+            print("-" * 30)
+
+    # View users data efficiently
+    if "users" in collections:
+        print("\n👥 USERS (First 5):")
+        print("-" * 50)
+
+        projection = {'_id': 1, 'email': 1}
+        cursor = db.users.find({}, projection).limit(5)
+
+        async for doc in cursor:
+            user_id = str(doc.get('_id', 'N/A'))
+            email = doc.get('email', 'N/A')
+            print(f"🆔 User ID: {user_id}")
+            print(f"📧 Email: {email}")
+            print("-" * 30)
+
+    print("\n📊 Database Statistics:")
+    print("-" * 50)
+
+    # Collection metadata counts: no scan, approximate after unclean shutdowns
+    search_count = await db.search_history.estimated_document_count()
+    users_count = await db.users.estimated_document_count()
+
+    print(f"📋 Search History: ~{search_count:,} documents")
+    print(f"👥 Users: ~{users_count:,} documents")
+    print(f"📈 Total: ~{search_count + users_count:,} documents")
+
+    if search_count > 100:
+        print(f"\n💡 The API creates the (user_id, created_at) index on search_history at startup")
+        print(f"💡 Run `python view_mongo_data.py stats` for server-side aggregates")
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+async def main(args) -> None:
+    client = connect(pool_size=4 if args.command == "stats" else 1)
+    try:
         db = client.get_database("bajaj_app")
-        
         print("🔗 Connected to MongoDB successfully!")
         print(f"📊 Database: {db.name}")
-        
-        # List collections efficiently
-        collections = await db.list_collection_names()
-        print(f"📁 Collections: {collections}")
-        
-        # View search_history data with optimized query
-        if "search_history" in collections:
-            print("\n📋 SEARCH HISTORY (Latest 10):")
-            print("-" * 50)
-            
-            # Use projection to only fetch needed fields
-            projection = {
-                'user_id': 1, 
-                'query': 1, 
-                'decision': 1, 
-                'amount': 1, 
-                'created_at': 1
-            }
-            
-            cursor = db.search_history.find(
-                {}, 
-                projection
-            ).sort("created_at", -1).limit(10)
-            
-            async for doc in cursor:
-                user_id = doc.get('user_id', 'N/A')
-                query = doc.get('query', 'N/A')[:80] + "..." if len(doc.get('query', '')) > 80 else doc.get('query', 'N/A')
-                decision = doc.get('decision', 'N/A')
-                amount = doc.get('amount', 'N/A')
-                date = doc.get('created_at', 'N/A')
-                
-                if isinstance(date, datetime):
-                    date = date.strftime("%Y-%m-%d %H:%M")
-                
-                print(f"👤 User: {user_id}")
-                print(f"❓ Query: {query}")
-                print(f"✅ Decision: {decision}")
-                print(f"💰 Amount: {amount}")
-                print(f"📅 Date: {date}")
-                print("-" * 30)
-        
-        # View users data efficiently
-        if "users" in collections:
-            print("\n👥 USERS (First 5):")
-            print("-" * 50)
-            
-            projection = {'_id': 1, 'email': 1}
-            cursor = db.users.find({}, projection).limit(5)
-            
-            async for doc in cursor:
-                user_id = str(doc.get('_id', 'N/A'))
-                email = doc.get('email', 'N/A')
-                print(f"🆔 User ID: {user_id}")
-                print(f"📧 Email: {email}")
-                print("-" * 30)
-        
-        # Count documents efficiently
-        print("\n📊 Database Statistics:")
-        print("-" * 50)
-        
-        # Use count_documents with empty filter for better performance
-        search_count = await db.search_history.count_documents({})
-        users_count = await db.users.count_documents({})
-        
-        print(f"📋 Search History: {search_count:,} documents")
-        print(f"👥 Users: {users_count:,} documents")
-        print(f"📈 Total: {search_count + users_count:,} documents")
-        
-        # Performance tips
-        if search_count > 100:
-            print(f"\n💡 Performance Tip: Consider adding indexes on 'created_at' and 'user_id' fields")
-        
+        if args.command == "stats":
+            await show_stats(db, args.days, args.limit, args.bucket)
+        elif args.command == "export":
+            await export_history(
+                db, args.out, fmt=args.format, since=args.since, until=args.until,
+                batch_size=args.batch_size, part_rows=args.part_rows, pause=args.pause,
+            )
+        else:
+            await view_mongo_data(db)
     except Exception as e:
         print(f"❌ Error: {e}")
         print(f"💡 Make sure MongoDB is running and accessible")
@@ -107,6 +417,26 @@ async def view_mongo_data():
         client.close()
         print(f"\n🔌 Connection closed")
 
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="View, analyse and export the bajaj_app MongoDB data")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("show", help="Latest history rows and collection sizes (default)")
+    stats = sub.add_parser("stats", help="Server-side aggregates over search_history")
+    stats.add_argument("--days", type=float, default=7.0)
+    stats.add_argument("--limit", type=int, default=10, help="Rows for the top-queries and top-users tables")
+    stats.add_argument("--bucket", choices=["hour", "day"], default="day")
+    export = sub.add_parser("export", help="Stream search_history to compressed part files")
+    export.add_argument("--out", required=True, help="Directory for part files and checkpoint.json")
+    export.add_argument("--format", choices=list(WRITERS), default="jsonl")
+    export.add_argument("--since", type=_parse_time, help="ISO time (UTC), inclusive; first run only")
+    export.add_argument("--until", type=_parse_time, help="ISO time (UTC), exclusive; default: now; first run only")
+    export.add_argument("--batch-size", type=int, default=5000, help="Rows per Mongo query")
+    export.add_argument("--part-rows", type=int, default=500_000, help="Rows per part file")
+    export.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     print("🚀 Starting MongoDB Data Viewer...")
-    asyncio.run(view_mongo_data())
+    asyncio.run(main(parse_args()))